@@ -0,0 +1,294 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+import wycenniczek
+from wycenniczek import COLUMNS, DEFAULT_CATEGORIES, UNITS, CostEstimateManager
+
+ITEM_NAMES = [
+    "Kamera IP 4MP", "Rejestrator NVR 8-kanałowy", "Kabel UTP kat. 6", "Gniazdo RJ45",
+    "Przełącznik PoE 16-portowy", "Szafa rack 19\"", "Tynk gipsowy", "Farba lateksowa biała",
+    "Płytki ceramiczne 30x60", "Wylewka samopoziomująca", "Styropian grafitowy 10 cm",
+    "Wełna mineralna", "Beton B20", "Stal zbrojeniowa fi 12", "Okno PCV dwuskrzydłowe",
+    "Drzwi wewnętrzne", "Listwa przypodłogowa", "Montaż gniazd elektrycznych",
+    "Układanie płytek", "Malowanie ścian", "Demontaż ścianek działowych", "Wywóz gruzu",
+    "Transport materiałów", "Rusztowanie - wynajem", "Kontener na odpady",
+]
+CATEGORIES = DEFAULT_CATEGORIES + ["Sprzęt", "Instalacje elektryczne", "Wykończenie"]
+DESCRIPTIONS = ["", "", "", "Zgodnie z projektem", "Wycena wg obmiaru", "Cena z montażem",
+                "Materiał inwestora", "Etap II"]
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+
+
+def generate_estimate(rows, seed=0):
+    """Generuje syntetyczny kosztorys o zadanej liczbie wierszy (polskie nazwy, jednostki z listy UNITS)."""
+    rng = np.random.default_rng(seed)
+    names = np.array(ITEM_NAMES, dtype=object)[rng.integers(0, len(ITEM_NAMES), rows)]
+    variants = rng.integers(1, 200, rows).astype(str)
+    quantities = np.round(rng.gamma(2.0, 20.0, rows), 2)
+    prices = np.round(rng.lognormal(4.0, 1.2, rows), 2)
+    df = pd.DataFrame({
+        "Pozycja": names + " - wariant " + variants.astype(object),
+        "Ilość": quantities,
+        "Jednostka": np.array(UNITS, dtype=object)[rng.integers(0, len(UNITS), rows)],
+        "Cena jednostkowa (PLN)": prices,
+        "Koszt całkowity (PLN)": np.round(quantities * prices, 2),
+        "Kategoria": np.array(CATEGORIES, dtype=object)[rng.integers(0, len(CATEGORIES), rows)],
+        "Opis": np.array(DESCRIPTIONS, dtype=object)[rng.integers(0, len(DESCRIPTIONS), rows)],
+    })
+    return df[COLUMNS]
+
+
+class ScriptedManager(CostEstimateManager):
+    """Menedżer kosztorysu, który zamiast terminala odczytuje odpowiedzi z kolejki."""
+
+    def __init__(self, workdir):
+        """Tworzy menedżera w pustym katalogu `workdir` z pustym kosztorysem."""
+        self.answers = deque()
+        os.chdir(workdir)
+        super().__init__()
+        self.position_index = None
+
+    def feed(self, *answers):
+        """Dodaje odpowiedzi dla kolejnych pytań programu."""
+        self.answers.extend(answers)
+
+    def _get_user_input(self, prompt_message, default="", is_filename=False, completer=None):
+        """Zwraca kolejną zaplanowaną odpowiedź (pusta odpowiedź oznacza wartość domyślną)."""
+        if not self.answers:
+            raise RuntimeError(f"Brak zaplanowanej odpowiedzi na pytanie: {prompt_message!r}")
+        answer = self.answers.popleft()
+        return answer if answer else str(default)
+
+    def _get_confirmation(self, prompt_message):
+        """Zwraca kolejną zaplanowaną odpowiedź na pytanie t/n."""
+        if not self.answers:
+            raise RuntimeError(f"Brak zaplanowanej odpowiedzi na pytanie: {prompt_message!r}")
+        return self.answers.popleft()
+
+
+def measure(name, func, memory=False):
+    """Mierzy czas (i opcjonalnie szczytowe zużycie pamięci) wykonania `func`, wyciszając jej wyjście."""
+    if memory:
+        tracemalloc.start()
+    with open(os.devnull, "w", encoding="utf-8") as devnull, redirect_stdout(devnull):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+    if memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    result = {"operation": name, "seconds": round(elapsed, 6)}
+    if memory:
+        result["peak_mb"] = round(peak / 1024 / 1024, 3)
+    return result
+
+
+def benchmark_size(rows, workdir, memory=False, seed=0):
+    """Uruchamia wszystkie operacje kosztorysu na syntetycznym kosztorysie o `rows` wierszach."""
+    workdir = os.path.join(workdir, str(rows))
+    os.makedirs(workdir, exist_ok=True)
+    manager = ScriptedManager(workdir)
+    df = generate_estimate(rows, seed)
+    filename = f"benchmark_{rows}.xlsx"
+    results = []
+
+    def save():
+        manager.df = df.copy()
+        manager.filename = None
+        manager.feed(filename, "t")
+        manager.save_cost_estimate()
+
+    def load():
+        manager.filename = os.path.join(workdir, filename)
+        manager.df = manager.load_cost_estimate()
+
+    def add():
+        manager.feed("Kamera IP 8MP", "3", "1", "420.50", "1", "Dodana w teście")
+        manager.add_item()
+
+    def edit():
+        manager.feed("1", "Kabel UTP kat. 6A", "120", "", "4.20", "1", "Zmieniona w teście")
+        manager.edit_item()
+
+    def delete():
+        manager.feed("1", "t")
+        manager.delete_item()
+
+    def sort():
+        manager.feed("4")
+        manager.sort_cost_estimate()
+
+    def filter_category():
+        manager.feed("1", "1")
+        manager.filter_cost_estimate()
+
+    def filter_cost():
+        manager.feed("2", "100", "5000")
+        manager.filter_cost_estimate()
+
+    operations = [
+        ("save", save), ("load", load), ("display", manager.display_cost_estimate),
+        ("add_item", add), ("edit_item", edit), ("delete_item", delete), ("sort", sort),
+        ("filter_category", filter_category), ("filter_cost", filter_cost),
+    ]
+    for name, func in operations:
+        result = measure(name, func, memory=memory)
+        if manager.answers:
+            raise RuntimeError(f"Operacja {name} nie wykorzystała odpowiedzi: {list(manager.answers)}")
+        result["rows"] = rows
+        results.append(result)
+        print(f"  {rows:>9} wierszy  {name:<16} {result['seconds']:>10.3f} s"
+              + (f"  {result['peak_mb']:>9.1f} MB" if memory else ""))
+    return results
+
+
+async def _client(host, port, targets, count, latencies):
+    """Wysyła `count` żądań GET po jednym połączeniu (keep-alive) i zapisuje czasy odpowiedzi."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for i in range(count):
+            target = targets[i % len(targets)]
+            start = time.perf_counter()
+            writer.write(f"GET {target} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode("latin-1"))
+            await writer.drain()
+            status = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            if b" 200 " not in status:
+                raise RuntimeError(f"Serwer zwrócił {status.decode().strip()} dla {target}")
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def _server_load(workdir, rows, clients, requests_per_client, seed):
+    """Uruchamia serwer na kosztorysie z `rows` wierszami i mierzy przepustowość zapytań odczytu."""
+    name = f"server_{rows}.xlsx"
+    generate_estimate(rows, seed).to_excel(os.path.join(workdir, name), index=False)
+    server = wycenniczek.EstimateServer(workdir, port=0)
+    await server.start()
+    base = f"/estimates/{name}"
+    targets = [
+        f"{base}/items?limit=50",
+        f"{base}/items?kategoria=Materia%C5%82y&limit=50",
+        f"{base}/items?pozycja=kamera&sort=Koszt%20ca%C5%82kowity%20(PLN)&desc=1&limit=20",
+        f"{base}/items?min_koszt=100&max_koszt=5000&offset=1000&limit=100",
+        base,
+    ]
+    results = []
+    async with server.server:
+        start = time.perf_counter()
+        await _client(server.host, server.port, [base], 1, [])
+        results.append({"operation": "server_cold_load", "rows": rows,
+                        "seconds": round(time.perf_counter() - start, 6)})
+        print(f"  {rows:>9} wierszy  {'server_cold_load':<16} {results[-1]['seconds']:>10.3f} s")
+        for target in targets:
+            latencies = []
+            start = time.perf_counter()
+            await asyncio.gather(*(_client(server.host, server.port, [target], requests_per_client, latencies)
+                                   for _ in range(clients)))
+            elapsed = time.perf_counter() - start
+            operation = "server_" + (target.split("?", 1)[1].split("&")[0].split("=")[0] if "?" in target else "summary")
+            result = {
+                "operation": operation, "rows": rows, "seconds": round(elapsed, 6),
+                "requests": len(latencies), "clients": clients,
+                "requests_per_second": round(len(latencies) / elapsed, 1),
+                "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2),
+                "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 2),
+            }
+            results.append(result)
+            print(f"  {rows:>9} wierszy  {operation:<16} {result['requests_per_second']:>8.1f} req/s"
+                  f"  p50 {result['p50_ms']:.1f} ms  p95 {result['p95_ms']:.1f} ms")
+    return results
+
+
+def compare_results(previous, current):
+    """Wyświetla porównanie czasów bieżącego przebiegu z poprzednim wynikiem."""
+    old = {(r["rows"], r["operation"]): r["seconds"] for r in previous["results"]}
+    print(f"\n=== Porównanie z przebiegiem z {previous['started']} ===")
+    for result in current["results"]:
+        key = (result["rows"], result["operation"])
+        if key not in old or old[key] == 0:
+            continue
+        ratio = result["seconds"] / old[key]
+        print(f"  {key[0]:>9} wierszy  {key[1]:<16} {old[key]:>10.3f} s -> {result['seconds']:>10.3f} s  (x{ratio:.2f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wycennik - testy wydajności operacji na kosztorysie")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Liczby wierszy syntetycznych kosztorysów (domyślnie 1000 10000 100000)")
+    parser.add_argument("--memory", action="store_true",
+                        help="Mierzy szczytowe zużycie pamięci (tracemalloc; wydłuża pomiary czasu)")
+    parser.add_argument("--output", default="benchmark_results",
+                        help="Katalog, do którego zapisywane są wyniki w formacie JSON")
+    parser.add_argument("--compare", metavar="PLIK_JSON", default=None,
+                        help="Porównuje wyniki z wcześniejszym przebiegiem")
+    parser.add_argument("--seed", type=int, default=0, help="Ziarno generatora danych")
+    parser.add_argument("--server-load", type=int, metavar="WIERSZE", default=None,
+                        help="Test obciążenia serwera HTTP (--serve) zapytaniami odczytu na kosztorysie w pamięci")
+    parser.add_argument("--clients", type=int, default=8, help="Liczba równoległych klientów testu serwera")
+    parser.add_argument("--requests", type=int, default=50,
+                        help="Liczba żądań każdego klienta na jeden rodzaj zapytania")
+    args = parser.parse_args()
+
+    output_dir = os.path.abspath(args.output)
+    started = datetime.now()
+    run = {
+        "started": started.isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "openpyxl": openpyxl.__version__,
+        "platform": platform.platform(),
+        "memory": args.memory,
+        "results": [],
+    }
+    original_dir = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="wycenniczek_bench_")
+    print(f"=== Testy wydajności ({wycenniczek.__file__}) ===")
+    try:
+        if args.server_load:
+            run["results"].extend(asyncio.run(
+                _server_load(workdir, args.server_load, args.clients, args.requests, args.seed)))
+        else:
+            for rows in args.sizes:
+                run["results"].extend(benchmark_size(rows, workdir, memory=args.memory, seed=args.seed))
+    finally:
+        os.chdir(original_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(output_dir, exist_ok=True)
+    result_path = os.path.join(output_dir, f"benchmark_{started.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(run, f, ensure_ascii=False, indent=2)
+    print(f"\nWyniki zapisane do: {result_path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare_results(json.load(f), run)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,2406 @@
+import numpy as np
 import pandas as pd
 import os
+import getpass
 import glob
+import hashlib
+import io
 import argparse
+import bisect
+import asyncio
+import atexit
+import contextlib
+import cProfile
+import json
 import re
+import time
+import tracemalloc
 import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from openpyxl import load_workbook
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.utils import get_column_letter
-from openpyxl.styles import Alignment, Border, Side, Font, PatternFill
+from openpyxl.styles import Alignment, Border, Side, Font, NamedStyle, PatternFill
+from openpyxl.styles.fonts import DEFAULT_FONT
 from prompt_toolkit import PromptSession
+from prompt_toolkit.completion import Completer, Completion
 from prompt_toolkit.key_binding import KeyBindings
 
+# Kosztorysy z szablonów współdzielą dane z szablonem, co wymaga semantyki copy-on-write (domyślnej od pandas 3.0)
+if int(pd.__version__.split(".")[0]) < 3 and "copy_on_write" in dir(pd.options.mode):
+    pd.options.mode.copy_on_write = True
+
+COLUMNS = ["Pozycja", "Ilość", "Jednostka", "Cena jednostkowa (PLN)",
+           "Koszt całkowity (PLN)", "Kategoria", "Opis"]
+NUMERIC_COLUMNS = ["Ilość", "Cena jednostkowa (PLN)", "Koszt całkowity (PLN)"]
+UNITS = ["szt", "m²", "godz", "m³", "kg", "l", "m", "t", "kWh"]
+DEFAULT_CATEGORIES = ["Materiały", "Robocizna", "Meble", "Transport"]
+# Opcjonalne kolumny stawek (z wartościami domyślnymi) i kolumny obliczane z nich wyrażeniami
+RATE_COLUMNS = {"Stawka VAT (%)": 23.0, "Narzut (%)": 0.0, "Rabat (%)": 0.0}
+COMPUTED_COLUMNS = {
+    "Narzut (PLN)": "`Ilość` * `Cena jednostkowa (PLN)` * `Narzut (%)` / 100",
+    "Rabat (PLN)": "(`Ilość` * `Cena jednostkowa (PLN)` + `Narzut (PLN)`) * `Rabat (%)` / 100",
+    "Wartość netto (PLN)": "`Ilość` * `Cena jednostkowa (PLN)` + `Narzut (PLN)` - `Rabat (PLN)`",
+    "VAT (PLN)": "`Wartość netto (PLN)` * `Stawka VAT (%)` / 100",
+    "Wartość brutto (PLN)": "`Wartość netto (PLN)` + `VAT (PLN)`",
+}
+# Opcjonalne kolumny waluty: cena w walucie pozycji, przeliczana na PLN według lokalnej tabeli kursów
+BASE_CURRENCY = "PLN"
+CURRENCY_COLUMN = "Waluta"
+FOREIGN_PRICE_COLUMN = "Cena jednostkowa (waluta)"
+EXCHANGE_RATES_FILE = "kursy_walut.csv"
+
+
+class Profiler:
+    """Pomiar czasu faz operacji (wczytywanie, zapis, kopia zapasowa, sortowanie, filtrowanie, wyświetlanie).
+
+    Włączany opcją --profile lub zmienną środowiskową WYCENNIK_PROFILE. Każdy pomiar
+    trafia jako wiersz JSON do pliku śladu, a na koniec sesji wypisywane jest podsumowanie.
+    Wyłączony profiler zwraca wspólny pusty kontekst, więc nie spowalnia programu.
+    """
+
+    CAPTURE_MODES = ("cprofile", "tracemalloc")
+
+    def __init__(self):
+        """Tworzy wyłączony profiler."""
+        self.enabled = False
+        self.trace_path = None
+        self.capture = None
+        self.totals = {}
+        self._trace = None
+        self._stack = []
+        self._capture_count = 0
+
+    def configure(self, trace_path, capture=None):
+        """Włącza pomiary, zapis śladu do `trace_path` i opcjonalne profilowanie (cprofile/tracemalloc)."""
+        if capture and capture not in self.CAPTURE_MODES:
+            raise ValueError(f"Nieznany tryb profilowania: {capture}. Dostępne: {', '.join(self.CAPTURE_MODES)}.")
+        self.trace_path = os.path.abspath(trace_path)
+        self.capture = capture
+        self._trace = open(self.trace_path, "a", encoding="utf-8")
+        self.enabled = True
+        atexit.register(self.finish)
+
+    def span(self, name, **attrs):
+        """Zwraca kontekst mierzący czas fazy `name`; dodatkowe atrybuty trafiają do śladu."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._measure(name, attrs)
+
+    @contextlib.contextmanager
+    def _measure(self, name, attrs):
+        parent = self._stack[-1] if self._stack else None
+        capture = self.capture if parent is None else None
+        self._stack.append(name)
+        profile = None
+        if capture == "cprofile":
+            profile = cProfile.Profile()
+            profile.enable()
+        elif capture == "tracemalloc":
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stack.pop()
+            record = {"ts": datetime.now().isoformat(timespec="milliseconds"), "span": name,
+                      "parent": parent, "ms": round(elapsed * 1000, 3)}
+            record.update(attrs)
+            if profile is not None:
+                profile.disable()
+                self._capture_count += 1
+                prof_path = f"{os.path.splitext(self.trace_path)[0]}_{self._capture_count:03d}_{name}.prof"
+                profile.dump_stats(prof_path)
+                record["cprofile"] = prof_path
+            elif capture == "tracemalloc":
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                record["peak_mb"] = round(peak / 1024 / 1024, 3)
+            self._write(record)
+            count, total, longest = self.totals.get(name, (0, 0.0, 0.0))
+            self.totals[name] = (count + 1, total + elapsed, max(longest, elapsed))
+
+    def _write(self, record):
+        self._trace.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self._trace.flush()
+
+    def finish(self):
+        """Zapisuje podsumowanie sesji do śladu, wypisuje je i zamyka plik śladu."""
+        if not self.enabled:
+            return
+        self.enabled = False
+        summary = {name: {"count": count, "total_ms": round(total * 1000, 3), "max_ms": round(longest * 1000, 3)}
+                   for name, (count, total, longest) in sorted(self.totals.items())}
+        self._write({"ts": datetime.now().isoformat(timespec="milliseconds"), "summary": summary})
+        self._trace.close()
+        print("\n=== Podsumowanie pomiarów ===")
+        print(f"  {'Faza':<28} {'Liczba':>7} {'Łącznie (ms)':>14} {'Maks. (ms)':>12}")
+        for name, stats in summary.items():
+            print(f"  {name:<28} {stats['count']:>7} {stats['total_ms']:>14.1f} {stats['max_ms']:>12.1f}")
+        print(f"  Ślad zapisany do: {self.trace_path}\n")
+
+
+_NULL_SPAN = contextlib.nullcontext()
+PROFILER = Profiler()
+
+
+def _normalize_cost_estimate(df, name):
+    """Sprawdza kolumny kosztorysu, usuwa wiersz RAZEM i zamienia kolumny liczbowe na liczby."""
+    if not all(col in df.columns for col in COLUMNS):
+        raise Exception(f"Plik {name} nie zawiera wszystkich oczekiwanych kolumn.")
+    df = df[df["Pozycja"] != "RAZEM"]
+    # Kolumny obliczane są zapisywane tylko do odczytu w Excelu; po wczytaniu liczy się je od nowa
+    df = df.drop(columns=[col for col in COMPUTED_COLUMNS if col in df.columns])
+    for col in NUMERIC_COLUMNS:
+        invalid = df[col].isna() | ~pd.to_numeric(df[col], errors='coerce').notna()
+        if invalid.any():
+            rows = _format_row_numbers(np.flatnonzero(invalid.to_numpy()))
+            print(f"Ostrzeżenie: Niepoprawne wartości w kolumnie '{col}' (pozycje {rows}) zostały zamienione na 0.")
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    for col, default in RATE_COLUMNS.items():
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(default)
+    if CURRENCY_COLUMN in df.columns and FOREIGN_PRICE_COLUMN in df.columns:
+        df[CURRENCY_COLUMN] = df[CURRENCY_COLUMN].astype(object).where(df[CURRENCY_COLUMN].notna(), BASE_CURRENCY)
+        df[CURRENCY_COLUMN] = df[CURRENCY_COLUMN].astype(str).str.strip().str.upper()
+        df[FOREIGN_PRICE_COLUMN] = pd.to_numeric(df[FOREIGN_PRICE_COLUMN], errors='coerce').fillna(
+            df["Cena jednostkowa (PLN)"])
+    return df
+
+
+def read_cost_estimate(path):
+    """Wczytuje kosztorys z pliku .xlsx bez wiersza RAZEM, z kolumnami liczbowymi zamienionymi na liczby."""
+    name = os.path.basename(path)
+    try:
+        with PROFILER.span("load.read_excel", file=name):
+            df = pd.read_excel(path)
+        with PROFILER.span("load.normalize", rows=len(df)):
+            return _normalize_cost_estimate(df, name)
+    except Exception as e:
+        raise Exception(f"Błąd podczas wczytywania pliku {name}: {e}")
+
+
+def with_summary_row(df):
+    """Zwraca kosztorys z dopisanym wierszem RAZEM, w postaci zapisywanej do pliku .xlsx.
+
+    Wiersz RAZEM sumuje koszt całkowity oraz kolumny obliczane, jeśli są w tabeli.
+    """
+    summary_row = pd.DataFrame({col: [""] for col in df.columns})
+    summary_row["Pozycja"] = ["RAZEM"]
+    for col in ["Koszt całkowity (PLN)"] + [col for col in COMPUTED_COLUMNS if col in df.columns]:
+        summary_row[col] = [df[col].sum()]
+    return pd.concat([df, summary_row], ignore_index=True)
+
+
+def evaluate_computed_columns(df):
+    """Liczy wektorowo kolumny z COMPUTED_COLUMNS dla wierszy `df` (brakujące stawki przyjmują wartości domyślne)."""
+    frame = pd.DataFrame({
+        col: pd.to_numeric(df[col], errors="coerce").fillna(0).astype(float)
+        for col in ("Ilość", "Cena jednostkowa (PLN)")
+    }, index=df.index)
+    for col, default in RATE_COLUMNS.items():
+        rates = df[col] if col in df.columns else pd.Series(default, index=df.index)
+        frame[col] = pd.to_numeric(rates, errors="coerce").fillna(default).astype(float)
+    for col, expression in COMPUTED_COLUMNS.items():
+        frame[col] = frame.eval(expression) if len(frame) else pd.Series(dtype=float)
+    return frame[list(COMPUTED_COLUMNS)]
+
+
+def computed_column_formulas(columns):
+    """Zamienia wyrażenia COMPUTED_COLUMNS na formuły Excela dla układu kolumn `columns` ({row} = numer wiersza)."""
+    letters = {col: get_column_letter(idx) for idx, col in enumerate(columns, 1)}
+    return {col: "=" + re.sub(r"`([^`]+)`", lambda m: f"{letters[m.group(1)]}{{row}}", expression)
+            for col, expression in COMPUTED_COLUMNS.items()}
+
+
+class ComputedColumns:
+    """Kolumny obliczane kosztorysu, liczone leniwie przy odczycie i tylko dla wierszy zmienionych od ostatniego.
+
+    Wiersze zgłoszone przez `mark_dirty` oraz nowe wiersze są przeliczane przy następnym `get`;
+    usunięte wiersze znikają przy dopasowaniu wyników do indeksu kosztorysu.
+    """
+
+    def __init__(self):
+        self.values = None
+        self._dirty = set()
+
+    def reset(self):
+        """Unieważnia wszystkie wyniki (po wczytaniu lub zastąpieniu całego kosztorysu)."""
+        self.values = None
+        self._dirty = set()
+
+    def mark_dirty(self, labels):
+        """Oznacza wiersze (etykiety indeksu) do ponownego przeliczenia."""
+        if self.values is not None:
+            self._dirty.update(labels)
+
+    def get(self, df):
+        """Zwraca kolumny obliczane dopasowane do indeksu `df`, przeliczając tylko nieaktualne wiersze."""
+        if self.values is None:
+            with PROFILER.span("computed", rows=len(df)):
+                self.values = evaluate_computed_columns(df)
+        else:
+            values = self.values if self.values.index.equals(df.index) else self.values.reindex(df.index)
+            stale = values.iloc[:, 0].isna().to_numpy()
+            if self._dirty:
+                stale = stale | df.index.isin(list(self._dirty))
+            if stale.any():
+                rows = df.index[stale]
+                with PROFILER.span("computed", rows=len(rows)):
+                    values.loc[rows] = evaluate_computed_columns(df.loc[rows]).to_numpy()
+            self.values = values
+        self._dirty = set()
+        return self.values
+
+
+def _worksheet_layout(df, numeric_columns=None):
+    """Zwraca (numery kolumn wyśrodkowanych, numery kolumn z formatem liczb) standardowego formatowania."""
+    if numeric_columns is None:
+        numeric_columns = (NUMERIC_COLUMNS + list(RATE_COLUMNS) + list(COMPUTED_COLUMNS)
+                           + [FOREIGN_PRICE_COLUMN, CURRENCY_COLUMN, "Jednostka"])
+    centered = [idx for idx, col in enumerate(df.columns, 1) if col in numeric_columns]
+    number_formatted = [idx for idx in centered if df.columns[idx - 1] not in ("Jednostka", CURRENCY_COLUMN)]
+    return centered, number_formatted
+
+
+def _worksheet_styles():
+    """Zwraca style standardowego formatowania: (czcionka i wypełnienie nagłówka, czcionka wiersza RAZEM,
+    obramowanie, wyrównanie do środka, wyrównanie do lewej, format liczb)."""
+    header_font = Font(bold=True)
+    header_fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
+    total_font = Font(bold=True)
+    border = Border(left=Side(style='thin'), right=Side(style='thin'), 
+                   top=Side(style='thin'), bottom=Side(style='thin'))
+    center_align = Alignment(horizontal='center', vertical='center')
+    left_align = Alignment(horizontal='left', vertical='center')
+    return header_font, header_fill, total_font, border, center_align, left_align, '#,##0.00'
+
+
+def style_worksheet(ws, df, total_row=True, numeric_columns=None):
+    """Nakłada standardowe formatowanie (nagłówki, obramowania, format liczb, szerokości kolumn) na arkusz."""
+    header_font, header_fill, total_font, border, center_align, left_align, number_format = _worksheet_styles()
+    centered, number_formatted = _worksheet_layout(df, numeric_columns)
+
+    for col_idx, column in enumerate(df.columns, 1):
+        cell = ws.cell(row=1, column=col_idx)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.border = border
+
+    # max_row/max_column są przeliczane przez openpyxl przy każdym odczycie
+    max_row, max_column = ws.max_row, ws.max_column
+    with PROFILER.span("style.cells", rows=max_row - 1):
+        for row_idx in range(2, max_row + 1):
+            for col_idx in range(1, max_column + 1):
+                cell = ws.cell(row=row_idx, column=col_idx)
+                cell.border = border
+                if col_idx in centered:
+                    cell.alignment = center_align
+                    if col_idx in number_formatted:
+                        cell.number_format = number_format
+                else:
+                    cell.alignment = left_align
+                if total_row and row_idx == max_row:
+                    cell.font = total_font
+
+    with PROFILER.span("style.column_widths", rows=len(df)):
+        for col_idx, column in enumerate(df.columns, 1):
+            max_length = max(len(str(column)), 10)
+            for value in df[column]:
+                try:
+                    max_length = max(max_length, len(str(value)))
+                except:
+                    pass
+            adjusted_width = max_length * 1.2
+            ws.column_dimensions[get_column_letter(col_idx)].width = max(adjusted_width, 10)
+
+
+def write_styled_excel(df, path, total_row=True, extra_sheets=None, formulas=None):
+    """Zapisuje DataFrame do pliku .xlsx i nakłada standardowe formatowanie.
+
+    `extra_sheets` to lista par (nazwa arkusza, DataFrame) zapisywanych za arkuszem kosztorysu,
+    np. raporty z `report_sheets`. `formulas` (np. z `computed_column_formulas`) zastępuje wartości
+    wskazanych kolumn formułami Excela, a w wierszu RAZEM – formułą SUM.
+    """
+    with PROFILER.span("save.to_excel", rows=len(df)):
+        if extra_sheets:
+            with pd.ExcelWriter(path, engine="openpyxl") as writer:
+                df.to_excel(writer, index=False)
+                for sheet_name, table in extra_sheets:
+                    table.to_excel(writer, sheet_name=sheet_name, index=False)
+        else:
+            df.to_excel(path, index=False)
+    with PROFILER.span("save.load_workbook"):
+        wb = load_workbook(path)
+    if formulas:
+        with PROFILER.span("save.formulas", rows=len(df)):
+            ws = wb.worksheets[0]
+            last_row = len(df) + 1
+            data_last_row = last_row - 1 if total_row else last_row
+            for col, template in formulas.items():
+                col_idx = list(df.columns).index(col) + 1
+                for row_idx in range(2, data_last_row + 1):
+                    ws.cell(row=row_idx, column=col_idx).value = template.replace("{row}", str(row_idx))
+                if total_row:
+                    letter = get_column_letter(col_idx)
+                    ws.cell(row=last_row, column=col_idx).value = f"=SUM({letter}2:{letter}{data_last_row})"
+    style_worksheet(wb.worksheets[0], df, total_row=total_row)
+    for sheet_name, table in extra_sheets or []:
+        style_worksheet(wb[sheet_name], table, total_row=False, numeric_columns=REPORT_NUMERIC_COLUMNS)
+    with PROFILER.span("save.workbook_save"):
+        wb.save(path)
+
+
+def write_styled_excel_stream(df, path, total_row=True):
+    """Zapisuje arkusz do pliku .xlsx jednym przebiegiem, z formatowaniem jak `style_worksheet`.
+
+    Komórki powstają od razu ze stylami (openpyxl w trybie write_only), więc plik nie jest
+    zapisywany, wczytywany ponownie i formatowany komórka po komórce jak w `write_styled_excel`.
+    Każda kombinacja formatowania jest stylem nazwanym skoroszytu przypisywanym komórkom po nazwie.
+    """
+    header_font, header_fill, total_font, border, center_align, left_align, number_format = _worksheet_styles()
+    centered, number_formatted = _worksheet_layout(df)
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    for col_idx, column in enumerate(df.columns, 1):
+        lengths = df[column].map(str).str.len()
+        max_length = max(len(str(column)), 10, int(lengths.max()) if len(lengths) else 0)
+        ws.column_dimensions[get_column_letter(col_idx)].width = max(max_length * 1.2, 10)
+
+    def named_style(name, **attrs):
+        style = NamedStyle(name=f"Wycennik - {name}", border=border, **attrs)
+        wb.add_named_style(style)
+        return style.name
+
+    cell_styles = {}
+
+    def column_style(col_idx, total):
+        key = (col_idx in centered, col_idx in number_formatted, total)
+        if key not in cell_styles:
+            attrs = {"alignment": center_align if key[0] else left_align}
+            if key[1]:
+                attrs["number_format"] = number_format
+            # Bez czcionki styl nazwany nie miałby kroju i rozmiaru; zwykłe komórki mają domyślną czcionkę skoroszytu
+            attrs["font"] = total_font if total else DEFAULT_FONT
+            name = ("liczba" if key[1] else "środek" if key[0] else "tekst") + (" RAZEM" if total else "")
+            cell_styles[key] = named_style(name, **attrs)
+        return cell_styles[key]
+
+    header_style = named_style("nagłówek", font=header_font, fill=header_fill)
+    row_styles = [column_style(col_idx, False) for col_idx in range(1, len(df.columns) + 1)]
+    total_styles = [column_style(col_idx, True) for col_idx in range(1, len(df.columns) + 1)]
+
+    def styled(value, style):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        return cell
+
+    ws.append([styled(str(column), header_style) for column in df.columns])
+    values = df.astype(object).where(df.notna(), None)
+    last = len(values) - 1
+    with PROFILER.span("save.stream_rows", rows=len(values)):
+        for row_idx, row in enumerate(values.itertuples(index=False, name=None)):
+            styles = total_styles if total_row and row_idx == last else row_styles
+            ws.append([styled(value, style) for value, style in zip(row, styles)])
+    with PROFILER.span("save.workbook_save"):
+        wb.save(path)
+
+
+REPORT_TOP_N = 10
+REPORT_NUMERIC_COLUMNS = NUMERIC_COLUMNS + ["Jednostka", "Udział (%)"]
+NO_CATEGORY = "(bez kategorii)"
+
+
+def compute_reports(df, top_n=REPORT_TOP_N):
+    """Liczy raporty kosztorysu: koszt i udział kategorii, ilości według jednostek oraz N najdroższych pozycji.
+
+    Kosztorys jest grupowany jeden raz po parach (Kategoria, Jednostka); zestawienia kategorii
+    i jednostek powstają z tej małej tabeli, bez ponownego przeglądania wszystkich wierszy.
+    """
+    cost = "Koszt całkowity (PLN)"
+    with PROFILER.span("reports", rows=len(df)):
+        keys = pd.DataFrame({
+            "Kategoria": df["Kategoria"].fillna("").astype(str).replace("", NO_CATEGORY),
+            "Jednostka": df["Jednostka"].fillna("").astype(str),
+            "Ilość": df["Ilość"].astype(float),
+            cost: df[cost].astype(float),
+        })
+        grouped = keys.groupby(["Kategoria", "Jednostka"], sort=False).agg(
+            **{"Liczba pozycji": (cost, "size"), "Ilość": ("Ilość", "sum"), cost: (cost, "sum")}
+        )
+        total = float(grouped[cost].sum())
+
+        def rollup(level, columns):
+            table = grouped.groupby(level=level, sort=False)[columns].sum()
+            table["Udział (%)"] = (table[cost] / total * 100).round(2) if total else 0.0
+            return table.sort_values(cost, ascending=False, kind="stable").reset_index()
+
+        top = df.nlargest(top_n, cost, keep="first")
+        top.insert(0, "Nr", df.index.get_indexer(top.index) + 1)
+        return {
+            "total": total,
+            "top_n": top_n,
+            "categories": rollup("Kategoria", ["Liczba pozycji", cost]),
+            "units": rollup("Jednostka", ["Liczba pozycji", "Ilość", cost]),
+            "top": top.reset_index(drop=True),
+        }
+
+
+def report_sheets(reports):
+    """Zwraca raporty z `compute_reports` jako listę arkuszy dla `write_styled_excel`."""
+    return [
+        ("Raport - kategorie", reports["categories"]),
+        ("Raport - jednostki", reports["units"]),
+        (f"Raport - top {reports['top_n']}", reports["top"]),
+    ]
+
+
+def parse_row_ranges(text, count):
+    """Zamienia zapis numerów pozycji (np. `10-500,612`, numeracja od 1) na posortowaną tablicę pozycji od 0."""
+    selected = np.zeros(count, dtype=bool)
+    parts = [part for part in text.replace(" ", "").split(",") if part]
+    if not parts:
+        raise ValueError("Nie podano numerów pozycji.")
+    for part in parts:
+        start, sep, end = part.partition("-")
+        try:
+            start = int(start)
+            end = int(end) if sep else start
+        except ValueError:
+            raise ValueError(f"Niepoprawny zakres: '{part}'. Użyj zapisu np. 10-500,612.")
+        if start < 1 or end > count or start > end:
+            raise ValueError(f"Zakres '{part}' wykracza poza numery pozycji 1-{count}.")
+        selected[start - 1:end] = True
+    return np.flatnonzero(selected)
+
+
+def _foreign_prices_for(df, labels, prices, factor=None):
+    """Zwraca ceny w walucie pozycji `labels` zgodne z nowymi cenami w PLN `prices` (None bez kolumn waluty).
+
+    Dla pozycji w PLN cena w walucie równa się cenie w PLN. Cenę pozycji w innej walucie można tylko
+    przeskalować (`factor`); ustawienie jej ceny w PLN zgłasza ValueError, bo kurs przeliczenia
+    wstecz nie jest znany.
+    """
+    if CURRENCY_COLUMN not in df.columns or FOREIGN_PRICE_COLUMN not in df.columns:
+        return None
+    prices = np.asarray(prices, dtype=float)
+    in_base = (df.loc[labels, CURRENCY_COLUMN] == BASE_CURRENCY).to_numpy(dtype=bool)
+    if in_base.all():
+        return prices
+    if factor is None:
+        raise ValueError("Cenę w PLN można ustawić tylko pozycjom w PLN. "
+                         "Cenę pozycji w innej walucie zmień w jej walucie.")
+    foreign = pd.to_numeric(df.loc[labels, FOREIGN_PRICE_COLUMN], errors="coerce").to_numpy(dtype=float)
+    return np.where(in_base, prices, (foreign * factor).round(2))
+
+
+def bulk_edit(df, labels, action, column, value, old_text=None):
+    """Zmienia wskazane wiersze (etykiety indeksu) jedną operacją wektorową i przelicza ich koszt całkowity.
+
+    `action`: "set" ustawia `column` na `value`, "scale" mnoży `column` przez `value` (ceny zaokrąglane
+    do groszy), "replace" zamienia w `column` tekst `old_text` na `value`. DataFrame jest zmieniany w miejscu;
+    przy wyniku spoza zakresu (0-1 000 000, dla stawek z RATE_COLUMNS 0-100) zgłaszany jest ValueError,
+    a dane pozostają bez zmian. Zmiana ceny w PLN aktualizuje też cenę w walucie pozycji (kolumny waluty).
+    """
+    foreign = None
+    if column in NUMERIC_COLUMNS or column in RATE_COLUMNS:
+        current = df.loc[labels, column].astype(float)
+        updated = current * value if action == "scale" else pd.Series(float(value), index=current.index)
+        if column == "Cena jednostkowa (PLN)":
+            updated = updated.round(2)
+        limit = 100 if column in RATE_COLUMNS else 1_000_000
+        if (updated > limit).any() or (updated < 0).any():
+            raise ValueError(f"Wynik dla kolumny '{column}' wykracza poza zakres 0 - {limit:,}.".replace(",", " "))
+        if column == "Cena jednostkowa (PLN)":
+            foreign = _foreign_prices_for(df, labels, updated, value if action == "scale" else None)
+        if not pd.api.types.is_float_dtype(df[column]):
+            df[column] = df[column].astype(float)
+    else:
+        if pd.api.types.is_numeric_dtype(df[column]):
+            # Pusta kolumna tekstowa wczytana z pliku ma typ liczbowy (same NaN)
+            df[column] = df[column].astype(object)
+        if action == "replace":
+            updated = df.loc[labels, column].fillna("").astype(str).str.replace(old_text, value, regex=False)
+        else:
+            updated = pd.Series(value, index=labels, dtype=object)
+    df.loc[labels, column] = updated.to_numpy()
+    if foreign is not None:
+        df.loc[labels, FOREIGN_PRICE_COLUMN] = foreign
+    df.loc[labels, "Koszt całkowity (PLN)"] = (
+        df.loc[labels, "Ilość"].astype(float) * df.loc[labels, "Cena jednostkowa (PLN)"].astype(float)
+    ).to_numpy()
+
+
+_FOLD_TABLE = str.maketrans({"ł": "l", "Ł": "L"})
+
+
+def fold_text(series):
+    """Zwraca (kody, teksty) – teksty bez wielkości liter, nadmiarowych spacji i znaków diakrytycznych.
+
+    `kody[i]` wskazuje tekst wiersza `i`; równe kody oznaczają teksty równe po normalizacji, a pusty tekst
+    ma kod -1. Normalizowane są tylko unikalne wartości, więc koszt zależy od liczby różnych tekstów.
+    """
+    codes, uniques = pd.factorize(series.astype(object).where(series.notna(), ""))
+    folded = (pd.Series(uniques, dtype=object).astype(str).str.translate(_FOLD_TABLE)
+              .str.normalize("NFKD").str.replace("[\u0300-\u036f]", "", regex=True)
+              .str.casefold().str.replace(r"\s+", " ", regex=True).str.strip())
+    folded_codes, texts = pd.factorize(folded.replace("", None))
+    return folded_codes[codes] if len(codes) else codes, texts
+
+
+def find_duplicates(df):
+    """Szuka grup powtórzonych pozycji (ta sama nazwa, jednostka, cena i stawki) jednym przebiegiem haszowania.
+
+    Nazwy i jednostki są porównywane po `fold_text`, ceny po zaokrągleniu do groszy. Zwraca tabelę wierszy
+    należących do grup (indeks = etykiety wierszy kosztorysu) z kolumnami Grupa (od 1, w kolejności
+    pierwszego wystąpienia), Nr, Rodzaj ("dokładne" lub "po normalizacji") i polami pozycji.
+    """
+    columns = ["Grupa", "Nr", "Rodzaj", "Pozycja", "Jednostka", "Cena jednostkowa (PLN)", "Ilość",
+               "Koszt całkowity (PLN)"]
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+    # Teksty są zastępowane kodami, więc haszowane są tylko kolumny liczbowe
+    names, _ = fold_text(df["Pozycja"])
+    units, _ = fold_text(df["Jednostka"])
+    price = pd.to_numeric(df["Cena jednostkowa (PLN)"], errors="coerce").round(2).to_numpy()
+    rates = {col: df[col].to_numpy() for col in RATE_COLUMNS if col in df.columns}
+    normalized = pd.DataFrame({"Pozycja": names, "Jednostka": units, "Cena": price, **rates})
+    key = pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+    duplicated = pd.Series(key).duplicated(keep=False).to_numpy() & (names >= 0)
+    if not duplicated.any():
+        return pd.DataFrame(columns=columns)
+
+    positions = np.flatnonzero(duplicated)
+    group, _ = pd.factorize(key[positions])
+    rows = df.iloc[positions]
+    exact = pd.DataFrame({"Pozycja": rows["Pozycja"].astype(object).to_numpy(),
+                          "Jednostka": rows["Jednostka"].astype(object).to_numpy()})
+    exact_key = pd.util.hash_pandas_object(exact, index=False).to_numpy()
+    variants = pd.Series(exact_key).groupby(group).transform("nunique").to_numpy()
+    table = pd.DataFrame({
+        "Grupa": group + 1,
+        "Nr": positions + 1,
+        "Rodzaj": np.where(variants == 1, "dokładne", "po normalizacji"),
+        "Pozycja": rows["Pozycja"].to_numpy(),
+        "Jednostka": rows["Jednostka"].to_numpy(),
+        "Cena jednostkowa (PLN)": rows["Cena jednostkowa (PLN)"].to_numpy(),
+        "Ilość": rows["Ilość"].to_numpy(),
+        "Koszt całkowity (PLN)": rows["Koszt całkowity (PLN)"].to_numpy(),
+    }, index=rows.index)
+    return table.sort_values(["Grupa", "Nr"], kind="stable")
+
+
+def merge_duplicates(df, duplicates, groups=None):
+    """Scala grupy z `find_duplicates` (wszystkie lub o numerach z `groups`) w pierwszą pozycję każdej grupy.
+
+    Ilości są sumowane, a koszt całkowity przeliczany; pozostałe pola pochodzą z pierwszej pozycji grupy.
+    Zwraca (nowy kosztorys, etykiety zmienionych wierszy, etykiety usuniętych wierszy).
+    """
+    if groups is not None:
+        duplicates = duplicates[duplicates["Grupa"].isin(groups)]
+    if duplicates.empty:
+        return df, duplicates.index, duplicates.index
+    group = duplicates["Grupa"].to_numpy()
+    first = ~pd.Series(group).duplicated().to_numpy()
+    kept = duplicates.index[first]
+    removed = duplicates.index[~first]
+    quantities = df.loc[duplicates.index, "Ilość"].astype(float).groupby(group).sum()
+    df = df.drop(index=removed)
+    if not pd.api.types.is_float_dtype(df["Ilość"]):
+        df["Ilość"] = df["Ilość"].astype(float)
+    df.loc[kept, "Ilość"] = quantities.loc[group[first]].to_numpy()
+    df.loc[kept, "Koszt całkowity (PLN)"] = (
+        df.loc[kept, "Ilość"].astype(float) * df.loc[kept, "Cena jednostkowa (PLN)"].astype(float)
+    ).to_numpy()
+    return df, kept, removed
+
+
+class ExchangeRates:
+    """Lokalna tabela kursów walut z pliku CSV (kolumny: Data, Waluta, Kurs (PLN)), wersjonowana datami.
+
+    Kurs to cena jednej jednostki waluty w PLN; w danym dniu obowiązuje ostatni kurs z datą nie późniejszą.
+    Plik jest wczytywany raz i zapamiętywany – ponownie dopiero po zmianie (st_mtime_ns).
+    """
+
+    COLUMNS = ["Data", "Waluta", "Kurs (PLN)"]
+
+    def __init__(self):
+        self._tables = {}
+
+    def table(self, path):
+        """Zwraca tabelę kursów z pliku `path` posortowaną po walucie i dacie (pustą, jeśli pliku nie ma)."""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return pd.DataFrame(columns=self.COLUMNS)
+        cached = self._tables.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with PROFILER.span("rates.load", file=os.path.basename(path)):
+            table = pd.read_csv(path, dtype={"Waluta": str}, encoding="utf-8")
+            if not all(col in table.columns for col in self.COLUMNS):
+                raise Exception(f"Plik {os.path.basename(path)} musi mieć kolumny: {', '.join(self.COLUMNS)}.")
+            table = pd.DataFrame({
+                "Data": pd.to_datetime(table["Data"], errors="coerce"),
+                "Waluta": table["Waluta"].str.strip().str.upper(),
+                "Kurs (PLN)": pd.to_numeric(table["Kurs (PLN)"], errors="coerce"),
+            }).dropna()
+            table = table[table["Kurs (PLN)"] > 0].sort_values(["Waluta", "Data"], ignore_index=True)
+        self._tables[path] = (mtime, table)
+        return table
+
+    def rates_on(self, path, date=None):
+        """Zwraca kursy obowiązujące w dniu `date` (domyślnie dziś): DataFrame z indeksem Waluta i kolumnami
+        Kurs (PLN) i Data. Waluta bazowa (PLN) ma zawsze kurs 1."""
+        table = self.table(path)
+        date = pd.Timestamp(date or datetime.now().date())
+        current = table[table["Data"] <= date].drop_duplicates("Waluta", keep="last").set_index("Waluta")
+        current = current[["Kurs (PLN)", "Data"]]
+        current.loc[BASE_CURRENCY] = [1.0, date]
+        return current
+
+
+EXCHANGE_RATES = ExchangeRates()
+
+
+def convert_to_base_currency(df, rates):
+    """Przelicza ceny z kolumny FOREIGN_PRICE_COLUMN na PLN według kursów `rates` (z `rates_on`).
+
+    Zwraca serię cen w PLN zaokrąglonych do groszy; wiersze w walutach bez kursu mają NaN.
+    """
+    factor = df[CURRENCY_COLUMN].map(rates["Kurs (PLN)"])
+    return (pd.to_numeric(df[FOREIGN_PRICE_COLUMN], errors="coerce") * factor).round(2)
+
+
+def currency_totals(df):
+    """Zwraca sumy kosztów według walut: w walucie pozycji i w PLN."""
+    cost = df["Ilość"].astype(float) * pd.to_numeric(df[FOREIGN_PRICE_COLUMN], errors="coerce")
+    totals = pd.DataFrame({
+        "Waluta": df[CURRENCY_COLUMN].to_numpy(),
+        "Koszt (waluta)": cost.to_numpy(),
+        "Koszt (PLN)": df["Koszt całkowity (PLN)"].astype(float).to_numpy(),
+    }).groupby("Waluta", sort=True).sum()
+    return totals.reset_index()
+
+
+TEMPLATES_DIR = "szablony"
+
+
+class TemplateLibrary:
+    """Biblioteka szablonów kosztorysów – plików .xlsx w folderze `szablony` w folderze roboczym.
+
+    Szablon jest wczytywany i normalizowany raz: wynik trafia do pamięci i do pliku podręcznego Parquet
+    w `szablony/.cache` (jeśli dostępny jest pyarrow), więc kolejne użycia, także w nowych sesjach,
+    nie czytają pliku .xlsx. Nowy kosztorys jest płytką kopią szablonu – dane są współdzielone,
+    a pandas kopiuje je dopiero przy pierwszej zmianie (copy-on-write).
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        self._frames = {}
+
+    def names(self):
+        """Zwraca posortowane nazwy szablonów (nazwy plików bez rozszerzenia)."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(os.path.splitext(os.path.basename(path))[0]
+                      for path in DIRECTORY_CACHE.files(self.directory, (".xlsx",)))
+
+    def path(self, name):
+        """Zwraca ścieżkę pliku szablonu `name`."""
+        return os.path.join(self.directory, name + ".xlsx")
+
+    def _cache_path(self, name, mtime):
+        return os.path.join(self.directory, ".cache", f"{name}.{mtime}.parquet")
+
+    def frame(self, name):
+        """Zwraca znormalizowany kosztorys szablonu `name`. Wynik jest współdzielony – nie wolno go zmieniać."""
+        mtime = os.stat(self.path(name)).st_mtime_ns
+        cached = self._frames.get(name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        cache_path = self._cache_path(name, mtime)
+        try:
+            with PROFILER.span("template.read_cache", template=name):
+                df = pd.read_parquet(cache_path)
+        except Exception:
+            df = read_cost_estimate(self.path(name)).reset_index(drop=True)
+            self._write_cache(name, cache_path, df)
+        self._frames[name] = (mtime, df)
+        return df
+
+    def _write_cache(self, name, cache_path, df):
+        """Zapisuje plik podręczny szablonu i usuwa jego starsze wersje (błędy zapisu są pomijane)."""
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            for stale in glob.glob(os.path.join(os.path.dirname(cache_path), f"{glob.escape(name)}.*.parquet")):
+                os.remove(stale)
+            df.to_parquet(cache_path, index=False)
+        except Exception:
+            pass
+
+    def instantiate(self, name):
+        """Tworzy nowy kosztorys z szablonu bez kopiowania danych (kopia powstaje przy zmianie)."""
+        with PROFILER.span("template.instantiate", template=name):
+            return self.frame(name).copy(deep=False)
+
+    def save(self, name, df):
+        """Zapisuje kosztorys jako szablon `name` (nadpisując istniejący)."""
+        os.makedirs(self.directory, exist_ok=True)
+        write_styled_excel(with_summary_row(df), self.path(name))
+        self._frames.pop(name, None)
+
+
+HISTORY_FILE = ".wycennik_historia.jsonl"
+BACKUP_NAME_PATTERN = re.compile(r"^backup_(\d{8}_\d{6})_(.+\.xlsx)$")
+
+
+def history_record(df, file, ts, backup=None):
+    """Zwraca wpis historii: czas, plik, kopia zapasowa, liczba pozycji, łączny koszt i koszty kategorii."""
+    cost = pd.to_numeric(df["Koszt całkowity (PLN)"], errors="coerce").fillna(0).astype(float)
+    categories = cost.groupby(df["Kategoria"].astype(object).where(df["Kategoria"].notna(), NO_CATEGORY)).sum()
+    return {
+        "ts": ts.isoformat(timespec="seconds"), "file": file, "backup": backup, "rows": len(df),
+        "total": round(float(cost.sum()), 2),
+        "categories": {str(name): round(float(value), 2) for name, value in categories.items()},
+    }
+
+
+def updated_history_record(previous, removed, added, file, ts):
+    """Zwraca wpis historii wyliczony z poprzedniego wpisu `previous` bez wierszy `removed` i z wierszami `added`.
+
+    Pozwala dopisać historię zapisu zmian bez liczenia sum całego kosztorysu. Kategorie, które
+    po zmianie mają zerowy koszt i występowały tylko w usuniętych wierszach, są pomijane.
+    """
+    before = history_record(removed, file, ts)
+    after = history_record(added, file, ts)
+    categories = dict(previous["categories"])
+    for name, value in after["categories"].items():
+        categories[name] = categories.get(name, 0.0) + value
+    for name, value in before["categories"].items():
+        categories[name] = categories.get(name, 0.0) - value
+        if abs(categories[name]) < 0.005 and name not in after["categories"]:
+            del categories[name]
+    return {
+        "ts": after["ts"], "file": file, "backup": None, "rows": previous["rows"] - before["rows"] + after["rows"],
+        "total": round(previous["total"] - before["total"] + after["total"], 2),
+        "categories": {name: round(value, 2) for name, value in categories.items()},
+    }
+
+
+def _history_from_backup(args):
+    """Wczytuje kopię zapasową i zwraca jej wpis historii (lub None, jeśli pliku nie da się wczytać)."""
+    root_dir, path = args
+    match = BACKUP_NAME_PATTERN.match(os.path.basename(path))
+    try:
+        df = read_cost_estimate(path)
+    except Exception:
+        return None
+    file = os.path.relpath(os.path.join(os.path.dirname(path), match.group(2)), root_dir)
+    ts = datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")
+    return history_record(df, file, ts, backup=os.path.relpath(path, root_dir))
+
+
+class EstimateHistory:
+    """Historia łącznych kosztów kosztorysów w folderze roboczym (plik JSON Lines, tylko dopisywany).
+
+    Wpis powstaje przy każdym zapisie; starsze zapisy można odtworzyć z kopii zapasowych (`backfill`).
+    Widok historii czyta wyłącznie ten plik, bez otwierania skoroszytów.
+    """
+
+    def __init__(self, root_dir):
+        self.root_dir = os.path.abspath(root_dir)
+        self.path = os.path.join(self.root_dir, HISTORY_FILE)
+
+    def relpath(self, path):
+        """Zwraca ścieżkę pliku względem folderu roboczego (klucz kosztorysu w historii)."""
+        return os.path.relpath(os.path.abspath(path), self.root_dir)
+
+    def append(self, records):
+        """Dopisuje wpisy na końcu pliku historii (błędy zapisu są zgłaszane, ale nie przerywają pracy)."""
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        except OSError as e:
+            print(f"Nie udało się zapisać historii kosztorysu: {e}")
+
+    def record_save(self, df, path, backup_path=None):
+        """Dopisuje wpis dla właśnie zapisanego kosztorysu `path` (i jego kopii zapasowej)."""
+        backup = self.relpath(backup_path) if backup_path and os.path.exists(backup_path) else None
+        self.append([history_record(df, self.relpath(path), datetime.now(), backup)])
+
+    def read(self, file=None):
+        """Zwraca wpisy historii (wszystkie lub dla pliku `file`) posortowane po czasie."""
+        records = []
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if file is None or record.get("file") == file:
+                        records.append(record)
+        except OSError:
+            pass
+        records.sort(key=lambda record: record.get("ts", ""))
+        return records
+
+    def backfill(self, workers=None):
+        """Dopisuje wpisy dla kopii zapasowych, których nie ma jeszcze w historii (czytanych równolegle).
+
+        Zwraca (liczba dopisanych wpisów, liczba plików, których nie dało się wczytać).
+        """
+        known = {record.get("backup") for record in self.read()}
+        backups = []
+        for dirpath, dirnames, filenames in os.walk(self.root_dir):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for filename in filenames:
+                if BACKUP_NAME_PATTERN.match(filename):
+                    path = os.path.join(dirpath, filename)
+                    if self.relpath(path) not in known:
+                        backups.append((self.root_dir, path))
+        if not backups:
+            return 0, 0
+        if len(backups) < 2 or workers == 1:
+            results = [_history_from_backup(item) for item in backups]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_disable_profiler) as executor:
+                results = list(executor.map(_history_from_backup, backups, chunksize=4))
+        records = [record for record in results if record is not None]
+        self.append(records)
+        return len(records), len(results) - len(records)
+
+
+EXPORT_FORMATS = {".csv": "CSV", ".jsonl": "JSON Lines", ".parquet": "Parquet"}
+EXPORT_CHUNK_SIZE = 50_000
+
+
+def _export_format(path):
+    """Zwraca rozszerzenie formatu wymiany danych dla ścieżki lub zgłasza błąd dla nieobsługiwanego."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in EXPORT_FORMATS:
+        raise Exception(f"Nieobsługiwany format pliku '{ext}'. Dostępne: {', '.join(EXPORT_FORMATS)}.")
+    return ext
+
+
+def _import_pyarrow():
+    """Importuje pyarrow (opcjonalna zależność formatu Parquet)."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise Exception("Format Parquet wymaga biblioteki pyarrow (pip install pyarrow).")
+    return pyarrow
+
+
+def export_cost_estimate(df, path, chunksize=EXPORT_CHUNK_SIZE):
+    """Eksportuje kosztorys do pliku CSV, JSON Lines lub Parquet, zapisując go porcjami po `chunksize` wierszy.
+
+    Porcje są wycinkami tabeli kosztorysu, więc nie powstaje pośrednia kopia całych danych.
+    """
+    ext = _export_format(path)
+    if ext == ".csv":
+        df.to_csv(path, index=False, chunksize=chunksize, encoding="utf-8")
+    elif ext == ".jsonl":
+        with open(path, "w", encoding="utf-8") as f:
+            for start in range(0, len(df), chunksize):
+                chunk = df.iloc[start:start + chunksize]
+                lines = chunk.to_json(orient="records", lines=True, force_ascii=False)
+                f.write(lines if lines.endswith("\n") else lines + "\n")
+    else:
+        pa = _import_pyarrow()
+        numeric = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col])]
+        schema = pa.schema([(str(col), pa.float64() if col in numeric else pa.string()) for col in df.columns])
+        with pa.parquet.ParquetWriter(path, schema) as writer:
+            for start in range(0, max(len(df), 1), chunksize):
+                chunk = df.iloc[start:start + chunksize]
+                arrays = []
+                for col in df.columns:
+                    values = chunk[col]
+                    if col in numeric:
+                        arrays.append(pa.array(values.astype(float), type=pa.float64(), from_pandas=True))
+                        continue
+                    try:
+                        arrays.append(pa.array(values, type=pa.string(), from_pandas=True))
+                    except (pa.ArrowInvalid, pa.ArrowTypeError):
+                        text = values.map(str).where(values.notna(), None)
+                        arrays.append(pa.array(text, type=pa.string(), from_pandas=True))
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+
+def import_cost_estimate(path, chunksize=EXPORT_CHUNK_SIZE):
+    """Wczytuje kosztorys z pliku CSV, JSON Lines lub Parquet porcjami i normalizuje go jak plik .xlsx."""
+    name = os.path.basename(path)
+    try:
+        ext = _export_format(path)
+        text_columns = {col: str for col in COLUMNS if col not in NUMERIC_COLUMNS}
+        if ext == ".csv":
+            chunks = list(pd.read_csv(path, dtype=text_columns, chunksize=chunksize, encoding="utf-8"))
+        elif ext == ".jsonl":
+            with pd.read_json(path, lines=True, dtype=False, convert_dates=False, chunksize=chunksize,
+                              encoding="utf-8") as reader:
+                chunks = list(reader)
+        else:
+            pa = _import_pyarrow()
+            parquet_file = pa.parquet.ParquetFile(path)
+            chunks = [batch.to_pandas() for batch in parquet_file.iter_batches(batch_size=chunksize)]
+        df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=COLUMNS)
+        return _normalize_cost_estimate(df, name)
+    except Exception as e:
+        raise Exception(f"Błąd podczas wczytywania pliku {name}: {e}")
+
+
+def _normalized_for_diff(df):
+    """Zwraca kolumny COLUMNS kosztorysu z ujednoliconymi typami (liczby jako float, teksty bez braków)."""
+    keyed = df.reindex(columns=COLUMNS).reset_index(drop=True)
+    for col in COLUMNS:
+        if col in NUMERIC_COLUMNS:
+            keyed[col] = pd.to_numeric(keyed[col], errors='coerce').fillna(0).astype(float)
+        else:
+            keyed[col] = keyed[col].fillna("").astype(str)
+    return keyed
+
+
+def _keyed_for_diff(df):
+    """Przygotowuje kosztorys do porównania: normalizuje typy, numeruje wiersze i liczy hash każdego wiersza."""
+    keyed = _normalized_for_diff(df)
+    keyed["Nr"] = range(1, len(keyed) + 1)
+    keyed["_hash"] = pd.util.hash_pandas_object(keyed[COLUMNS], index=False).to_numpy()
+    keyed["_hash_nr"] = keyed.groupby("_hash", sort=False).cumcount()
+    return keyed
+
+
+def diff_cost_estimates(old_df, new_df):
+    """Porównuje dwa kosztorysy złączeniem haszującym po pozycjach.
+
+    Najpierw parowane są wiersze o identycznym hashu (bez zmian, także po
+    przesunięciu lub posortowaniu). Pozostałe wiersze łączone są po nazwie
+    pozycji i numerze jej wystąpienia, a pole po polu porównywane są tylko one.
+    Zwraca słownik z tabelami dodanych, usuniętych i zmienionych pozycji oraz różnicą łącznego kosztu.
+    """
+    old = _keyed_for_diff(old_df)
+    new = _keyed_for_diff(new_df)
+    same = old[["_hash", "_hash_nr"]].merge(new[["_hash", "_hash_nr"]], on=["_hash", "_hash_nr"], how="inner")
+    unchanged_count = len(same)
+    same_key = pd.MultiIndex.from_frame(same)
+    old = old[~pd.MultiIndex.from_frame(old[["_hash", "_hash_nr"]]).isin(same_key)].copy()
+    new = new[~pd.MultiIndex.from_frame(new[["_hash", "_hash_nr"]]).isin(same_key)].copy()
+
+    key = ["Pozycja", "_wystapienie"]
+    old["_wystapienie"] = old.groupby("Pozycja", sort=False).cumcount()
+    new["_wystapienie"] = new.groupby("Pozycja", sort=False).cumcount()
+    merged = old.merge(new, on=key, how="outer", suffixes=(" (stary)", " (nowy)"), indicator=True)
+    for nr_col in ("Nr (stary)", "Nr (nowy)"):
+        merged[nr_col] = merged[nr_col].astype("Int64")
+
+    other_columns = [col for col in COLUMNS if col != "Pozycja"]
+    added = merged[merged["_merge"] == "right_only"]
+    added = added[["Nr (nowy)", "Pozycja"] + [f"{col} (nowy)" for col in other_columns]]
+    added.columns = ["Nr"] + COLUMNS
+    removed = merged[merged["_merge"] == "left_only"]
+    removed = removed[["Nr (stary)", "Pozycja"] + [f"{col} (stary)" for col in other_columns]]
+    removed.columns = ["Nr"] + COLUMNS
+
+    changed_rows = merged[merged["_merge"] == "both"]
+    changes = []
+    for col in other_columns:
+        old_values = changed_rows[f"{col} (stary)"]
+        new_values = changed_rows[f"{col} (nowy)"]
+        mask = old_values != new_values
+        if not mask.any():
+            continue
+        part = changed_rows.loc[mask, ["Nr (stary)", "Nr (nowy)", "Pozycja"]].copy()
+        part["Pole"] = col
+        part["Stara wartość"] = old_values[mask].to_numpy()
+        part["Nowa wartość"] = new_values[mask].to_numpy()
+        if col in NUMERIC_COLUMNS:
+            part["Różnica"] = (new_values[mask] - old_values[mask]).to_numpy()
+        else:
+            part["Różnica"] = None
+        changes.append(part)
+    if changes:
+        changed = pd.concat(changes, ignore_index=True).sort_values(["Nr (nowy)"], kind="stable")
+    else:
+        changed = pd.DataFrame(columns=["Nr (stary)", "Nr (nowy)", "Pozycja", "Pole",
+                                        "Stara wartość", "Nowa wartość", "Różnica"])
+
+    total_old = old_df["Koszt całkowity (PLN)"].sum() if not old_df.empty else 0.0
+    total_new = new_df["Koszt całkowity (PLN)"].sum() if not new_df.empty else 0.0
+    return {
+        "added": added.sort_values("Nr").reset_index(drop=True),
+        "removed": removed.sort_values("Nr").reset_index(drop=True),
+        "changed": changed.reset_index(drop=True),
+        "changed_count": len(changed_rows),
+        "unchanged_count": unchanged_count,
+        "total_old": total_old,
+        "total_new": total_new,
+        "total_delta": total_new - total_old,
+    }
+
+
+def print_diff_report(diff, limit=50):
+    """Wyświetla raport różnic między kosztorysami (najwyżej `limit` wierszy na sekcję)."""
+    print(f"  Dodane pozycje: {len(diff['added'])}")
+    print(f"  Usunięte pozycje: {len(diff['removed'])}")
+    print(f"  Zmienione pozycje: {diff['changed_count']}")
+    print(f"  Bez zmian: {diff['unchanged_count']}")
+    for title, key in (("Dodane", "added"), ("Usunięte", "removed"), ("Zmienione pola", "changed")):
+        table = diff[key]
+        if table.empty:
+            continue
+        print(f"\n  {title}:")
+        print(table.head(limit).to_string(index=False))
+        if len(table) > limit:
+            print(f"  ... i {len(table) - limit} kolejnych")
+    print(f"\n  Łączny koszt: {diff['total_old']:.2f} PLN -> {diff['total_new']:.2f} PLN "
+          f"(różnica: {diff['total_delta']:+.2f} PLN)\n")
+
+
+def write_diff_excel(diff, path):
+    """Zapisuje raport różnic do pliku .xlsx z arkuszami podsumowania, dodanych, usuniętych i zmienionych pozycji."""
+    summary = pd.DataFrame({
+        "Opis": ["Dodane pozycje", "Usunięte pozycje", "Zmienione pozycje", "Bez zmian",
+                 "Łączny koszt przed (PLN)", "Łączny koszt po (PLN)", "Różnica kosztu (PLN)"],
+        "Wartość": [len(diff["added"]), len(diff["removed"]), diff["changed_count"], diff["unchanged_count"],
+                    diff["total_old"], diff["total_new"], diff["total_delta"]],
+    })
+    sheets = [("Podsumowanie", summary), ("Dodane", diff["added"]),
+              ("Usunięte", diff["removed"]), ("Zmienione", diff["changed"])]
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for sheet_name, table in sheets:
+            table.to_excel(writer, sheet_name=sheet_name, index=False)
+            style_worksheet(writer.sheets[sheet_name], table, total_row=False,
+                            numeric_columns=NUMERIC_COLUMNS + ["Wartość", "Różnica"])
+
+
+LOCK_FILE_PATTERN = ".{}.wycennik.lock"
+LOCK_STALE_HOURS = 12
+
+
+def _row_hashes(df):
+    """Zwraca tablicę hashy wierszy kosztorysu (po kolumnach COLUMNS, z typami jak w porównaniu kosztorysów)."""
+    return pd.util.hash_pandas_object(_normalized_for_diff(df), index=False).to_numpy()
+
+
+def merge_external_changes(local, base_hashes, external, next_id=0, keep_file_order=False):
+    """Scala zmiany wprowadzone w pliku poza programem z kosztorysem w pamięci.
+
+    Porównywane są liczności hashy wierszy w trzech wersjach: pliku z chwili
+    wczytania lub zapisu (`base_hashes`), kosztorysu w pamięci i pliku
+    zmienionego z zewnątrz. Wiersze dodane w pliku są dopisywane z nowymi
+    etykietami (od `next_id`), a usunięte w pliku usuwane z pamięci; wiersze
+    bez zmian zachowują etykiety. Zmiana wiersza to usunięcie starej i
+    dodanie nowej wersji, więc wiersz zmieniony po obu stronach pojawi się
+    dwukrotnie - takie pozycje zwracane są jako konflikty do sprawdzenia.
+    Przy `keep_file_order` (brak lokalnych zmian) wiersze ustawiane są w kolejności z pliku.
+    Zwraca (scalony kosztorys, etykiety dodanych, etykiety usuniętych, tabela konfliktów).
+    """
+    base_hashes = np.asarray(base_hashes, dtype=np.uint64)
+    local_hashes = _row_hashes(local)
+    external_hashes = _row_hashes(external)
+    codes, uniques = pd.factorize(np.concatenate([base_hashes, local_hashes, external_hashes]))
+    base_codes = codes[:len(base_hashes)]
+    local_codes = codes[len(base_hashes):len(base_hashes) + len(local)]
+    external_codes = codes[len(base_hashes) + len(local):]
+    base = np.bincount(base_codes, minlength=len(uniques))
+    ours = np.bincount(local_codes, minlength=len(uniques))
+    theirs = np.bincount(external_codes, minlength=len(uniques))
+
+    # Docelowa liczność każdego wiersza: zmiana z pliku nałożona na stan w pamięci,
+    # a ta sama zmiana po obu stronach (dodanie lub usunięcie) liczona raz.
+    their_delta = theirs - base
+    our_delta = ours - base
+    target = np.maximum(ours + their_delta, 0)
+    both_added = (their_delta > 0) & (our_delta > 0)
+    both_removed = (their_delta < 0) & (our_delta < 0)
+    target[both_added] = (base + np.maximum(their_delta, our_delta))[both_added]
+    target[both_removed] = (base + np.minimum(their_delta, our_delta))[both_removed]
+    delta = target - ours
+
+    def first_occurrences(row_codes, limits):
+        """Zwraca pozycje wierszy będących pierwszymi `limits[kod]` wystąpieniami swojego kodu."""
+        candidates = np.flatnonzero(limits[row_codes] > 0)
+        occurrence = pd.Series(row_codes[candidates]).groupby(row_codes[candidates]).cumcount().to_numpy()
+        return candidates[occurrence < limits[row_codes[candidates]]]
+
+    drop = np.zeros(len(local), dtype=bool)
+    drop[first_occurrences(local_codes, np.maximum(-delta, 0))] = True
+    removed = list(local.index[drop])
+    take = first_occurrences(external_codes, np.maximum(delta, 0))
+    incoming = external.iloc[take].reindex(columns=local.columns)
+    if CURRENCY_COLUMN in incoming.columns:
+        incoming[CURRENCY_COLUMN] = incoming[CURRENCY_COLUMN].fillna(BASE_CURRENCY)
+        incoming[FOREIGN_PRICE_COLUMN] = incoming[FOREIGN_PRICE_COLUMN].fillna(incoming["Cena jednostkowa (PLN)"])
+    incoming.index = pd.RangeIndex(next_id, next_id + len(incoming))
+    added = list(incoming.index)
+
+    merged = local[~drop]
+    if len(incoming):
+        merged = pd.concat([merged, incoming])
+    if keep_file_order and len(merged) == len(external):
+        # Przy równych licznościach k-te wystąpienie wiersza w pamięci odpowiada k-temu w pliku
+        merged_codes = np.concatenate([local_codes[~drop], external_codes[take]])
+        order = np.empty(len(merged), dtype=np.intp)
+        order[np.argsort(external_codes, kind="stable")] = np.argsort(merged_codes, kind="stable")
+        merged = merged.iloc[order]
+
+    own_names = set(local["Pozycja"].to_numpy()[our_delta[local_codes] > 0]) - {None}
+    conflicts = incoming[incoming["Pozycja"].isin(own_names)]
+    conflicts = pd.DataFrame({"Nr": merged.index.get_indexer(conflicts.index) + 1,
+                              "Pozycja": conflicts["Pozycja"].to_numpy()})
+    return merged, added, removed, conflicts
+
+
+class SharedFile:
+    """Plik kosztorysu we wspólnym folderze: blokada informacyjna i wykrywanie zmian z zewnątrz.
+
+    Blokada to plik obok kosztorysu z nazwą użytkownika, komputerem i czasem
+    otwarcia; nie blokuje zapisu, tylko ostrzega innych. Zmiany wykrywane są
+    tanio: przy każdym sprawdzeniu porównywany jest czas modyfikacji i rozmiar
+    pliku, a skrót zawartości liczony jest tylko wtedy, gdy one się zmieniły.
+    Zapamiętywane są też hashe wierszy pliku z chwili wczytania lub zapisu,
+    potrzebne do scalenia zmian (merge_external_changes).
+    """
+
+    def __init__(self, path, df):
+        self.path = path
+        self.lock_owner = None
+        self.owns_lock = False
+        self.seen = None
+        self.synced = None
+        self.base_hashes = None
+        self.remember(df)
+
+    def _lock_path(self):
+        return os.path.join(os.path.dirname(self.path), LOCK_FILE_PATTERN.format(os.path.basename(self.path)))
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _digest(self):
+        digest = hashlib.blake2b(digest_size=16)
+        try:
+            with open(self.path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+        except OSError:
+            return None
+        return digest.hexdigest()
+
+    def fingerprint(self):
+        """Zwraca odcisk pliku: (mtime, rozmiar, skrót zawartości)."""
+        return self._stat(), self._digest()
+
+    def remember(self, df, fingerprint=None):
+        """Zapamiętuje stan pliku po wczytaniu lub zapisie `df` (odcisk pobrany przed odczytem, jeśli podany)."""
+        self.synced = fingerprint or self.fingerprint()
+        self.seen = self.synced
+        self.base_hashes = _row_hashes(df)
+
+    def _differs(self, known):
+        """Porównuje plik z odciskiem `known`; zwraca (czy zmieniony, aktualny odcisk)."""
+        stat = self._stat()
+        if stat is None or stat == known[0]:
+            return False, known
+        current = (stat, self._digest())
+        return current[1] != known[1], current
+
+    def poll(self):
+        """Sprawdza, czy plik zmienił się od ostatniego sprawdzenia (każda zmiana zgłaszana jest raz)."""
+        changed, self.seen = self._differs(self.seen)
+        return changed
+
+    def changed_since_sync(self):
+        """Sprawdza, czy plik różni się od stanu z chwili wczytania lub ostatniego zapisu."""
+        return self._differs(self.synced)[0]
+
+    def lock(self):
+        """Zakłada blokadę; jeśli plik otworzył już ktoś inny, zapamiętuje go w `lock_owner`."""
+        try:
+            user = getpass.getuser()
+        except Exception:
+            user = "?"
+        info = {"user": user, "host": socket.gethostname(), "pid": os.getpid(),
+                "ts": datetime.now().isoformat(timespec="seconds")}
+        lock_path = self._lock_path()
+        self.lock_owner = None
+        for _ in range(2):
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                owner = self._read_lock()
+                if owner is not None and not self._is_stale(owner, info):
+                    self.lock_owner = owner
+                    return
+                with contextlib.suppress(OSError):
+                    os.remove(lock_path)
+                continue
+            except OSError:
+                return
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(info, f, ensure_ascii=False)
+            self.owns_lock = True
+            return
+
+    def _read_lock(self):
+        try:
+            with open(self._lock_path(), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _is_stale(owner, info):
+        """Blokada jest nieaktualna, jeśli jest nasza, jest starsza niż LOCK_STALE_HOURS
+        lub jej proces na tym komputerze już nie działa."""
+        if owner.get("host") == info["host"] and owner.get("pid") == info["pid"]:
+            return True
+        try:
+            age = datetime.now() - datetime.fromisoformat(owner.get("ts", ""))
+        except (TypeError, ValueError):
+            return True
+        if age.total_seconds() > LOCK_STALE_HOURS * 3600:
+            return True
+        if owner.get("host") == info["host"] and os.name == "posix":
+            try:
+                os.kill(int(owner.get("pid")), 0)
+            except ProcessLookupError:
+                return True
+            except (OSError, TypeError, ValueError):
+                pass
+        return False
+
+    def unlock(self):
+        """Zdejmuje własną blokadę (cudzej nie rusza)."""
+        if self.owns_lock:
+            with contextlib.suppress(OSError):
+                os.remove(self._lock_path())
+            self.owns_lock = False
+
+    def moved(self, path):
+        """Przenosi śledzenie i blokadę na nową ścieżkę pliku (po przeniesieniu lub zmianie nazwy)."""
+        self.unlock()
+        self.path = path
+        self.lock()
+
+
+MAX_VALUE = 1_000_000
+MAX_TEXT_LENGTH = {"Pozycja": 1000, "Jednostka": 50, "Kategoria": 1000, "Opis": 1000}
+VALIDATION_ERROR = "błąd"
+VALIDATION_WARNING = "ostrzeżenie"
+VALIDATION_REPORT_COLUMNS = ["Nr", "Pozycja", "Kolumna", "Poziom", "Problem", "Wartość"]
+
+
+def _format_row_numbers(positions, limit=10):
+    """Zwraca numery wierszy (pozycje od 0) jako tekst od 1, skrócony do `limit` numerów."""
+    numbers = ", ".join(str(pos + 1) for pos in positions[:limit])
+    return numbers + (f" i {len(positions) - limit} kolejnych" if len(positions) > limit else "")
+
+
+def validate_cost_estimate(df):
+    """Sprawdza cały kosztorys jednym przebiegiem wektorowym i zwraca raport problemów (DataFrame).
+
+    Każdy wiersz raportu wskazuje numer pozycji (od 1, jak w widoku kosztorysu), kolumnę, poziom
+    (błąd lub ostrzeżenie), opis problemu i wartość. Błędy: brak lub niepoprawna liczba, wartość ujemna
+    lub większa niż 1 000 000, stawka spoza 0-100, koszt różny od ilość × cena, pusta nazwa, za długi tekst.
+    Ostrzeżenia: brak lub nieznana jednostka, niepoprawny kod waluty, powtórzona pozycja (ta sama nazwa
+    i jednostka).
+    """
+    count = len(df)
+    parts = []
+
+    def pick(values, positions):
+        # Wartości są pobierane tylko dla wierszy z problemem, bez kopii całych kolumn
+        if isinstance(values, pd.Series):
+            return values.iloc[positions].to_numpy(dtype=object)
+        return np.asarray(values, dtype=object)[positions]
+
+    def add(mask, column, level, problem, values):
+        positions = np.flatnonzero(np.asarray(mask, dtype=bool))
+        if len(positions):
+            parts.append(pd.DataFrame({
+                "Nr": positions + 1, "Pozycja": pick(df["Pozycja"], positions), "Kolumna": column,
+                "Poziom": level, "Problem": problem if isinstance(problem, str) else pick(problem, positions),
+                "Wartość": pick(values, positions),
+            }))
+
+    numbers = {}
+    optional = [col for col in list(RATE_COLUMNS) + [FOREIGN_PRICE_COLUMN] if col in df.columns]
+    for col in NUMERIC_COLUMNS + optional:
+        raw = df[col]
+        values = pd.to_numeric(raw, errors="coerce").to_numpy(dtype=float)
+        numbers[col] = values
+        missing = raw.isna().to_numpy()
+        add(missing, col, VALIDATION_ERROR, "Brak wartości", raw)
+        add(np.isnan(values) & ~missing, col, VALIDATION_ERROR, "Niepoprawna liczba", raw)
+        add(values < 0, col, VALIDATION_ERROR, "Wartość ujemna", values)
+        if col in RATE_COLUMNS:
+            add(values > 100, col, VALIDATION_ERROR, "Stawka większa niż 100%", values)
+        elif col != "Koszt całkowity (PLN)":
+            add(values > MAX_VALUE, col, VALIDATION_ERROR, "Wartość większa niż 1 000 000", values)
+
+    expected = numbers["Ilość"] * numbers["Cena jednostkowa (PLN)"]
+    cost = numbers["Koszt całkowity (PLN)"]
+    mismatch = ~np.isclose(cost, expected, rtol=1e-9, atol=0.01) & ~np.isnan(cost) & ~np.isnan(expected)
+    if mismatch.any():
+        problem = "Koszt różny od ilość × cena (" + pd.Series(expected).round(2).astype(str) + ")"
+        add(mismatch, "Koszt całkowity (PLN)", VALIDATION_ERROR, problem, cost)
+
+    texts = {}
+    for col, max_length in MAX_TEXT_LENGTH.items():
+        raw = df[col]
+        if pd.api.types.is_numeric_dtype(raw):
+            # Pusta kolumna tekstowa wczytana z pliku ma typ liczbowy (same NaN)
+            raw = raw.astype(object)
+        text = raw.fillna("").astype(str)
+        texts[col] = text
+        lengths = text.str.len().to_numpy()
+        add(lengths > max_length, col, VALIDATION_ERROR, f"Tekst dłuższy niż {max_length} znaków", lengths)
+
+    name = texts["Pozycja"].str.strip()
+    add((name == "").to_numpy(), "Pozycja", VALIDATION_ERROR, "Pusta nazwa pozycji", df["Pozycja"])
+
+    unit = texts["Jednostka"].str.strip()
+    add((unit == "").to_numpy(), "Jednostka", VALIDATION_WARNING, "Brak jednostki", df["Jednostka"])
+    add((unit != "").to_numpy() & ~unit.isin(UNITS).to_numpy(), "Jednostka", VALIDATION_WARNING,
+        "Nieznana jednostka", df["Jednostka"])
+    if CURRENCY_COLUMN in df.columns:
+        currency = df[CURRENCY_COLUMN].astype(object).where(df[CURRENCY_COLUMN].notna(), "").astype(str)
+        add(~currency.str.fullmatch(r"[A-Z]{3}").to_numpy(dtype=bool), CURRENCY_COLUMN, VALIDATION_WARNING,
+            "Niepoprawny kod waluty (np. EUR)", df[CURRENCY_COLUMN])
+
+    key = name.str.casefold() + "\x00" + unit
+    duplicated = (key.duplicated() & (name != "")).to_numpy()
+    if duplicated.any():
+        first = pd.Series(np.arange(count)).groupby(key.to_numpy()).transform("min").to_numpy()
+        problem = "Powtórzona pozycja (jak nr " + pd.Series(first + 1).astype(str) + ")"
+        add(duplicated, "Pozycja", VALIDATION_WARNING, problem, df["Pozycja"])
+
+    if not parts:
+        return pd.DataFrame(columns=VALIDATION_REPORT_COLUMNS)
+    return pd.concat(parts, ignore_index=True).sort_values("Nr", kind="stable", ignore_index=True)
+
+
+def print_validation_report(report, limit=50):
+    """Wyświetla podsumowanie raportu walidacji i najwyżej `limit` jego wierszy."""
+    if report.empty:
+        print("  Nie znaleziono problemów.\n")
+        return
+    errors = int((report["Poziom"] == VALIDATION_ERROR).sum())
+    rows = report["Nr"].nunique()
+    print(f"  Błędy: {errors}, ostrzeżenia: {len(report) - errors} (pozycji z problemami: {rows})")
+    print(report.head(limit).to_string(index=False))
+    if len(report) > limit:
+        print(f"  ... i {len(report) - limit} kolejnych")
+    print()
+
+
+def _validate_file(path):
+    """Wczytuje i sprawdza jeden plik kosztorysu; zwraca (ścieżka, raport lub None, komunikat błędu lub None)."""
+    try:
+        if os.path.splitext(path)[1].lower() in EXPORT_FORMATS:
+            df = import_cost_estimate(path)
+        else:
+            df = read_cost_estimate(path)
+        return path, validate_cost_estimate(df), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def _disable_profiler():
+    """Wyłącza profiler w procesie roboczym (ślad zapisuje tylko proces główny)."""
+    PROFILER.enabled = False
+
+
+def validate_files(paths, workers=None):
+    """Sprawdza wiele plików kosztorysów równolegle (pula procesów); zwraca listę wyników `_validate_file`.
+
+    Foldery są przeszukiwane rekurencyjnie w poszukiwaniu plików .xlsx (bez kopii zapasowych).
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(
+                f for f in glob.glob(os.path.join(path, "**", "*.xlsx"), recursive=True)
+                if not os.path.basename(f).startswith(("backup_", "~$"))
+            ))
+        else:
+            files.append(path)
+    if len(files) < 2 or workers == 1:
+        return [_validate_file(path) for path in files]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_disable_profiler) as executor:
+        return list(executor.map(_validate_file, files))
+
+
+MIGRATION_FILE = ".wycennik_migracja.jsonl"
+# Nazwy kolumn ze starszych wersji arkuszy (porównywane bez wielkości liter, spacji i polskich znaków)
+LEGACY_COLUMN_NAMES = {
+    "Pozycja": ["Nazwa", "Nazwa pozycji", "Element", "Pozycja kosztorysu"],
+    "Ilość": ["Ilosc", "Liczba", "Ilość (szt)"],
+    "Jednostka": ["J.m.", "jm", "Jedn.", "Jednostka miary"],
+    "Cena jednostkowa (PLN)": ["Cena jednostkowa", "Cena", "Cena jedn.", "Cena (PLN)", "Cena jednostkowa [PLN]",
+                               "Cena jednostkowa (zł)"],
+    "Koszt całkowity (PLN)": ["Koszt całkowity", "Koszt", "Wartość", "Wartość (PLN)", "Koszt (PLN)",
+                              "Koszt całkowity [PLN]", "Koszt całkowity (zł)"],
+    "Kategoria": ["Grupa", "Dział"],
+    "Opis": ["Uwagi", "Komentarz"],
+}
+
+
+def map_legacy_columns(columns, column_map=None):
+    """Zwraca słownik zmiany nazw kolumn starego arkusza na kolumny COLUMNS.
+
+    Nazwy są porównywane po normalizacji (fold_text). `column_map` (stara nazwa -> kolumna)
+    uzupełnia i ma pierwszeństwo przed LEGACY_COLUMN_NAMES. Kolumna docelowa już obecna
+    w arkuszu nie jest nadpisywana.
+    """
+    aliases = {col: [col] + names for col, names in LEGACY_COLUMN_NAMES.items()}
+    for old, new in (column_map or {}).items():
+        aliases.setdefault(new, []).insert(0, old)
+    names = [str(col) for col in columns]
+    alias_names = [(target, name) for target, group in aliases.items() for name in group]
+    codes, texts = fold_text(pd.Series(names + [name for _, name in alias_names], dtype=object))
+    folded = [texts[code] if code >= 0 else "" for code in codes]
+    by_key = {}
+    for name, key in zip(names, folded[:len(names)]):
+        by_key.setdefault(key, name)
+    rename = {}
+    for (target, name), key in zip(alias_names, folded[len(names):]):
+        source = by_key.get(key)
+        if target in names or target in rename.values() or source is None or source in rename:
+            continue
+        if source != target:
+            rename[source] = target
+    return rename
+
+
+def migrate_cost_estimate(df, name, column_map=None):
+    """Przenosi kosztorys ze starszego układu kolumn do bieżącego.
+
+    Zmienia nazwy kolumn, dodaje brakujące kolumny tekstowe, usuwa wiersz RAZEM
+    i puste wiersze oraz przelicza koszt całkowity. Pozostałe kolumny arkusza są
+    zachowywane za kolumnami COLUMNS. Zwraca (kosztorys, zmiany nazw kolumn,
+    liczba pozycji z poprawionym kosztem).
+    """
+    rename = map_legacy_columns(df.columns, column_map)
+    df = df.rename(columns=rename).dropna(how="all")
+    missing = [col for col in ("Pozycja", "Ilość", "Cena jednostkowa (PLN)") if col not in df.columns]
+    if missing:
+        raise Exception(f"Plik {name} nie zawiera kolumn: {', '.join(missing)}.")
+    for col in ("Jednostka", "Kategoria", "Opis"):
+        if col not in df.columns:
+            df[col] = ""
+    previous_cost = df["Koszt całkowity (PLN)"] if "Koszt całkowity (PLN)" in df.columns else None
+    df["Koszt całkowity (PLN)"] = 0.0
+    df = df[df["Pozycja"].astype(str).str.strip().str.upper() != "RAZEM"]
+    df = _normalize_cost_estimate(df, name)
+    df["Koszt całkowity (PLN)"] = df["Ilość"] * df["Cena jednostkowa (PLN)"]
+    recomputed = 0
+    if previous_cost is not None:
+        previous = pd.to_numeric(previous_cost.reindex(df.index), errors="coerce")
+        recomputed = int((~np.isclose(previous.fillna(np.inf), df["Koszt całkowity (PLN)"])).sum())
+    df = df[COLUMNS + [col for col in df.columns if col not in COLUMNS]].reset_index(drop=True)
+    return df, rename, recomputed
+
+
+def _migrate_file(args):
+    """Przenosi jeden plik do bieżącego układu i zapisuje go w miejscu (atomowo); zwraca wpis stanu migracji."""
+    root_dir, path, column_map = args
+    start = time.perf_counter()
+    record = {"file": os.path.relpath(path, root_dir), "ts": datetime.now().isoformat(timespec="seconds")}
+    messages = io.StringIO()
+    try:
+        name = os.path.basename(path)
+        with contextlib.redirect_stdout(messages):
+            df, rename, recomputed = migrate_cost_estimate(pd.read_excel(path), name, column_map)
+        if all(col in df.columns for col in RATE_COLUMNS):
+            df = pd.concat([df, evaluate_computed_columns(df)], axis=1)
+        fd, temp_path = tempfile.mkstemp(suffix=".xlsx", dir=os.path.dirname(path))
+        os.close(fd)
+        try:
+            write_styled_excel_stream(with_summary_row(df), temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        st = os.stat(path)
+        record.update(status="ok", rows=len(df), renamed=rename, recomputed=recomputed,
+                      mtime_ns=st.st_mtime_ns, size=st.st_size)
+    except Exception as e:
+        record.update(status="błąd", error=str(e))
+    warnings = messages.getvalue().strip()
+    if warnings:
+        record["warnings"] = warnings.splitlines()
+    record["ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return record
+
+
+def _print_migration_record(record, done, total):
+    """Wypisuje jeden wiersz raportu migracji."""
+    prefix = f"[{done}/{total}] {record['file']}:"
+    if record["status"] != "ok":
+        print(f"{prefix} {record['status']} - {record.get('error', '')}")
+    else:
+        details = [f"pozycji {record['rows']}"]
+        if record["renamed"]:
+            details.append("kolumny " + ", ".join(f"'{old}' -> '{new}'" for old, new in record["renamed"].items()))
+        if record["recomputed"]:
+            details.append(f"poprawione koszty {record['recomputed']}")
+        print(f"{prefix} ok ({'; '.join(details)}, {record['ms'] / 1000:.1f} s)")
+    for warning in record.get("warnings", []):
+        print(f"    {warning}")
+
+
+def migrate_folder(root_dir, workers=None, column_map=None, report=_print_migration_record):
+    """Przenosi wszystkie kosztorysy z drzewa folderów do bieżącego układu w puli procesów.
+
+    Stan każdego pliku jest dopisywany do MIGRATION_FILE w `root_dir` zaraz po jego
+    przetworzeniu, więc przerwaną migrację można wznowić: pomijane są pliki przeniesione
+    wcześniej i od tego czasu niezmienione. Pomijane są też kopie zapasowe, pliki
+    tymczasowe Excela i pliki otwarte w programie (z blokadą). Zwraca listę wpisów stanu.
+    """
+    root_dir = os.path.abspath(root_dir)
+    progress_path = os.path.join(root_dir, MIGRATION_FILE)
+    done = {}
+    if os.path.exists(progress_path):
+        with open(progress_path, encoding="utf-8") as f:
+            for line in f:
+                with contextlib.suppress(ValueError):
+                    record = json.loads(line)
+                    done[record["file"]] = record
+    tasks = []
+    skipped = []
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in sorted(filenames):
+            if not filename.endswith(".xlsx") or filename.startswith(("backup_", "~$", ".")):
+                continue
+            path = os.path.join(dirpath, filename)
+            relpath = os.path.relpath(path, root_dir)
+            previous = done.get(relpath)
+            st = os.stat(path)
+            if previous and previous["status"] == "ok" and (previous["mtime_ns"], previous["size"]) == (
+                    st.st_mtime_ns, st.st_size):
+                skipped.append(relpath)
+                continue
+            if os.path.exists(os.path.join(dirpath, LOCK_FILE_PATTERN.format(filename))):
+                print(f"{relpath}: pominięty - plik jest otwarty w programie (blokada).")
+                continue
+            tasks.append((root_dir, path, column_map))
+    if skipped:
+        print(f"Pominięto plików przeniesionych wcześniej: {len(skipped)}")
+
+    results = []
+    with open(progress_path, "a", encoding="utf-8") as progress:
+        if len(tasks) < 2 or workers == 1:
+            records = map(_migrate_file, tasks)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_disable_profiler)
+            records = executor.map(_migrate_file, tasks)
+        try:
+            for record in records:
+                progress.write(json.dumps(record, ensure_ascii=False) + "\n")
+                progress.flush()
+                results.append(record)
+                report(record, len(results), len(tasks))
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+    return results
+
+
+def _quote_identifier(name):
+    """Zwraca nazwę tabeli lub kolumny SQLite w cudzysłowach."""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class SQLiteProjectStore:
+    """Magazyn kosztorysów projektu w pliku SQLite: każdy kosztorys to osobna tabela.
+
+    Wiersze tabeli mają stały identyfikator (etykietę indeksu DataFrame) i kolumnę
+    kolejności, więc zapis zmian dotyczy tylko dodanych, zmienionych i usuniętych wierszy.
+    """
+
+    INDEXED_COLUMNS = [("Kategoria", "kategoria"), ("Pozycja", "pozycja"), ("Koszt całkowity (PLN)", "koszt")]
+
+    def __init__(self, path):
+        """Otwiera (lub tworzy) plik magazynu SQLite."""
+        self.path = os.path.abspath(path)
+        self.conn = sqlite3.connect(self.path)
+
+    def close(self):
+        """Zamyka połączenie z magazynem."""
+        self.conn.close()
+
+    def list_estimates(self):
+        """Zwraca posortowaną listę nazw kosztorysów zapisanych w magazynie."""
+        rows = self.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def exists(self, name):
+        """Sprawdza, czy kosztorys o podanej nazwie istnieje w magazynie."""
+        return name in self.list_estimates()
+
+    def load(self, name):
+        """Wczytuje kosztorys z magazynu; indeks DataFrame to identyfikatory wierszy."""
+        columns = ", ".join(_quote_identifier(col) for col in COLUMNS)
+        df = pd.read_sql_query(f"SELECT id, {columns} FROM {_quote_identifier(name)} ORDER BY kolejnosc, id",
+                               self.conn, index_col="id")
+        df.index.name = None
+        for col in NUMERIC_COLUMNS:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+        return df
+
+    def rows_by_id(self, name, labels):
+        """Zwraca zapisane wiersze kosztorysu o podanych identyfikatorach (pomija nieistniejące)."""
+        columns = ", ".join(_quote_identifier(col) for col in COLUMNS)
+        labels = [int(label) for label in labels]
+        frames = [pd.DataFrame(columns=COLUMNS)]
+        for start in range(0, len(labels), 500):
+            chunk = labels[start:start + 500]
+            frames.append(pd.read_sql_query(
+                f"SELECT id, {columns} FROM {_quote_identifier(name)} WHERE id IN ({', '.join('?' for _ in chunk)})",
+                self.conn, params=chunk, index_col="id"))
+        df = pd.concat([frame for frame in frames if len(frame)] or frames[:1])
+        for col in NUMERIC_COLUMNS:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+        return df
+
+    def _create_table(self, name):
+        """Tworzy tabelę kosztorysu z indeksami na kategorii, nazwie pozycji i koszcie."""
+        table = _quote_identifier(name)
+        column_defs = ", ".join(
+            f"{_quote_identifier(col)} {'REAL' if col in NUMERIC_COLUMNS else 'TEXT'}" for col in COLUMNS
+        )
+        self.conn.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, kolejnosc REAL, {column_defs})")
+        self._create_indexes(name)
+
+    def _create_indexes(self, name):
+        """Tworzy indeksy tabeli kosztorysu (nazwy indeksów zawierają nazwę kosztorysu)."""
+        for col, suffix in self.INDEXED_COLUMNS:
+            index_name = _quote_identifier(f"idx_{name}_{suffix}")
+            self.conn.execute(f"CREATE INDEX {index_name} ON {_quote_identifier(name)} ({_quote_identifier(col)})")
+
+    @staticmethod
+    def _rows(df, labels):
+        """Zwraca wiersze (id, wartości kolumn) gotowe do przekazania do sqlite3."""
+        subset = df.loc[list(labels), COLUMNS]
+        subset = subset.astype(object).where(subset.notna(), None)
+        return [[int(label)] + values for label, values in zip(subset.index, subset.values.tolist())]
+
+    def write_full(self, name, df):
+        """Zapisuje cały kosztorys do tabeli, zastępując jej poprzednią zawartość (jedna transakcja)."""
+        columns = ", ".join(_quote_identifier(col) for col in COLUMNS)
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        rows = self._rows(df, df.index)
+        with self.conn:
+            self.conn.execute(f"DROP TABLE IF EXISTS {_quote_identifier(name)}")
+            self._create_table(name)
+            self.conn.executemany(
+                f"INSERT INTO {_quote_identifier(name)} (id, kolejnosc, {columns}) VALUES (?, ?, {placeholders})",
+                [[row[0], position] + row[1:] for position, row in enumerate(rows)]
+            )
+
+    def commit_changes(self, name, df, changed, deleted, order_changed):
+        """Zapisuje w jednej transakcji tylko zmienione i usunięte wiersze kosztorysu.
+
+        Nowe wiersze dostają kolejność równą swojemu identyfikatorowi (większemu od
+        wszystkich dotychczasowych), zmienione zachowują swoją. Po sortowaniu
+        (`order_changed`) przepisywana jest kolumna kolejności wszystkich wierszy.
+        """
+        table = _quote_identifier(name)
+        columns = ", ".join(_quote_identifier(col) for col in COLUMNS)
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        updates = ", ".join(f"{_quote_identifier(col)} = excluded.{_quote_identifier(col)}" for col in COLUMNS)
+        changed = [label for label in changed if label in df.index]
+        with self.conn:
+            if deleted:
+                self.conn.executemany(f"DELETE FROM {table} WHERE id = ?", [(int(label),) for label in deleted])
+            if changed:
+                self.conn.executemany(
+                    f"INSERT INTO {table} (id, kolejnosc, {columns}) VALUES (?, ?, {placeholders}) "
+                    f"ON CONFLICT(id) DO UPDATE SET {updates}",
+                    [[row[0], row[0]] + row[1:] for row in self._rows(df, changed)]
+                )
+            if order_changed:
+                self.conn.executemany(f"UPDATE {table} SET kolejnosc = ? WHERE id = ?",
+                                      [(position, int(label)) for position, label in enumerate(df.index)])
+
+    def rename(self, old_name, new_name):
+        """Zmienia nazwę kosztorysu w magazynie."""
+        with self.conn:
+            self.conn.execute(f"ALTER TABLE {_quote_identifier(old_name)} RENAME TO {_quote_identifier(new_name)}")
+            for _, suffix in self.INDEXED_COLUMNS:
+                self.conn.execute(f"DROP INDEX IF EXISTS {_quote_identifier(f'idx_{old_name}_{suffix}')}")
+            self._create_indexes(new_name)
+
+    def delete(self, name):
+        """Usuwa kosztorys z magazynu."""
+        with self.conn:
+            self.conn.execute(f"DROP TABLE IF EXISTS {_quote_identifier(name)}")
+
+
+class DirectoryCache:
+    """Pamięć podręczna zawartości folderów (os.scandir), unieważniana zmianą czasu modyfikacji folderu.
+
+    Dodanie, usunięcie lub zmiana nazwy wpisu zmienia mtime folderu, więc ponowny odczyt kosztuje
+    tylko jedno wywołanie os.stat, dopóki folder się nie zmieni.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def scan(self, path):
+        """Zwraca posortowaną listę par (nazwa, czy_folder) dla folderu `path` (pustą, jeśli folder nie istnieje)."""
+        path = os.path.abspath(path)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self._entries.pop(path, None)
+            return []
+        cached = self._entries.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        entries = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        entries.append((entry.name, entry.is_dir()))
+                    except OSError:
+                        continue
+        except OSError:
+            return []
+        entries.sort(key=lambda e: e[0].casefold())
+        self._entries[path] = (mtime, entries)
+        return entries
+
+    def subdirectories(self, path):
+        """Zwraca pełne ścieżki podfolderów folderu `path`."""
+        return [os.path.join(path, name) for name, is_dir in self.scan(path) if is_dir]
+
+    def files(self, path, extensions):
+        """Zwraca pełne ścieżki plików z folderu `path` o podanych rozszerzeniach."""
+        return [os.path.join(path, name) for name, is_dir in self.scan(path)
+                if not is_dir and name.lower().endswith(extensions)]
+
+
+DIRECTORY_CACHE = DirectoryCache()
+
+
+class PathCompleter(Completer):
+    """Podpowiedzi ścieżek (folderów i plików o wybranych rozszerzeniach) względem folderu `base_dir`."""
+
+    def __init__(self, base_dir, only_directories=False, extensions=(".xlsx",), include_directories=True):
+        self.base_dir = base_dir
+        self.only_directories = only_directories
+        self.include_directories = include_directories
+        self.extensions = tuple(extensions)
+
+    def get_completions(self, document, complete_event):
+        text = os.path.expanduser(document.text_before_cursor)
+        dirname, prefix = os.path.split(text)
+        folded = prefix.casefold()
+        for name, is_dir in DIRECTORY_CACHE.scan(os.path.join(self.base_dir, dirname)):
+            if not name.casefold().startswith(folded) or (name.startswith(".") and not prefix.startswith(".")):
+                continue
+            if not is_dir and (self.only_directories or not name.lower().endswith(self.extensions)):
+                continue
+            if is_dir and not self.include_directories:
+                continue
+            completion = name + os.sep if is_dir else name
+            yield Completion(completion, start_position=-len(prefix), display_meta="folder" if is_dir else "")
+
+
+POSITION_INDEX_FILE = ".wycennik_pozycje.json"
+
+
+class PositionIndex:
+    """Trwały indeks prefiksowy nazw pozycji ze wszystkich kosztorysów w folderze roboczym i podfolderach.
+
+    Dla każdej nazwy pamięta ostatnio użytą jednostkę, kategorię i cenę (z najnowszego pliku).
+    Indeks jest zapisywany w pliku `POSITION_INDEX_FILE`; przy odświeżeniu ponownie czytane są
+    tylko pliki, których czas modyfikacji lub rozmiar się zmienił. Wyszukiwanie prefiksu to
+    wyszukiwanie binarne w posortowanej liście nazw (bez rozróżniania wielkości liter).
+    """
+
+    VERSION = 1
+
+    def __init__(self, root_dir):
+        """Tworzy pusty indeks dla folderu `root_dir`; dane są wczytywane dopiero przez `load_async`."""
+        self.root_dir = os.path.abspath(root_dir)
+        self.path = os.path.join(self.root_dir, POSITION_INDEX_FILE)
+        self.files = {}
+        self.names = {}
+        self.keys = []
+        self.ready = False
+        self._session = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def load_async(self):
+        """Uruchamia wczytanie i odświeżenie indeksu w tle (jeśli nie trwa już inne)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self.refresh, name="position-index", daemon=True)
+        self._thread.start()
+
+    def refresh(self):
+        """Wczytuje zapisany indeks, ponownie czyta zmienione pliki .xlsx i zapisuje indeks, jeśli się zmienił."""
+        with self._lock:
+            files = dict(self.files)
+        if not files and os.path.exists(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == self.VERSION:
+                    files = data["files"]
+            except (OSError, ValueError, KeyError):
+                files = {}
+        changed = False
+        seen = set()
+        for path in self._workspace_files():
+            rel_path = os.path.relpath(path, self.root_dir)
+            seen.add(rel_path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = files.get(rel_path)
+            if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                continue
+            files[rel_path] = {"mtime": stat.st_mtime, "size": stat.st_size,
+                               "names": self._read_names(path)}
+            changed = True
+        for rel_path in set(files) - seen:
+            del files[rel_path]
+            changed = True
+        with self._lock:
+            # Wpisy zaktualizowane w międzyczasie przez update_file są nowsze niż odczytane pliki
+            for rel_path, entry in self.files.items():
+                if rel_path in files and entry["mtime"] > files[rel_path]["mtime"]:
+                    files[rel_path] = entry
+            self.files = files
+            self._rebuild()
+            self.ready = True
+        if changed:
+            self.save()
+
+    def _workspace_files(self):
+        """Zwraca pliki kosztorysów .xlsx z folderu roboczego i podfolderów (bez kopii zapasowych i ukrytych)."""
+        for dirpath, dirnames, filenames in os.walk(self.root_dir):
+            dirnames[:] = [d for d in dirnames if not d.startswith((".", "__"))]
+            for filename in filenames:
+                if filename.endswith(".xlsx") and not filename.startswith(("backup_", "~$", ".")):
+                    yield os.path.join(dirpath, filename)
+
+    @staticmethod
+    def _read_names(path):
+        """Czyta z pliku nazwy pozycji z ostatnią jednostką, kategorią i ceną (tryb tylko do odczytu)."""
+        names = {}
+        try:
+            wb = load_workbook(path, read_only=True, data_only=True)
+        except Exception:
+            return names
+        try:
+            rows = wb.worksheets[0].iter_rows(values_only=True)
+            header = list(next(rows, ()))
+            if not all(col in header for col in ("Pozycja", "Jednostka", "Cena jednostkowa (PLN)", "Kategoria")):
+                return names
+            name_col, unit_col = header.index("Pozycja"), header.index("Jednostka")
+            price_col, category_col = header.index("Cena jednostkowa (PLN)"), header.index("Kategoria")
+            for row in rows:
+                name = row[name_col]
+                if name is None or not str(name).strip() or name == "RAZEM":
+                    continue
+                try:
+                    price = float(row[price_col])
+                except (TypeError, ValueError):
+                    price = 0.0
+                names[str(name).strip()] = [
+                    "" if row[unit_col] is None else str(row[unit_col]),
+                    "" if row[category_col] is None else str(row[category_col]),
+                    price,
+                ]
+        finally:
+            wb.close()
+        return names
+
+    @staticmethod
+    def _names_from_df(df):
+        """Zwraca nazwy pozycji z DataFrame w formacie indeksu (ostatni wiersz danej nazwy wygrywa)."""
+        table = pd.DataFrame({
+            "Pozycja": df["Pozycja"].fillna("").astype(str).str.strip(),
+            "Jednostka": df["Jednostka"].fillna("").astype(str),
+            "Kategoria": df["Kategoria"].fillna("").astype(str),
+            "Cena": pd.to_numeric(df["Cena jednostkowa (PLN)"], errors="coerce").fillna(0).astype(float),
+        }).drop_duplicates("Pozycja", keep="last")
+        table = table[table["Pozycja"] != ""]
+        return {name: [unit, category, price] for name, unit, category, price in table.itertuples(index=False)}
+
+    def _rebuild(self):
+        """Scala pliki od najstarszego do najnowszego i odtwarza posortowaną listę kluczy (pod blokadą)."""
+        names = {}
+        for entry in sorted(self.files.values(), key=lambda e: e["mtime"]):
+            names.update(entry["names"])
+        names.update(self._session)
+        self.names = names
+        self.keys = sorted((name.casefold(), name) for name in names)
+
+    def save(self):
+        """Zapisuje indeks do pliku (przez plik tymczasowy, aby nie zostawić uszkodzonego indeksu)."""
+        with self._lock:
+            data = json.dumps({"version": self.VERSION, "files": self.files}, ensure_ascii=False)
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def update_file(self, path, df):
+        """Aktualizuje wpis zapisanego właśnie pliku na podstawie DataFrame, bez ponownego czytania pliku."""
+        path = os.path.abspath(path)
+        if not path.startswith(self.root_dir + os.sep) or not os.path.exists(path):
+            return
+        stat = os.stat(path)
+        with self._lock:
+            self.files[os.path.relpath(path, self.root_dir)] = {
+                "mtime": stat.st_mtime, "size": stat.st_size, "names": self._names_from_df(df)
+            }
+            self._rebuild()
+        if self.ready:
+            self.save()
+
+    def remember(self, name, unit, category, price):
+        """Dodaje nazwę użytą w bieżącej sesji (przed zapisem pliku)."""
+        name = str(name).strip()
+        if not name:
+            return
+        with self._lock:
+            if name not in self.names:
+                bisect.insort(self.keys, (name.casefold(), name))
+            self._session[name] = self.names[name] = [str(unit), str(category), float(price)]
+
+    def lookup(self, name):
+        """Zwraca [jednostka, kategoria, cena] ostatniego użycia nazwy lub None."""
+        return self.names.get(str(name).strip())
+
+    def complete(self, prefix, limit=50):
+        """Zwraca do `limit` par (nazwa, [jednostka, kategoria, cena]) zaczynających się od `prefix`."""
+        keys, names = self.keys, self.names
+        folded = prefix.casefold()
+        start = bisect.bisect_left(keys, (folded,))
+        matches = []
+        for key, name in keys[start:start + limit]:
+            if not key.startswith(folded):
+                break
+            matches.append((name, names[name]))
+        return matches
+
+
+class PositionCompleter(Completer):
+    """Podpowiedzi nazw pozycji z indeksu `PositionIndex` (z ostatnią jednostką, kategorią i ceną)."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def get_completions(self, document, complete_event):
+        prefix = document.text_before_cursor.lstrip()
+        if not prefix:
+            return
+        for name, (unit, category, price) in self.index.complete(prefix):
+            yield Completion(name, start_position=-len(document.text_before_cursor),
+                             display_meta=f"{unit} | {category} | {price:.2f} PLN")
+
+
+VIEWER_PAGE_SIZE = 50
+VIEWER_CHECKPOINT = 1000
+
+
+class EstimateViewer:
+    """Podgląd dużego kosztorysu (tylko do odczytu) bez wczytywania całego pliku do pamięci.
+
+    Wiersze są czytane strumieniowo (openpyxl w trybie read_only) dopiero wtedy, gdy są potrzebne,
+    i przepisywane do pliku tymczasowego. Co VIEWER_CHECKPOINT wierszy zapamiętywane jest ich położenie
+    w tym pliku, więc strona jest czytana od najbliższego punktu kontrolnego, a w pamięci są tylko
+    punkty kontrolne i bieżąca strona.
+    """
+
+    def __init__(self, path):
+        """Otwiera plik i sprawdza nagłówek; wiersze nie są jeszcze czytane."""
+        self.path = path
+        name = os.path.basename(path)
+        self._wb = load_workbook(path, read_only=True, data_only=True)
+        self._rows = self._wb.worksheets[0].iter_rows(values_only=True)
+        header = list(next(self._rows, ()))
+        while header and header[-1] is None:
+            header.pop()
+        if not all(col in header for col in COLUMNS):
+            self._wb.close()
+            raise Exception(f"Plik {name} nie zawiera wszystkich oczekiwanych kolumn.")
+        self.columns = [str(col) for col in header]
+        self._cost_col = self.columns.index("Koszt całkowity (PLN)")
+        self._spill = tempfile.TemporaryFile()
+        self._checkpoints = []
+        self.indexed = 0
+        self.complete = False
+        self.total_cost = 0.0
+
+    def _index_until(self, count):
+        """Czyta kolejne wiersze pliku, aż zindeksowanych będzie co najmniej `count` (lub do końca pliku)."""
+        if self.complete or self.indexed >= count:
+            return
+        self._spill.seek(0, os.SEEK_END)
+        width = len(self.columns)
+        for row in self._rows:
+            if not row or row[0] == "RAZEM" or all(value is None for value in row):
+                continue
+            row = list(row[:width]) + [None] * (width - len(row))
+            if self.indexed % VIEWER_CHECKPOINT == 0:
+                self._checkpoints.append(self._spill.tell())
+            self._spill.write(json.dumps(row, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+            cost = row[self._cost_col]
+            if isinstance(cost, (int, float)):
+                self.total_cost += cost
+            self.indexed += 1
+            if self.indexed >= count:
+                return
+        self.complete = True
+        self._wb.close()
+
+    def count_all(self):
+        """Indeksuje plik do końca i zwraca liczbę pozycji."""
+        self._index_until(float("inf"))
+        return self.indexed
+
+    def page(self, start, count=VIEWER_PAGE_SIZE):
+        """Zwraca pozycje od `start` (numeracja od 0) jako DataFrame z kolumną Nr.
+
+        Czytana jest jeszcze jedna pozycja za stroną, aby przy ostatniej stronie `complete` było już ustawione.
+        """
+        self._index_until(start + count + 1)
+        start = max(0, min(start, self.indexed))
+        stop = min(start + count, self.indexed)
+        rows = []
+        if start < stop:
+            checkpoint = start // VIEWER_CHECKPOINT
+            self._spill.seek(self._checkpoints[checkpoint])
+            for _ in range(start - checkpoint * VIEWER_CHECKPOINT):
+                self._spill.readline()
+            rows = [json.loads(self._spill.readline()) for _ in range(stop - start)]
+        page = pd.DataFrame(rows, columns=self.columns)
+        page.insert(0, "Nr", range(start + 1, stop + 1))
+        return page
+
+    def close(self):
+        """Zamyka plik kosztorysu i usuwa plik tymczasowy (wielokrotne wywołanie jest bezpieczne)."""
+        if not self.complete:
+            self.complete = True
+            self._wb.close()
+        self._spill.close()
+
+
+WORKSPACE_MEMORY_BUDGET_MB = 512
+UNDO_LIMIT = 20
+SESSION_ATTRIBUTES = ("filename", "df", "is_modified", "undo_stack", "shared", "store_table",
+                      "_changed_rows", "_deleted_rows", "_order_changed", "_reports", "computed")
+
+
+class Workspace:
+    """Otwarte w tle kosztorysy (poza bieżącym) w kolejności ostatniego użycia.
+
+    Każdy wpis to stan kosztorysu z atrybutów SESSION_ATTRIBUTES menedżera
+    (tabela, plik, flaga zmian, dziennik zmian, historia cofania, blokada).
+    Gdy tabele w pamięci przekraczają `memory_budget` bajtów, najdawniej
+    używane są zrzucane razem z historią cofania do pliku pickle w katalogu
+    tymczasowym (zrzut zachowuje etykiety wierszy i typy kolumn, a kolumny
+    stanów cofania identyczne z tabelą nie są zapisywane ponownie) i wczytywane
+    z powrotem przy przełączeniu. Do limitu liczone są tylko tabele - stany
+    cofania są płytkimi kopiami i współdzielą z nimi niezmienione kolumny.
+    """
+
+    def __init__(self, memory_budget=WORKSPACE_MEMORY_BUDGET_MB * 1024 * 1024):
+        """Tworzy pusty obszar roboczy z limitem pamięci `memory_budget` bajtów."""
+        self.memory_budget = memory_budget
+        self.entries = OrderedDict()
+        self.spill_dir = None
+        self._next_key = 1
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, state):
+        """Dodaje kosztorys do obszaru roboczego; zwraca jego klucz."""
+        key = self._next_key
+        self._next_key += 1
+        state["size"] = int(state["df"].memory_usage(index=True, deep=True).sum())
+        state["rows"] = len(state["df"])
+        state["spill"] = None
+        self.entries[key] = state
+        self._enforce_budget()
+        return key
+
+    def take(self, key):
+        """Usuwa kosztorys z obszaru roboczego i zwraca jego stan (wczytując zrzucone dane z dysku)."""
+        state = self.entries.pop(key)
+        if state["spill"] is not None:
+            with PROFILER.span("workspace.restore", rows=state["rows"]):
+                data = pd.read_pickle(state["spill"])
+                state["df"] = data["df"]
+                state["undo_stack"] = [self._unpack_undo(data["df"], entry) for entry in data["undo_stack"]]
+            os.remove(state["spill"])
+        for field in ("size", "rows", "spill"):
+            state.pop(field)
+        return state
+
+    def discard(self, key):
+        """Zamyka kosztorys bez wczytywania go: usuwa zrzut z dysku i zdejmuje blokadę pliku; zwraca jego stan."""
+        state = self.entries.pop(key)
+        if state["spill"] is not None:
+            os.remove(state["spill"])
+        if state["shared"] is not None:
+            state["shared"].unlock()
+        return state
+
+    def find(self, filename=None, store_table=None):
+        """Zwraca klucz kosztorysu otwartego z pliku `filename` lub tabeli magazynu `store_table` (albo None)."""
+        for key, state in self.entries.items():
+            if (filename and state["filename"] == filename) or (store_table and state["store_table"] == store_table):
+                return key
+        return None
+
+    def memory_in_use(self):
+        """Zwraca łączny rozmiar tabel trzymanych w pamięci (w bajtach)."""
+        return sum(state["size"] for state in self.entries.values() if state["spill"] is None)
+
+    def _enforce_budget(self):
+        """Zrzuca na dysk najdawniej używane tabele, dopóki obszar roboczy przekracza limit pamięci."""
+        for state in self.entries.values():
+            if self.memory_in_use() <= self.memory_budget:
+                break
+            if state["spill"] is None:
+                self._spill(state)
+
+    def _spill(self, state):
+        """Zapisuje tabelę i historię cofania wpisu do pliku tymczasowego i zwalnia je z pamięci."""
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix="wycennik_")
+        fd, path = tempfile.mkstemp(suffix=".pkl", dir=self.spill_dir)
+        os.close(fd)
+        with PROFILER.span("workspace.spill", rows=state["rows"]):
+            undo_stack = [self._pack_undo(state["df"], entry) for entry in state["undo_stack"]]
+            pd.to_pickle({"df": state["df"], "undo_stack": undo_stack}, path)
+        state["spill"] = path
+        state["df"] = state["undo_stack"] = None
+        state["_reports"] = {}
+        state["computed"].reset()
+
+    @staticmethod
+    def _pack_undo(df, entry):
+        """Zastępuje w stanie cofania kolumny identyczne z tabelą `df` odwołaniem (None)."""
+        snapshot = entry["df"]
+        if not snapshot.index.equals(df.index):
+            return entry
+        columns = {col: None if col in df.columns and snapshot[col].equals(df[col]) else snapshot[col]
+                   for col in snapshot.columns}
+        return dict(entry, df=None, columns=columns)
+
+    @staticmethod
+    def _unpack_undo(df, entry):
+        """Odtwarza stan cofania zapisany przez `_pack_undo`."""
+        if entry["df"] is not None:
+            return entry
+        columns = entry.pop("columns")
+        entry["df"] = pd.DataFrame({col: df[col] if values is None else values for col, values in columns.items()},
+                                   index=df.index)
+        return entry
+
+    def close(self):
+        """Zdejmuje blokady plików otwartych w tle i usuwa zrzuty z dysku."""
+        for state in self.entries.values():
+            if state["shared"] is not None:
+                state["shared"].unlock()
+        self.entries.clear()
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+
+
+class ReplayFinished(BaseException):
+    """Skrypt odtwarzanej sesji skończył się, zanim program zakończył pracę.
+
+    Dziedziczy po BaseException (jak KeyboardInterrupt), aby nie przechwyciły go
+    obsługi błędów poszczególnych opcji menu.
+    """
+
+
+class SessionRecorder:
+    """Nagrywa odpowiedzi sesji menu do pliku skryptu (JSON Lines) z czasem wykonania każdego kroku.
+
+    Krok to jedna odpowiedź i praca programu do kolejnego pytania, więc czas kroku nie
+    obejmuje pisania odpowiedzi. Wpis kroku trafia do pliku, gdy program zada następne
+    pytanie (lub przy zakończeniu), dlatego przerwana sesja jest nagrana do ostatniej odpowiedzi.
+    """
+
+    def __init__(self, path=None):
+        """Tworzy rejestrator zapisujący do `path` (bez ścieżki kroki są tylko zbierane w pamięci)."""
+        self.path = os.path.abspath(path) if path else None
+        self.steps = []
+        self._file = open(self.path, "w", encoding="utf-8") if path else None
+        self._answered_at = None
+        atexit.register(self.finish)
+
+    def start_prompt(self):
+        """Kończy pomiar poprzedniego kroku (program zadaje kolejne pytanie) i zapisuje jego wpis."""
+        if self._answered_at is None:
+            return
+        step = self.steps[-1]
+        step["ms"] = round((time.perf_counter() - self._answered_at) * 1000, 3)
+        self._answered_at = None
+        if self._file is not None:
+            self._file.write(json.dumps(step, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def record(self, kind, prompt, value):
+        """Zapamiętuje odpowiedź `value` na pytanie `prompt` ('input' lub 'confirm') i rozpoczyna pomiar kroku."""
+        self.steps.append({"step": len(self.steps) + 1, "kind": kind, "prompt": prompt, "value": value})
+        self._answered_at = time.perf_counter()
+        return self.steps[-1]
+
+    def finish(self):
+        """Zapisuje ostatni krok i zamyka plik skryptu."""
+        self.start_prompt()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SessionReplay(SessionRecorder):
+    """Odtwarza nagraną sesję: podaje menu kolejne odpowiedzi ze skryptu i mierzy czas każdego kroku.
+
+    Raport odtworzenia (`report_path`) ma format skryptu, więc może być odtworzony
+    ponownie i służyć jako punkt odniesienia dla kolejnej wersji programu.
+    """
+
+    def __init__(self, script_path, report_path=None):
+        """Wczytuje skrypt sesji z `script_path` (JSON Lines zapisany przez SessionRecorder)."""
+        self.script = []
+        with open(script_path, encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    step = json.loads(line)
+                    step["value"] = str(step["value"])
+                except (ValueError, KeyError, TypeError):
+                    raise Exception(f"Niepoprawny wiersz {line_no} skryptu sesji {script_path}.")
+                self.script.append(step)
+        super().__init__(report_path)
+        self.mismatches = 0
+
+    def answer(self, kind, prompt):
+        """Zwraca nagraną odpowiedź na kolejne pytanie; ostrzega, gdy program pyta o coś innego niż w nagraniu."""
+        self.start_prompt()
+        if len(self.steps) >= len(self.script):
+            raise ReplayFinished(f"Skrypt sesji skończył się po {len(self.script)} krokach, "
+                                 f"a program pyta dalej: {prompt.strip()}")
+        expected = self.script[len(self.steps)]
+        step = self.record(kind, prompt, expected["value"])
+        if "ms" in expected:
+            step["recorded_ms"] = expected["ms"]
+        if (expected.get("kind", kind), expected.get("prompt", prompt)) != (kind, prompt):
+            step["mismatch"] = True
+            self.mismatches += 1
+            print(f"\nOstrzeżenie: krok {step['step']} w nagraniu odpowiadał na pytanie "
+                  f"{str(expected.get('prompt', '')).strip()!r}.")
+        return step["value"]
+
+    def print_report(self):
+        """Wypisuje czas każdego kroku (z czasem z nagrania, jeśli jest) i podsumowanie odtworzenia."""
+        print("\n=== Czas kroków odtworzonej sesji ===")
+        print(f"{'Krok':>5}  {'Pytanie':<44} {'Odpowiedź':<16} {'ms':>10} {'nagranie':>10} {'zmiana':>8}")
+        total = recorded_total = 0.0
+        for step in self.steps:
+            ms = step.get("ms", 0.0)
+            total += ms
+            prompt = " ".join(step["prompt"].split())
+            prompt = prompt if len(prompt) <= 44 else prompt[:41] + "..."
+            value = step["value"] if len(step["value"]) <= 16 else step["value"][:13] + "..."
+            recorded = step.get("recorded_ms")
+            line = f"{step['step']:>5}  {prompt:<44} {value:<16} {ms:>10.1f}"
+            if recorded is not None:
+                recorded_total += recorded
+                change = f"{(ms - recorded) / recorded * 100:+.0f}%" if recorded >= 1 else ""
+                line += f" {recorded:>10.1f} {change:>8}"
+            if step.get("mismatch"):
+                line += "  (inne pytanie niż w nagraniu)"
+            print(line)
+        summary = f"Kroków: {len(self.steps)} z {len(self.script)}, łączny czas: {total / 1000:.2f} s"
+        if recorded_total:
+            summary += f" (w nagraniu {recorded_total / 1000:.2f} s)"
+        print(summary)
+        if self.mismatches:
+            print(f"Kroki z innym pytaniem niż w nagraniu: {self.mismatches} - sesja mogła przebiec inaczej.")
+        if self.path:
+            print(f"Raport odtworzenia zapisany do: {self.path}")
+
+
 class CostEstimateManager:
     """Klasa do zarządzania kosztorysem w formacie Excel."""
 
-    def __init__(self, initial_path=None):
-        """Inicjalizuje menedżera kosztorysu z pustym DataFrame i flagą modyfikacji."""
+    def __init__(self, initial_path=None, store_path=None, memory_budget_mb=WORKSPACE_MEMORY_BUDGET_MB,
+                 session=None):
+        """Inicjalizuje menedżera kosztorysu z pustym DataFrame i flagą modyfikacji.
+
+        Jeśli podano `store_path`, kosztorysy są otwierane i zapisywane w magazynie SQLite
+        zamiast w plikach .xlsx. `memory_budget_mb` ogranicza pamięć kosztorysów otwartych w tle.
+        `session` (SessionRecorder lub SessionReplay) nagrywa odpowiedzi albo podaje je ze skryptu.
+        """
+        store_path = os.path.abspath(store_path) if store_path else None
         self.filename = None
-        self.df = pd.DataFrame(columns=["Pozycja", "Ilość", "Jednostka", "Cena jednostkowa (PLN)", 
-                                        "Koszt całkowity (PLN)", "Kategoria", "Opis"])
+        self.store = None
+        self.df = pd.DataFrame(columns=COLUMNS)
+        self.computed = ComputedColumns()
+        self.formula_mode = False
+        # Śledzony plik we wspólnym folderze (blokada i wykrywanie zmian z zewnątrz)
+        self.shared = None
+        # Kosztorysy otwarte w tle (bieżący jest w atrybutach menedżera)
+        self.workspace = Workspace(memory_budget_mb * 1024 * 1024)
+        atexit.register(self._close_workspace)
+        self._reset_change_journal()
         self.is_modified = False
+        self.report_sheets = False
         self.current_dir = os.getcwd()
 
-        # Parsowanie ścieżki początkowej
-        if initial_path:
+        # Inicjalizacja PromptSession (odtwarzana sesja nie korzysta z terminala)
+        self.session = session
+        if isinstance(session, SessionReplay):
+            self.prompt_session = None
+        else:
+            self.prompt_session = PromptSession(multiline=False, enable_history_search=True)
+
+        # Parsowanie ścieżki początkowej (błędną ścieżkę można poprawić z podpowiedziami)
+        while initial_path:
             # Normalizacja ścieżki
             initial_path = os.path.normpath(initial_path)
             test_path = initial_path if os.path.isabs(initial_path) else os.path.join(self.current_dir, initial_path)
@@ -37,16 +2414,18 @@ class CostEstimateManager:
                 try:
                     os.chdir(self.current_dir)
                     self.df = self.load_cost_estimate()
+                    self._reset_change_journal()
                     print(f"\n=== Witaj w programie Wycennik! ===")
                     print(f"Bieżący folder: {self.current_dir}")
                     print(f"Kosztorys wczytany z pliku: {os.path.basename(self.filename)}\n")
                     self.display_cost_estimate()
+                    self._validate_after_load()
                 except Exception as e:
                     print(f"Błąd podczas wczytywania pliku {os.path.basename(self.filename)}: {e}")
                     print("Przechodzenie do trybu interaktywnego.\n")
                     self.filename = None
-                    self.df = pd.DataFrame(columns=["Pozycja", "Ilość", "Jednostka", "Cena jednostkowa (PLN)", 
-                                                   "Koszt całkowity (PLN)", "Kategoria", "Opis"])
+                    self.df = pd.DataFrame(columns=COLUMNS)
+                    self._reset_change_journal()
             elif os.path.isdir(test_path):
                 try:
                     os.chdir(test_path)
@@ -59,16 +2438,224 @@ class CostEstimateManager:
                     print(f"Przechodzenie do trybu interaktywnego w bieżącym katalogu: {self.current_dir}\n")
             else:
                 print(f"Ścieżka '{initial_path}' nie wskazuje na istniejący plik .xlsx ani katalog.")
+                corrected = self._get_user_input(
+                    "Popraw ścieżkę (Tab podpowiada) lub wyczyść, aby pozostać w bieżącym katalogu: ",
+                    default=initial_path, completer=self._path_completer()
+                ).strip()
+                if corrected and corrected != initial_path:
+                    initial_path = corrected
+                    continue
                 print(f"Przechodzenie do trybu interaktywnego w bieżącym katalogu: {self.current_dir}\n")
+            break
+
+        # Magazyn SQLite
+        if store_path:
+            try:
+                self.store = SQLiteProjectStore(store_path)
+                print(f"Magazyn kosztorysów SQLite: {self.store.path}")
+            except sqlite3.Error as e:
+                print(f"Błąd podczas otwierania magazynu {store_path}: {e}")
+                print("Kosztorysy będą zapisywane w plikach .xlsx.\n")
+
+        # Indeks nazw pozycji ze wszystkich kosztorysów w folderze roboczym (wczytywany w tle przy pierwszym użyciu)
+        self.position_index = PositionIndex(self.current_dir)
+        # Tabela kursów walut w folderze roboczym (wczytywana raz, ponownie po zmianie pliku)
+        self.rates_path = os.path.join(self.current_dir, EXCHANGE_RATES_FILE)
+        self.templates = TemplateLibrary(os.path.join(self.current_dir, TEMPLATES_DIR))
+        self.history = EstimateHistory(self.current_dir)
+        # Ostatni wpis historii zapisanego kosztorysu z magazynu (podstawa wpisu przy zapisie zmian)
+        self._store_history = None
+
+        if not self.filename:
+            self.select_initial_file()
+
+    def _reset_change_journal(self, keep_undo=False):
+        """Czyści dziennik zmian wierszy (i historię cofania) po wczytaniu lub zastąpieniu całego kosztorysu."""
+        if not keep_undo:
+            self.undo_stack = []
+        self._changed_rows = set()
+        self._deleted_rows = set()
+        self._order_changed = False
+        self._reports = {}
+        self.computed.reset()
+        self.store_table = None
+
+    def _mark_rows_changed(self, labels):
+        """Zapisuje w dzienniku dodane lub zmienione wiersze (etykiety indeksu)."""
+        self._changed_rows.update(labels)
+        self._reports = {}
+        self.computed.mark_dirty(labels)
 
-        # Inicjalizacja PromptSession
-        self.prompt_session = PromptSession(multiline=False, enable_history_search=True)
-        if not self.filename:
-            self.select_initial_file()
+    def _mark_rows_deleted(self, labels):
+        """Zapisuje w dzienniku usunięte wiersze (etykiety indeksu)."""
+        for label in labels:
+            self._changed_rows.discard(label)
+            self._deleted_rows.add(label)
+        self._reports = {}
+
+    def _mark_order_changed(self):
+        """Zapisuje w dzienniku zmianę kolejności wierszy (raporty podają numery pozycji, więc są liczone od nowa)."""
+        self._order_changed = True
+        self._reports = {}
+
+    def _mark_columns_changed(self):
+        """Zapisuje zmianę zestawu kolumn (raport najdroższych pozycji zawiera wszystkie kolumny, więc jest liczony od nowa)."""
+        self._reports = {}
+
+    def _push_undo(self, description):
+        """Zapamiętuje stan kosztorysu przed zmianą `description` (najwyżej UNDO_LIMIT kroków).
+
+        Kopia tabeli jest płytka: przy włączonym copy-on-write dane kopiowane są dopiero przy ich zmianie.
+        """
+        self.undo_stack.append({
+            "description": description, "df": self.df.copy(deep=False), "is_modified": self.is_modified,
+            "changed": set(self._changed_rows), "deleted": set(self._deleted_rows),
+            "order_changed": self._order_changed, "saved": False,
+        })
+        del self.undo_stack[:-UNDO_LIMIT]
+
+    def _mark_undo_saved(self):
+        """Po zapisie oznacza stany w historii cofania jako różne od zapisanego pliku."""
+        for entry in self.undo_stack:
+            entry["is_modified"] = True
+            entry["saved"] = True
+
+    def undo_last_change(self):
+        """Cofa ostatnią zmianę bieżącego kosztorysu."""
+        print("\n=== Cofanie zmiany ===")
+        if not self.undo_stack:
+            print("  Brak zmian do cofnięcia.\n")
+            return
+        entry = self.undo_stack.pop()
+        # Wiersze zmienione od zapamiętanego stanu (po zapisie - wszystkie) trzeba zapisać ponownie
+        touched = (self._changed_rows | self._deleted_rows) - (entry["changed"] | entry["deleted"])
+        if entry["saved"]:
+            touched = touched | set(self.df.index) | set(entry["df"].index)
+        self.df = entry["df"]
+        self._changed_rows = entry["changed"]
+        self._deleted_rows = entry["deleted"]
+        self._order_changed = self._order_changed or entry["order_changed"]
+        self.computed.reset()
+        present = self.df.index.isin(list(touched))
+        self._mark_rows_changed(self.df.index[present])
+        self._mark_rows_deleted(touched - set(self.df.index[present]))
+        self.is_modified = entry["is_modified"]
+        print(f"Cofnięto: {entry['description']}. Pozostało kroków do cofnięcia: {len(self.undo_stack)}.\n")
+        self.display_cost_estimate()
+
+    def _estimate_label(self, state=None):
+        """Zwraca nazwę kosztorysu do wyświetlenia (plik, tabela magazynu lub nowy kosztorys)."""
+        state = state or {"filename": self.filename, "store_table": self.store_table}
+        if state["filename"]:
+            return os.path.basename(state["filename"])
+        if state["store_table"]:
+            return f"magazyn: {state['store_table']}"
+        return "nowy kosztorys"
+
+    def _park_current(self):
+        """Odkłada bieżący kosztorys do obszaru roboczego i zaczyna nowy, pusty.
+
+        Pusty, niezmieniony kosztorys bez pliku nie jest odkładany. Zwraca klucz odłożonego kosztorysu lub None.
+        """
+        key = None
+        if self.filename or self.store_table or self.is_modified or not self.df.empty:
+            key = self.workspace.add({name: getattr(self, name) for name in SESSION_ATTRIBUTES})
+        self.filename = None
+        self.df = pd.DataFrame(columns=COLUMNS)
+        self.shared = None
+        self.computed = ComputedColumns()
+        self._reset_change_journal()
+        self.is_modified = False
+        return key
 
-    def _get_user_input(self, prompt_message, default="", is_filename=False):
+    def _switch_to(self, key):
+        """Przełącza na kosztorys `key` z obszaru roboczego, odkładając bieżący."""
+        state = self.workspace.take(key)
+        self._park_current()
+        for name, value in state.items():
+            setattr(self, name, value)
+        if self.filename:
+            self._enter_file_directory()
+
+    def _switch_to_open(self, filename=None, store_table=None):
+        """Przełącza na kosztorys, jeśli jest już otwarty (bez ponownego wczytywania); zwraca True, jeśli był."""
+        if (filename and filename == self.filename) or (store_table and store_table == self.store_table):
+            print(f"Kosztorys {self._estimate_label()} jest już bieżącym kosztorysem.\n")
+            return True
+        key = self.workspace.find(filename=filename, store_table=store_table)
+        if key is None:
+            return False
+        with PROFILER.span("workspace.switch"):
+            self._switch_to(key)
+        print(f"Przełączono na otwarty kosztorys: {self._estimate_label()} ({len(self.df)} pozycji)\n")
+        return True
+
+    def _close_workspace(self):
+        """Zdejmuje blokady wszystkich otwartych plików i usuwa zrzuty obszaru roboczego."""
+        self._release_shared_file()
+        self.workspace.close()
+
+    def workspace_menu(self):
+        """Pokazuje otwarte kosztorysy i pozwala przełączać się między nimi, otworzyć nowy lub zamknąć kosztorys."""
+        while True:
+            print("\n=== Otwarte kosztorysy ===")
+            flag = ", niezapisane zmiany" if self.is_modified else ""
+            print(f"  * {self._estimate_label()} ({len(self.df)} pozycji{flag}) - bieżący")
+            keys = list(reversed(self.workspace.entries))
+            for idx, key in enumerate(keys, 1):
+                state = self.workspace.entries[key]
+                flags = ", niezapisane zmiany" if state["is_modified"] else ""
+                flags += ", na dysku" if state["spill"] else ""
+                print(f"  {idx}. {self._estimate_label(state)} ({state['rows']} pozycji{flags})")
+            budget = self.workspace.memory_budget / 1024 / 1024
+            print(f"  Pamięć kosztorysów w tle: {self.workspace.memory_in_use() / 1024 / 1024:.1f} MB "
+                  f"z {budget:.0f} MB (starsze są zrzucane na dysk)")
+            choice = self._get_user_input(
+                "Numer kosztorysu aby przełączyć, 'n' - nowy kosztorys, 'z NR' - zamknij, 'q' - powrót: "
+            ).strip().lower()
+            if choice in ('q', ''):
+                print("Powrót do menu.\n")
+                return
+            if choice == 'n':
+                self._park_current()
+                print("Utworzono nowy, pusty kosztorys. Poprzedni pozostaje otwarty w tle.\n")
+                return
+            close = choice.startswith('z')
+            number = choice[1:].strip() if close else choice
+            if not number.isdigit() or not 1 <= int(number) <= len(keys):
+                print(f"Nieprawidłowy wybór. Podaj numer od 1 do {len(keys)}." if keys else "Brak kosztorysów w tle.")
+                continue
+            key = keys[int(number) - 1]
+            if not close:
+                with PROFILER.span("workspace.switch"):
+                    self._switch_to(key)
+                print(f"Przełączono na: {self._estimate_label()} ({len(self.df)} pozycji)\n")
+                return
+            state = self.workspace.entries[key]
+            if state["is_modified"]:
+                confirm = self._get_confirmation(
+                    f"Kosztorys {self._estimate_label(state)} ma niezapisane zmiany. Zamknąć bez zapisu? [t/n]: ")
+                if confirm != 't':
+                    continue
+            state = self.workspace.discard(key)
+            print(f"Zamknięto kosztorys: {self._estimate_label(state)}")
+
+    def _next_row_id(self):
+        """Zwraca etykietę dla nowego wiersza, większą od wszystkich istniejących."""
+        return int(self.df.index.max()) + 1 if len(self.df) else 0
+
+    def _get_user_input(self, prompt_message, default="", is_filename=False, completer=None):
         """Pobiera dane od użytkownika z obsługą strzałek i historii, z sanitizacją."""
-        user_input = self.prompt_session.prompt(prompt_message, default=default)
+        if isinstance(self.session, SessionReplay):
+            user_input = self.session.answer("input", prompt_message)
+            print(prompt_message + user_input)
+        else:
+            if self.session is not None:
+                self.session.start_prompt()
+            user_input = self.prompt_session.prompt(prompt_message, default=default, completer=completer,
+                                                    complete_while_typing=completer is not None)
+            if self.session is not None:
+                self.session.record("input", prompt_message, user_input)
         # Sanitizacja: usuwanie znaków sterujących
         user_input = re.sub(r'[\n\r\t\0]', '', user_input)
         # Ograniczenie długości
@@ -78,9 +2665,63 @@ class CostEstimateManager:
             return ""
         return user_input
 
+    def _position_completer(self):
+        """Zwraca podpowiedzi nazw pozycji i odświeża indeks w tle (czytane są tylko zmienione pliki)."""
+        if self.position_index is None:
+            return None
+        self.position_index.load_async()
+        return PositionCompleter(self.position_index)
+
+    def _path_completer(self, only_directories=False, extensions=(".xlsx",), include_directories=True):
+        """Zwraca podpowiedzi ścieżek względem bieżącego folderu (dla nazw plików bez folderów: include_directories=False)."""
+        return PathCompleter(self.current_dir, only_directories=only_directories, extensions=extensions,
+                             include_directories=include_directories)
+
+    def _pick_path(self, choice, options, directory=False, extensions=(".xlsx",)):
+        """Zwraca element listy `options` wybrany numerem albo ścieżkę wpisaną względem bieżącego folderu.
+
+        Przy błędzie (także pustej odpowiedzi) wypisuje komunikat i zwraca None.
+        """
+        if not choice.strip():
+            print(f"Proszę wpisać numer od 1 do {len(options)}, ścieżkę lub 'q'.")
+            return None
+        if choice.isdigit() and 0 < int(choice) <= len(options):
+            return options[int(choice) - 1]
+        if choice.isdigit() and not os.path.exists(os.path.join(self.current_dir, choice)):
+            print(f"Nieprawidłowy numer. Wybierz od 1 do {len(options)}, wpisz ścieżkę lub 'q'.")
+            return None
+        path = os.path.abspath(os.path.normpath(os.path.join(self.current_dir, os.path.expanduser(choice))))
+        if not path.startswith(os.path.abspath(self.current_dir)):
+            print(f"Ścieżka '{choice}' wykracza poza bieżący katalog.")
+            return None
+        if directory and not os.path.isdir(path):
+            print(f"Folder '{choice}' nie istnieje.")
+            return None
+        if not directory and not (os.path.isfile(path) and path.lower().endswith(extensions)):
+            print(f"Plik '{choice}' nie istnieje lub nie ma rozszerzenia {', '.join(extensions)}.")
+            return None
+        return path
+
+    def _enter_file_directory(self):
+        """Ustawia folder wczytanego pliku jako bieżący (plik mógł zostać wskazany ścieżką w podfolderze)."""
+        file_dir = os.path.dirname(self.filename)
+        if file_dir != self.current_dir:
+            os.chdir(file_dir)
+            self.current_dir = file_dir
+            print(f"Bieżący folder: {self.current_dir}")
+
     def _get_confirmation(self, prompt_message):
         """Pobiera potwierdzenie (t/n) od użytkownika."""
-        return input(prompt_message).lower()
+        if isinstance(self.session, SessionReplay):
+            answer = self.session.answer("confirm", prompt_message)
+            print(prompt_message + answer)
+            return answer.lower()
+        if self.session is not None:
+            self.session.start_prompt()
+        answer = input(prompt_message)
+        if self.session is not None:
+            self.session.record("confirm", prompt_message, answer)
+        return answer.lower()
 
     def _validate_float(self, value, error_message):
         """Waliduje, czy wartość jest liczbą zmiennoprzecinkową w dopuszczalnym zakresie."""
@@ -152,812 +2793,2085 @@ class CostEstimateManager:
 
     def list_excel_files(self):
         """Wyświetla listę plików .xlsx w bieżącym folderze posortowaną według daty modyfikacji."""
-        excel_files = [f for f in glob.glob(os.path.join(self.current_dir, "*.xlsx")) if os.path.isfile(f)]
+        excel_files = DIRECTORY_CACHE.files(self.current_dir, (".xlsx",))
+        
+        if not excel_files:
+            print(f"  Brak plików .xlsx w folderze: {self.current_dir}")
+            return []
+        
+        excel_files = sorted(excel_files, key=lambda f: os.path.getmtime(f), reverse=True)
+        
+        print(f"\n  Dostępne pliki Excel w folderze {self.current_dir} (posortowane według daty modyfikacji):")
+        for idx, file in enumerate(excel_files, 1):
+            mod_time = datetime.fromtimestamp(os.path.getmtime(file)).strftime("%Y-%m-%d %H:%M:%S")
+            print(f"    {idx}. {os.path.basename(file)} (zmodyfikowany: {mod_time})")
+        
+        return excel_files
+
+    def list_directories(self):
+        """Wyświetla listę folderów w bieżącym katalogu, w tym '..' dla rodzica."""
+        dirs = [d for d in DIRECTORY_CACHE.subdirectories(self.current_dir) if not os.path.basename(d).startswith(".")]
+        parent_dir = os.path.dirname(self.current_dir)
+        dir_list = [".."] + sorted(dirs)
+        
+        print(f"\n  Foldery w bieżącym katalogu: {self.current_dir}")
+        for idx, dir_path in enumerate(dir_list, 1):
+            dir_name = os.path.basename(dir_path) if dir_path != ".." else ".."
+            print(f"    {idx}. {dir_name}")
+        
+        return dir_list
+
+    def change_directory(self):
+        """Zmienia bieżący katalog na wybrany przez użytkownika."""
+        print("\n=== Zmiana folderu ===")
+        dir_list = self.list_directories()
+        if not dir_list:
+            print("  Brak folderów do wyboru.\n")
+            return
+
+        while True:
+            choice = self._get_user_input("Wpisz numer folderu lub ścieżkę (Tab podpowiada), 'q' aby anulować: ",
+                                          completer=self._path_completer(only_directories=True))
+            if choice.lower() == 'q':
+                print("Anulowano. Powrót do menu.\n")
+                return
+            new_dir = self._pick_path(choice, dir_list, directory=True)
+            if new_dir is None:
+                continue
+            if new_dir == "..":
+                new_dir = os.path.dirname(self.current_dir)
+            # Normalizacja i sprawdzanie ścieżki
+            new_dir = os.path.abspath(os.path.normpath(new_dir))
+            if not new_dir.startswith(os.path.abspath(self.current_dir)):
+                print(f"Ścieżka '{new_dir}' wykracza poza bieżący katalog.")
+                continue
+            try:
+                os.chdir(new_dir)
+                self.current_dir = os.getcwd()
+                print(f"Zmieniono folder na: {self.current_dir}\n")
+                if self._park_current() is not None:
+                    print("Poprzedni kosztorys pozostaje otwarty w tle (opcja 'Otwarte kosztorysy').")
+                self.list_excel_files()
+                break
+            except Exception as e:
+                print(f"Błąd podczas zmiany folderu: {e}")
+
+    def create_directory(self):
+        """Tworzy nowy katalog w bieżącym folderze."""
+        print("\n=== Tworzenie nowego folderu ===")
+        while True:
+            folder_name = self._get_user_input("Podaj nazwę nowego folderu ('q' aby anulować): ", is_filename=True,
+                                               completer=self._path_completer(only_directories=True))
+            if folder_name.lower() == 'q':
+                print("Anulowano. Powrót do menu.\n")
+                return
+            folder_name = self._validate_folder_name(folder_name.strip())
+            if not folder_name:
+                continue
+            folder_path = os.path.abspath(os.path.normpath(os.path.join(self.current_dir, folder_name)))
+            if not folder_path.startswith(os.path.abspath(self.current_dir)):
+                print(f"Nazwa folderu '{folder_name}' wykracza poza bieżący katalog.")
+                continue
+            try:
+                os.makedirs(folder_path, exist_ok=True)
+                print(f"Utworzono folder: {folder_path}\n")
+                break
+            except OSError as e:
+                print(f"Błąd podczas tworzenia folderu '{folder_name}': {e}")
+                print("Spróbuj ponownie lub wpisz 'q' aby anulować.")
+
+    def move_cost_estimate(self):
+        """Przenosi aktualny kosztorys do wybranego folderu."""
+        print("\n=== Przenoszenie kosztorysu ===")
+        if self.store:
+            print("  Kosztorysy w magazynie SQLite nie są przechowywane w folderach. Użyj zmiany nazwy.\n")
+            return
+        if not self.filename:
+            print("  Brak wczytanego kosztorysu. Najpierw otwórz lub zapisz kosztorys.\n")
+            return
+
+        dir_list = self.list_directories()
+        if not dir_list:
+            print("  Brak folderów do wyboru. Utwórz folder lub zmień bieżący katalog.\n")
+            return
+
+        while True:
+            choice = self._get_user_input("Wpisz numer folderu docelowego lub ścieżkę (Tab podpowiada), 'q' aby anulować: ",
+                                          completer=self._path_completer(only_directories=True))
+            if choice.lower() == 'q':
+                print("Anulowano. Powrót do menu.\n")
+                return
+            dest_dir = self._pick_path(choice, dir_list, directory=True)
+            if dest_dir is None:
+                continue
+            if dest_dir == "..":
+                dest_dir = os.path.dirname(self.current_dir)
+            # Normalizacja i sprawdzanie ścieżki
+            dest_dir = os.path.abspath(os.path.normpath(dest_dir))
+            if not dest_dir.startswith(os.path.abspath(self.current_dir)):
+                print(f"Ścieżka '{dest_dir}' wykracza poza bieżący katalog.")
+                continue
+            break
+
+        source_path = os.path.abspath(os.path.normpath(self.filename))
+        dest_path = os.path.abspath(os.path.normpath(os.path.join(dest_dir, os.path.basename(self.filename))))
+
+        if not dest_path.startswith(os.path.abspath(self.current_dir)):
+            print(f"Ścieżka docelowa '{dest_path}' wykracza poza bieżący katalog.")
+            return
+
+        if not os.access(dest_dir, os.W_OK):
+            print(f"Brak uprawnień do zapisu w folderze docelowym: {dest_dir}")
+            print("Powrót do menu.\n")
+            return
+
+        if not os.access(source_path, os.R_OK) or not os.access(os.path.dirname(source_path), os.W_OK):
+            print(f"Brak uprawnień do odczytu pliku źródłowego lub usunięcia z folderu: {os.path.dirname(source_path)}")
+            print("Powrót do menu.\n")
+            return
+
+        try:
+            if os.path.exists(dest_path):
+                print(f"Plik '{os.path.basename(self.filename)}' już istnieje w folderze {dest_dir}.")
+                confirm = self._get_confirmation("Czy chcesz nadpisać plik? [t/n]: ")
+                if confirm != 't':
+                    print("Anulowano. Powrót do menu.\n")
+                    return
+            shutil.move(source_path, dest_path)
+            self.filename = dest_path
+            if self.shared is not None:
+                self.shared.moved(dest_path)
+            self.current_dir = dest_dir
+            os.chdir(self.current_dir)
+            print(f"Kosztorys przeniesiony do: {os.path.basename(self.filename)}\n")
+        except OSError as e:
+            print(f"Błąd podczas przenoszenia pliku: {e}")
+            print("Powrót do menu.\n")
+
+    def rename_cost_estimate(self):
+        """Zmienia nazwę aktualnego kosztorysu w bieżącym folderze."""
+        print("\n=== Zmiana nazwy kosztorysu ===")
+        if self.store:
+            self.rename_store_estimate()
+            return
+        if not self.filename:
+            print("  Brak wczytanego kosztorysu. Najpierw otwórz lub zapisz kosztorys.\n")
+            return
+
+        default_name = os.path.basename(self.filename)
+        while True:
+            new_filename = self._get_user_input(
+                f"Podaj nową nazwę pliku w folderze {self.current_dir} (Enter dla '{default_name}', 'q' aby anulować): ",
+                default=default_name, is_filename=True, completer=self._path_completer(include_directories=False)
+            )
+            if new_filename.lower() == 'q':
+                print("Anulowano. Powrót do menu.\n")
+                return
+            if not new_filename.strip() or new_filename == default_name:
+                print("Nazwa pliku nie zmieniona. Powrót do menu.\n")
+                return
+            new_filename = self._validate_filename(new_filename.strip())
+            if new_filename:
+                break
+            print("Spróbuj ponownie.")
+
+        new_path = os.path.abspath(os.path.normpath(os.path.join(self.current_dir, new_filename)))
+        if not new_path.startswith(os.path.abspath(self.current_dir)):
+            print(f"Nowa nazwa pliku '{new_filename}' wykracza poza bieżący katalog.")
+            return
+
+        try:
+            if os.path.exists(new_path):
+                print(f"Plik '{new_filename}' już istnieje w folderze {self.current_dir}.")
+                confirm = self._get_confirmation("Czy chcesz nadpisać plik? [t/n]: ")
+                if confirm != 't':
+                    print("Anulowano. Powrót do menu.\n")
+                    return
+            os.rename(self.filename, new_path)
+            self.filename = new_path
+            if self.shared is not None:
+                self.shared.moved(new_path)
+            print(f"Nazwa kosztorysu zmieniona na: {os.path.basename(self.filename)}\n")
+        except OSError as e:
+            print(f"Błąd podczas zmiany nazwy pliku: {e}")
+            print("Powrót do menu.\n")
+
+    def delete_cost_estimate(self):
+        """Usuwa wybrany plik kosztorysu z bieżącego folderu."""
+        print("\n=== Usuwanie pliku kosztorysu ===")
+        if self.store:
+            self.delete_store_estimate()
+            return
+        excel_files = self.list_excel_files()
+        if not excel_files:
+            print("  Brak plików do usunięcia.\n")
+            return
+
+        while True:
+            choice = self._get_user_input("\nWpisz numer pliku do usunięcia lub 'q' aby anulować: ")
+            if choice.lower() == 'q':
+                print("Anulowano. Powrót do menu.\n")
+                return
+            try:
+                file_idx = int(choice) - 1
+                if 0 <= file_idx < len(excel_files):
+                    file_to_delete = os.path.abspath(os.path.normpath(excel_files[file_idx]))
+                    # Sprawdzanie, czy plik jest w bieżącym katalogu
+                    if not file_to_delete.startswith(os.path.abspath(self.current_dir)):
+                        print(f"Plik '{os.path.basename(file_to_delete)}' znajduje się poza bieżącym katalogiem.")
+                        print("Powrót do menu.\n")
+                        return
+                    file_name = os.path.basename(file_to_delete)
+                    while True:
+                        confirm = self._get_confirmation(f"Czy na pewno chcesz usunąć plik '{file_name}'? [t/n]: ")
+                        if confirm == 't':
+                            try:
+                                os.remove(file_to_delete)
+                                print(f"Plik '{file_name}' usunięty pomyślnie!\n")
+                                if self.filename and os.path.abspath(self.filename) == file_to_delete:
+                                    print("Usunięto aktualnie wczytany kosztorys. Tworzenie nowego kosztorysu.\n")
+                                    self.filename = None
+                                    self.df = pd.DataFrame(columns=COLUMNS)
+                                    self._reset_change_journal()
+                                    self.is_modified = False
+                                break
+                            except PermissionError:
+                                print(f"Brak uprawnień do usunięcia pliku '{file_name}' lub plik jest w użyciu.")
+                                print("Powrót do menu.\n")
+                                return
+                            except OSError as e:
+                                print(f"Błąd podczas usuwania pliku '{file_name}': {e}")
+                                print("Powrót do menu.\n")
+                                return
+                        elif confirm == 'n' or confirm == 'q':
+                            print("Anulowano. Powrót do menu.\n")
+                            return
+                        else:
+                            print("Proszę wpisać 't' (tak), 'n' (nie) lub 'q' (anuluj).")
+                    break
+                else:
+                    print(f"Nieprawidłowy numer. Wybierz od 1 do {len(excel_files)} lub 'q'.")
+            except ValueError:
+                print("Proszę wpisać poprawną liczbę lub 'q'.")
+
+    def select_initial_file(self):
+        """Wybiera plik Excel w trybie interaktywnym."""
+        if self.store and self.open_store_estimate(allow_new=True):
+            return
+        excel_files = self.list_excel_files()
         
         if not excel_files:
-            print(f"  Brak plików .xlsx w folderze: {self.current_dir}")
-            return []
-        
-        excel_files = sorted(excel_files, key=lambda f: os.path.getmtime(f), reverse=True)
-        
-        print(f"\n  Dostępne pliki Excel w folderze {self.current_dir} (posortowane według daty modyfikacji):")
-        for idx, file in enumerate(excel_files, 1):
-            mod_time = datetime.fromtimestamp(os.path.getmtime(file)).strftime("%Y-%m-%d %H:%M:%S")
-            print(f"    {idx}. {os.path.basename(file)} (zmodyfikowany: {mod_time})")
-        
-        return excel_files
+            if self.templates.names():
+                choice = self._get_user_input("\nEnter dla nowego pustego kosztorysu lub 's' dla nowego z szablonu: ")
+                if choice.lower() == 's' and self.new_from_template():
+                    return
+            print("  Brak plików. Tworzenie nowego kosztorysu.\n")
+            self.is_modified = False
+            return
 
-    def list_directories(self):
-        """Wyświetla listę folderów w bieżącym katalogu, w tym '..' dla rodzica."""
-        dirs = [d for d in glob.glob(os.path.join(self.current_dir, "*")) if os.path.isdir(d)]
-        parent_dir = os.path.dirname(self.current_dir)
-        dir_list = [".."] + sorted(dirs)
-        
-        print(f"\n  Foldery w bieżącym katalogu: {self.current_dir}")
-        for idx, dir_path in enumerate(dir_list, 1):
-            dir_name = os.path.basename(dir_path) if dir_path != ".." else ".."
-            print(f"    {idx}. {dir_name}")
-        
-        return dir_list
+        while True:
+            choice = self._get_user_input("\nWpisz numer pliku lub ścieżkę (Tab podpowiada), Enter dla nowego kosztorysu, 's' dla nowego z szablonu lub 'q' aby anulować: ",
+                                          completer=self._path_completer())
+            if choice.lower() == 's':
+                if self.new_from_template():
+                    return
+                continue
+            if choice.lower() == 'q':
+                print("Anulowano. Tworzenie nowego kosztorysu.\n")
+                self.filename = None
+                self.df = pd.DataFrame(columns=COLUMNS)
+                self._reset_change_journal()
+                self.is_modified = False
+                return
+            if not choice:
+                print("Tworzenie nowego kosztorysu.\n")
+                self.filename = None
+                self.df = pd.DataFrame(columns=COLUMNS)
+                self._reset_change_journal()
+                self.is_modified = False
+                return
+            
+            selected = self._pick_path(choice, excel_files)
+            if selected is None:
+                continue
+            self.filename = os.path.abspath(os.path.normpath(selected))
+            if not self.filename.startswith(os.path.abspath(self.current_dir)):
+                print(f"Plik '{os.path.basename(self.filename)}' znajduje się poza bieżącym katalogiem.")
+                continue
+            try:
+                self.df = self.load_cost_estimate()
+                self._reset_change_journal()
+                self._enter_file_directory()
+                print(f"\nKosztorys wczytany z pliku: {os.path.basename(self.filename)}\n")
+                self.is_modified = False
+                self.display_cost_estimate()
+                self._validate_after_load()
+                return
+            except Exception as e:
+                print(f"Błąd podczas wczytywania pliku {os.path.basename(self.filename)}: {e}")
+                print("Tworzenie nowego kosztorysu.\n")
+                self.filename = None
+                self.df = pd.DataFrame(columns=COLUMNS)
+                self._reset_change_journal()
+                self.is_modified = False
+                return
 
-    def change_directory(self):
-        """Zmienia bieżący katalog na wybrany przez użytkownika."""
-        print("\n=== Zmiana folderu ===")
-        dir_list = self.list_directories()
-        if not dir_list:
-            print("  Brak folderów do wyboru.\n")
+    def load_cost_estimate(self):
+        """Ładuje kosztorys z pliku lub zgłasza błąd, jeśli plik niepoprawny."""
+        if not self.filename or not os.path.exists(self.filename):
+            raise Exception(f"Plik {os.path.basename(self.filename)} nie istnieje.")
+        with PROFILER.span("load", file=os.path.basename(self.filename)):
+            df = read_cost_estimate(self.filename)
+        self._track_shared_file(df)
+        return df
+
+    def _track_shared_file(self, df, fingerprint=None):
+        """Zakłada blokadę bieżącego pliku i zapamiętuje jego stan po wczytaniu lub zapisie `df`."""
+        if self.shared is not None and self.shared.path != self.filename:
+            self._release_shared_file()
+        if self.shared is None:
+            self.shared = SharedFile(self.filename, df)
+            self.shared.lock()
+        else:
+            self.shared.remember(df, fingerprint)
+            if not self.shared.owns_lock:
+                self.shared.lock()
+        owner = self.shared.lock_owner
+        if owner:
+            print(f"Uwaga: plik {os.path.basename(self.filename)} jest otwarty także przez "
+                  f"{owner.get('user', '?')} ({owner.get('host', '?')}) od {owner.get('ts', '?')}. "
+                  "Zmiany wprowadzone przez obie osoby zostaną wykryte przed zapisem.")
+
+    def _release_shared_file(self):
+        """Zdejmuje blokadę śledzonego pliku i kończy jego śledzenie."""
+        if self.shared is not None:
+            self.shared.unlock()
+            self.shared = None
+
+    def _check_external_change(self):
+        """Sprawdza, czy bieżący plik zmienił się poza programem, i proponuje scalenie zmian."""
+        if self.shared is not None and self.shared.path != self.filename:
+            self._release_shared_file()
+        if self.shared is None or not self.shared.poll():
+            return
+        print(f"\nPlik {os.path.basename(self.filename)} został zmieniony poza programem.")
+        if self._get_confirmation("Czy wczytać zmiany i scalić je z kosztorysem? [t/n]: ") == 't':
+            if self._merge_external_changes() and self.is_modified:
+                print("Twoje niezapisane zmiany zostały zachowane. Zapisz kosztorys, aby je utrwalić.\n")
+        else:
+            print("Zmiany z pliku nie zostały wczytane. Przed zapisem pojawi się ponowne pytanie.\n")
+
+    def _merge_external_changes(self):
+        """Wczytuje plik zmieniony z zewnątrz i scala różnice wierszy z kosztorysem w pamięci.
+
+        Wiersze bez zmian zostają na miejscu (z zachowaniem dziennika zmian i
+        kolumn obliczanych), wczytywane są tylko dodane i usuwane są tylko
+        usunięte w pliku. Zwraca False, jeśli pliku nie udało się wczytać.
+        """
+        fingerprint = self.shared.fingerprint()
+        try:
+            with PROFILER.span("load", file=os.path.basename(self.filename)):
+                external = read_cost_estimate(self.filename)
+        except Exception as e:
+            print(f"{e}\n")
+            return False
+        with PROFILER.span("merge_external", rows=len(self.df)):
+            merged, added, removed, conflicts = merge_external_changes(
+                self.df, self.shared.base_hashes, external, next_id=self._next_row_id(),
+                keep_file_order=not self.is_modified)
+        reordered = not merged.index.equals(self.df.index.drop(removed).append(pd.Index(added)))
+        self._push_undo("wczytanie zmian z pliku")
+        self.df = merged
+        self._mark_rows_deleted(removed)
+        self._mark_rows_changed(added)
+        self._order_changed = self._order_changed or reordered
+        self.shared.remember(external, fingerprint)
+        print(f"  Wczytano zmiany z pliku: dodane wiersze: {len(added)}, usunięte wiersze: {len(removed)}.")
+        if not conflicts.empty:
+            print("  Pozycje zmienione zarówno w pliku, jak i w programie (sprawdź, czy nie są powtórzone):")
+            print(conflicts.head(50).to_string(index=False))
+            if len(conflicts) > 50:
+                print(f"  ... i {len(conflicts) - 50} kolejnych")
+        print()
+        return True
+
+    def _confirm_overwrite_external(self):
+        """Przed zapisem sprawdza, czy plik zmienił się od wczytania; pozwala scalić zmiany, nadpisać lub anulować."""
+        if self.shared is None or self.shared.path != self.filename or not self.shared.changed_since_sync():
+            return True
+        print(f"  Plik {os.path.basename(self.filename)} został zmieniony poza programem od ostatniego wczytania.")
+        while True:
+            choice = self._get_user_input("  1 - scal zmiany i zapisz, 2 - nadpisz plik, 'q' - anuluj: ").strip().lower()
+            if choice == '1':
+                return self._merge_external_changes()
+            if choice == '2':
+                return True
+            if choice == 'q':
+                print("Anulowano. Powrót do menu.\n")
+                return False
+            print("Proszę wpisać 1, 2 lub 'q'.")
+
+    def open_cost_estimate(self):
+        """Wczytuje kosztorys z pliku Excel po numerze."""
+        print("\n=== Otwieranie kosztorysu ===")
+        if self.store and self.open_store_estimate():
+            return
+        excel_files = self.list_excel_files()
+        if not excel_files:
+            print("  Brak plików do wczytania. Tworzenie nowego kosztorysu.\n")
+            self._park_current()
             return
 
         while True:
-            choice = self._get_user_input("Wpisz numer folderu lub 'q' aby anulować: ")
+            choice = self._get_user_input("\nWpisz numer pliku lub ścieżkę (Tab podpowiada), 'q' aby anulować: ",
+                                          completer=self._path_completer())
             if choice.lower() == 'q':
                 print("Anulowano. Powrót do menu.\n")
                 return
+            selected = self._pick_path(choice, excel_files)
+            if selected is None:
+                continue
+            path = os.path.abspath(os.path.normpath(selected))
+            if not path.startswith(os.path.abspath(self.current_dir)):
+                print(f"Plik '{os.path.basename(path)}' znajduje się poza bieżącym katalogiem.")
+                continue
+            if self._switch_to_open(filename=path):
+                self.display_cost_estimate()
+                break
+            # Bieżący kosztorys pozostaje otwarty w tle (opcja 'Otwarte kosztorysy')
+            previous = self._park_current()
+            self.filename = path
             try:
-                dir_idx = int(choice) - 1
-                if 0 <= dir_idx < len(dir_list):
-                    new_dir = dir_list[dir_idx]
-                    if new_dir == "..":
-                        new_dir = os.path.dirname(self.current_dir)
-                    # Normalizacja i sprawdzanie ścieżki
-                    new_dir = os.path.abspath(os.path.normpath(new_dir))
-                    if not new_dir.startswith(os.path.abspath(self.current_dir)):
-                        print(f"Ścieżka '{new_dir}' wykracza poza bieżący katalog.")
+                self.df = self.load_cost_estimate()
+                self._reset_change_journal()
+                self._enter_file_directory()
+                print(f"\nKosztorys wczytany z pliku: {os.path.basename(self.filename)}\n")
+                self.is_modified = False
+                self.display_cost_estimate()
+                self._validate_after_load()
+                break
+            except Exception as e:
+                print(f"Błąd podczas wczytywania pliku {os.path.basename(self.filename)}: {e}")
+                self.filename = None
+                if previous is not None:
+                    self._switch_to(previous)
+                    print(f"Powrót do kosztorysu: {self._estimate_label()}\n")
+                break
+
+    def browse_cost_estimate(self):
+        """Przegląda duży kosztorys stronami bez wczytywania całego pliku, z opcją wczytania go do edycji."""
+        print("\n=== Przeglądanie kosztorysu (tylko odczyt) ===")
+        excel_files = self.list_excel_files()
+        if not excel_files:
+            print("  Brak plików do przeglądania.\n")
+            return
+        while True:
+            choice = self._get_user_input("\nWpisz numer pliku lub ścieżkę (Tab podpowiada), 'q' aby anulować: ",
+                                          completer=self._path_completer())
+            if choice.lower() == 'q':
+                print("Anulowano. Powrót do menu.\n")
+                return
+            selected = self._pick_path(choice, excel_files)
+            if selected is None:
+                continue
+            path = os.path.abspath(os.path.normpath(selected))
+            if not path.startswith(os.path.abspath(self.current_dir)):
+                print(f"Plik '{os.path.basename(path)}' znajduje się poza bieżącym katalogiem.")
+                continue
+            break
+        try:
+            viewer = EstimateViewer(path)
+        except Exception as e:
+            print(f"Błąd podczas otwierania pliku {os.path.basename(path)}: {e}\n")
+            return
+
+        start = 0
+        try:
+            while True:
+                with PROFILER.span("browse.page", start=start):
+                    page = viewer.page(start)
+                if page.empty:
+                    print("  Kosztorys jest pusty.\n")
+                    return
+                print(f"\n=== {os.path.basename(path)} (tylko odczyt) ===")
+                print(page.to_string(index=False))
+                total = f"{viewer.indexed}" if viewer.complete else f"co najmniej {viewer.indexed}"
+                print(f"  Pozycje {start + 1}-{start + len(page)} z {total}")
+                if viewer.complete:
+                    print(f"  Łączny koszt: {viewer.total_cost:.2f} PLN")
+                choice = self._get_user_input(
+                    "Enter - następna strona, 'p' - poprzednia, numer pozycji - skok, 'k' - ostatnia strona, "
+                    "'e' - wczytaj do edycji, 'q' - wyjście: "
+                ).lower()
+                if choice == 'q':
+                    print("Powrót do menu.\n")
+                    return
+                elif choice == '':
+                    if viewer.complete and start + VIEWER_PAGE_SIZE >= viewer.indexed:
+                        print("To jest ostatnia strona.")
+                    else:
+                        start += VIEWER_PAGE_SIZE
+                elif choice == 'p':
+                    start = max(0, start - VIEWER_PAGE_SIZE)
+                elif choice == 'k':
+                    with PROFILER.span("browse.index"):
+                        count = viewer.count_all()
+                    start = max(0, count - VIEWER_PAGE_SIZE)
+                elif choice == 'e':
+                    if self.is_modified:
+                        confirm = self._get_confirmation("Bieżący kosztorys ma niezapisane zmiany. Kontynuować? [t/n]: ")
+                        if confirm != 't':
+                            continue
+                    viewer.close()
+                    self._load_for_edit(path)
+                    return
+                elif choice.isdigit():
+                    number = int(choice)
+                    if number < 1:
+                        print("Numer pozycji musi być większy od 0.")
                         continue
-                    try:
-                        os.chdir(new_dir)
-                        self.current_dir = os.getcwd()
-                        print(f"Zmieniono folder na: {self.current_dir}\n")
-                        self.filename = None
-                        self.df = pd.DataFrame(columns=["Pozycja", "Ilość", "Jednostka", "Cena jednostkowa (PLN)", 
-                                                       "Koszt całkowity (PLN)", "Kategoria", "Opis"])
-                        self.is_modified = False
-                        self.list_excel_files()
-                        break
-                    except Exception as e:
-                        print(f"Błąd podczas zmiany folderu: {e}")
+                    viewer.page(number - 1, 1)
+                    if number > viewer.indexed:
+                        print(f"Kosztorys ma tylko {viewer.indexed} pozycji.")
+                        continue
+                    start = number - 1
                 else:
-                    print(f"Nieprawidłowy numer. Wybierz od 1 do {len(dir_list)} lub 'q'.")
-            except ValueError:
-                print("Proszę wpisać poprawną liczbę lub 'q'.")
+                    print("Nieprawidłowa opcja.")
+        finally:
+            viewer.close()
 
-    def create_directory(self):
-        """Tworzy nowy katalog w bieżącym folderze."""
-        print("\n=== Tworzenie nowego folderu ===")
+    def _load_for_edit(self, path):
+        """Wczytuje cały plik kosztorysu do edycji (np. po przeglądaniu w trybie tylko do odczytu)."""
+        if self._switch_to_open(filename=path):
+            return
+        previous = self._park_current()
+        self.filename = path
+        try:
+            df = self.load_cost_estimate()
+        except Exception as e:
+            print(f"Błąd podczas wczytywania pliku {os.path.basename(path)}: {e}\n")
+            self.filename = None
+            if previous is not None:
+                self._switch_to(previous)
+            return
+        self.df = df
+        self._enter_file_directory()
+        print(f"\nKosztorys wczytany z pliku: {os.path.basename(path)} ({len(self.df)} pozycji)\n")
+        self._validate_after_load()
+
+    def display_cost_estimate(self):
+        """Wyświetla aktualny kosztorys z numerami pozycji."""
+        print("\n=== Aktualny kosztorys ===")
+        if self.df.empty:
+            print("  Kosztorys jest pusty.\n")
+        else:
+            with PROFILER.span("display", rows=len(self.df)):
+                display_df = self.df.copy()
+                display_df.insert(0, "Nr", range(1, len(display_df) + 1))
+                print(display_df.to_string(index=False))
+                print(f"  Łączny koszt: {self.df['Koszt całkowity (PLN)'].sum():.2f} PLN\n")
+            if self._computed_enabled():
+                self._print_computed_totals()
+            if self._currency_enabled():
+                self._print_currency_totals()
+
+    def add_item(self):
+        """Dodaje nową pozycję do kosztorysu."""
+        print("\n=== Dodawanie nowej pozycji ===")
+        completer = self._position_completer()
         while True:
-            folder_name = self._get_user_input("Podaj nazwę nowego folderu ('q' aby anulować): ", is_filename=True)
-            if folder_name.lower() == 'q':
+            pozycja = self._get_user_input("Nazwa pozycji ('q' aby anulować): ", completer=completer)
+            if pozycja.lower() == 'q':
                 print("Anulowano. Powrót do menu.\n")
                 return
-            folder_name = self._validate_folder_name(folder_name.strip())
-            if not folder_name:
+            if len(pozycja) > 1000:
+                print("Nazwa pozycji jest za długa (maks. 1000 znaków).")
                 continue
-            folder_path = os.path.abspath(os.path.normpath(os.path.join(self.current_dir, folder_name)))
-            if not folder_path.startswith(os.path.abspath(self.current_dir)):
-                print(f"Nazwa folderu '{folder_name}' wykracza poza bieżący katalog.")
+            if pozycja.strip():
+                break
+            print("Nazwa pozycji nie może być pusta.")
+        last_used = self.position_index.lookup(pozycja) if self.position_index is not None else None
+        if last_used:
+            print(f"  Ostatnio użyto: jednostka '{last_used[0]}', kategoria '{last_used[1]}', cena {last_used[2]:.2f} PLN")
+
+        while True:
+            ilosc_input = self._get_user_input("Ilość (Enter dla 1, 'q' aby anulować): ", default="1")
+            if ilosc_input.lower() == 'q':
+                print("Anulowano. Powrót do menu.\n")
+                return
+            if not ilosc_input:
+                ilosc = 1.0
+                break
+            ilosc = self._validate_float(ilosc_input, "Proszę podać poprawną wartość liczbową lub 'q'.")
+            if ilosc is not None:
+                break
+
+        units = UNITS
+        print("\n  Dostępne jednostki:")
+        for idx, unit in enumerate(units, 1):
+            print(f"    {idx}. {unit}")
+        
+        while True:
+            unit_choice = self._get_user_input("\nWpisz numer jednostki lub własną jednostkę ('q' aby anulować): ",
+                                               default=last_used[0] if last_used else "")
+            if unit_choice.lower() == 'q':
+                print("Anulowano. Powrót do menu.\n")
+                return
+            if len(unit_choice) > 50:
+                print("Jednostka jest za długa (maks. 50 znaków).")
                 continue
             try:
-                os.makedirs(folder_path, exist_ok=True)
-                print(f"Utworzono folder: {folder_path}\n")
+                unit_idx = int(unit_choice) - 1
+                if 0 <= unit_idx < len(units):
+                    jednostka = units[unit_idx]
+                    break
+                else:
+                    print(f"Nieprawidłowy numer. Wybierz od 1 do {len(units)}, wpisz własną jednostkę lub 'q'.")
+            except ValueError:
+                jednostka = unit_choice
+                if jednostka.strip():
+                    break
+                else:
+                    print("Proszę wpisać poprawną jednostkę, numer lub 'q'.")
+
+        waluta, kurs = BASE_CURRENCY, 1.0
+        if self._currency_enabled():
+            selected = self._ask_currency(BASE_CURRENCY)
+            if selected is None:
+                print("Anulowano. Powrót do menu.\n")
+                return
+            waluta, kurs = selected
+
+        while True:
+            cena_default = str(last_used[2]) if last_used and waluta == BASE_CURRENCY else "0"
+            cena_input = self._get_user_input(f"Cena jednostkowa ({waluta}) (Enter dla {cena_default}, 'q' aby anulować): ", default=cena_default)
+            if cena_input.lower() == 'q':
+                print("Anulowano. Powrót do menu.\n")
+                return
+            if not cena_input:
+                cena_jednostkowa = 0.0
+                break
+            cena_jednostkowa = self._validate_float(cena_input, "Proszę podać poprawną wartość liczbową lub 'q'.")
+            if cena_jednostkowa is not None:
                 break
-            except OSError as e:
-                print(f"Błąd podczas tworzenia folderu '{folder_name}': {e}")
-                print("Spróbuj ponownie lub wpisz 'q' aby anulować.")
 
-    def move_cost_estimate(self):
-        """Przenosi aktualny kosztorys do wybranego folderu."""
-        print("\n=== Przenoszenie kosztorysu ===")
-        if not self.filename:
-            print("  Brak wczytanego kosztorysu. Najpierw otwórz lub zapisz kosztorys.\n")
+        cena_waluta = cena_jednostkowa
+        if waluta != BASE_CURRENCY:
+            cena_jednostkowa = round(cena_waluta * kurs, 2)
+            print(f"  Cena w PLN: {cena_jednostkowa:.2f}")
+        koszt_calkowity = ilosc * cena_jednostkowa
+
+        default_categories = DEFAULT_CATEGORIES
+        categories = sorted(self.df["Kategoria"].dropna().unique()) if not self.df.empty else default_categories
+        if categories:
+            print("\n  Dostępne kategorie:")
+            for idx, category in enumerate(categories, 1):
+                print(f"    {idx}. {category}")
+        
+        while True:
+            cat_default = str(categories.index(last_used[1]) + 1) if last_used and last_used[1] in categories else ""
+            cat_choice = self._get_user_input("\nWpisz numer kategorii lub Enter dla własnej ('q' aby anulować): ",
+                                              default=cat_default)
+            if cat_choice.lower() == 'q':
+                print("Anulowano. Powrót do menu.\n")
+                return
+            if not cat_choice:
+                kategoria = self._get_user_input("Własna kategoria ('q' aby anulować): ")
+                if kategoria.lower() == 'q':
+                    print("Anulowano. Powrót do menu.\n")
+                    return
+                if len(kategoria) > 1000:
+                    print("Kategoria jest za długa (maks. 1000 znaków).")
+                    continue
+                if kategoria.strip():
+                    break
+                else:
+                    print("Proszę wpisać poprawną kategorię lub 'q'.")
+            try:
+                cat_idx = int(cat_choice) - 1
+                if 0 <= cat_idx < len(categories):
+                    kategoria = categories[cat_idx]
+                    break
+                else:
+                    print(f"Nieprawidłowy numer. Wybierz od 1 do {len(categories)} lub 'q'.")
+            except ValueError:
+                print("Proszę wpisać poprawną liczbę, Enter lub 'q'.")
+
+        opis = self._get_user_input("Opis (opcjonalny, Enter aby pominąć, 'q' aby anulować): ")
+        if opis.lower() == 'q':
+            print("Anulowano. Powrót do menu.\n")
             return
+        if len(opis) > 1000:
+            print("Opis jest za długi (maks. 1000 znaków).")
+            opis = opis[:1000]
+
+        new_row = pd.DataFrame({
+            "Pozycja": [pozycja],
+            "Ilość": [ilosc],
+            "Jednostka": [jednostka],
+            "Cena jednostkowa (PLN)": [cena_jednostkowa],
+            "Koszt całkowity (PLN)": [koszt_calkowity],
+            "Kategoria": [kategoria],
+            "Opis": [opis]
+        }, index=[self._next_row_id()])
+        if self._computed_enabled():
+            for col, default in RATE_COLUMNS.items():
+                new_row[col] = default
+        if self._currency_enabled():
+            new_row[CURRENCY_COLUMN] = waluta
+            new_row[FOREIGN_PRICE_COLUMN] = cena_waluta
+        self._push_undo(f"dodanie pozycji '{pozycja}'")
+        self.df = pd.concat([self.df, new_row])
+        self._mark_rows_changed(new_row.index)
+        self.is_modified = True
+        if self.position_index is not None:
+            self.position_index.remember(pozycja, jednostka, kategoria, cena_jednostkowa)
+        print("Pozycja dodana pomyślnie!\n")
 
-        dir_list = self.list_directories()
-        if not dir_list:
-            print("  Brak folderów do wyboru. Utwórz folder lub zmień bieżący katalog.\n")
+    def edit_item(self):
+        """Edytuje istniejącą pozycję w kosztorysie po numerze pozycji."""
+        print("\n=== Edycja pozycji ===")
+        if self.df.empty:
+            print("  Kosztorys jest pusty. Nie można edytować.\n")
             return
 
+        self.display_cost_estimate()
         while True:
-            choice = self._get_user_input("Wpisz numer folderu docelowego lub 'q' aby anulować: ")
-            if choice.lower() == 'q':
+            pozycja_input = self._get_user_input("Wpisz numer pozycji do edycji ('q' aby anulować): ")
+            if pozycja_input.lower() == 'q':
                 print("Anulowano. Powrót do menu.\n")
                 return
             try:
-                dir_idx = int(choice) - 1
-                if 0 <= dir_idx < len(dir_list):
-                    dest_dir = dir_list[dir_idx]
-                    if dest_dir == "..":
-                        dest_dir = os.path.dirname(self.current_dir)
-                    # Normalizacja i sprawdzanie ścieżki
-                    dest_dir = os.path.abspath(os.path.normpath(dest_dir))
-                    if not dest_dir.startswith(os.path.abspath(self.current_dir)):
-                        print(f"Ścieżka '{dest_dir}' wykracza poza bieżący katalog.")
-                        continue
+                pozycja_idx = int(pozycja_input) - 1
+                if 0 <= pozycja_idx < len(self.df):
                     break
                 else:
-                    print(f"Nieprawidłowy numer. Wybierz od 1 do {len(dir_list)} lub 'q'.")
+                    print(f"Nieprawidłowy numer. Wybierz od 1 do {len(self.df)} lub 'q'.")
             except ValueError:
                 print("Proszę wpisać poprawną liczbę lub 'q'.")
 
-        source_path = os.path.abspath(os.path.normpath(self.filename))
-        dest_path = os.path.abspath(os.path.normpath(os.path.join(dest_dir, os.path.basename(self.filename))))
-
-        if not dest_path.startswith(os.path.abspath(self.current_dir)):
-            print(f"Ścieżka docelowa '{dest_path}' wykracza poza bieżący katalog.")
-            return
-
-        if not os.access(dest_dir, os.W_OK):
-            print(f"Brak uprawnień do zapisu w folderze docelowym: {dest_dir}")
-            print("Powrót do menu.\n")
-            return
-
-        if not os.access(source_path, os.R_OK) or not os.access(os.path.dirname(source_path), os.W_OK):
-            print(f"Brak uprawnień do odczytu pliku źródłowego lub usunięcia z folderu: {os.path.dirname(source_path)}")
-            print("Powrót do menu.\n")
+        # Numer pozycji z listy to kolejność wiersza; etykieta indeksu jest jego stałym identyfikatorem
+        pozycja_idx = self.df.index[pozycja_idx]
+        print(f"\nEdycja pozycji: {self.df.at[pozycja_idx, 'Pozycja']}")
+        pozycja = self.df.at[pozycja_idx, 'Pozycja']
+        
+        new_pozycja = self._get_user_input(f"Nowa nazwa pozycji (Enter aby pozostawić '{pozycja}', 'q' aby anulować): ", default=pozycja,
+                                           completer=self._position_completer())
+        if new_pozycja.lower() == 'q':
+            print("Anulowano. Powrót do menu.\n")
             return
+        if len(new_pozycja) > 1000:
+            print("Nazwa pozycji jest za długa (maks. 1000 znaków).")
+            new_pozycja = pozycja
+        if not new_pozycja.strip():
+            new_pozycja = pozycja
 
-        try:
-            if os.path.exists(dest_path):
-                print(f"Plik '{os.path.basename(self.filename)}' już istnieje w folderze {dest_dir}.")
-                confirm = self._get_confirmation("Czy chcesz nadpisać plik? [t/n]: ")
-                if confirm != 't':
-                    print("Anulowano. Powrót do menu.\n")
-                    return
-            shutil.move(source_path, dest_path)
-            self.filename = dest_path
-            self.current_dir = dest_dir
-            os.chdir(self.current_dir)
-            print(f"Kosztorys przeniesiony do: {os.path.basename(self.filename)}\n")
-        except OSError as e:
-            print(f"Błąd podczas przenoszenia pliku: {e}")
-            print("Powrót do menu.\n")
-
-    def rename_cost_estimate(self):
-        """Zmienia nazwę aktualnego kosztorysu w bieżącym folderze."""
-        print("\n=== Zmiana nazwy kosztorysu ===")
-        if not self.filename:
-            print("  Brak wczytanego kosztorysu. Najpierw otwórz lub zapisz kosztorys.\n")
+        ilosc_input = self._get_user_input(f"Nowa ilość (Enter aby pozostawić {self.df.at[pozycja_idx, 'Ilość']}, 'q' aby anulować): ", default=str(self.df.at[pozycja_idx, 'Ilość']))
+        if ilosc_input.lower() == 'q':
+            print("Anulowano. Powrót do menu.\n")
             return
+        if not ilosc_input:
+            ilosc = self.df.at[pozycja_idx, 'Ilość']
+        else:
+            ilosc = self._validate_float(ilosc_input, "Nieprawidłowa wartość. Pozostawiono dotychczasową ilość.")
+            if ilosc is None:
+                ilosc = self.df.at[pozycja_idx, 'Ilość']
 
-        default_name = os.path.basename(self.filename)
+        units = UNITS
+        print("\n  Dostępne jednostki:")
+        for idx, unit in enumerate(units, 1):
+            print(f"    {idx}. {unit}")
+        
         while True:
-            new_filename = self._get_user_input(
-                f"Podaj nową nazwę pliku w folderze {self.current_dir} (Enter dla '{default_name}', 'q' aby anulować): ",
-                default=default_name, is_filename=True
-            )
-            if new_filename.lower() == 'q':
+            unit_choice = self._get_user_input(f"\nWpisz numer jednostki lub własną jednostkę (Enter aby pozostawić '{self.df.at[pozycja_idx, 'Jednostka']}', 'q' aby anulować): ", default=self.df.at[pozycja_idx, 'Jednostka'])
+            if unit_choice.lower() == 'q':
                 print("Anulowano. Powrót do menu.\n")
                 return
-            if not new_filename.strip() or new_filename == default_name:
-                print("Nazwa pliku nie zmieniona. Powrót do menu.\n")
-                return
-            new_filename = self._validate_filename(new_filename.strip())
-            if new_filename:
+            if not unit_choice:
+                jednostka = self.df.at[pozycja_idx, 'Jednostka']
                 break
-            print("Spróbuj ponownie.")
+            if len(unit_choice) > 50:
+                print("Jednostka jest za długa (maks. 50 znaków).")
+                continue
+            try:
+                unit_idx = int(unit_choice) - 1
+                if 0 <= unit_idx < len(units):
+                    jednostka = units[unit_idx]
+                    break
+                else:
+                    print(f"Nieprawidłowy numer. Wybierz od 1 do {len(units)}, wpisz własną jednostkę lub 'q'.")
+            except ValueError:
+                jednostka = unit_choice
+                if jednostka.strip():
+                    break
+                else:
+                    print("Proszę wpisać poprawną jednostkę, numer lub 'q'.")
 
-        new_path = os.path.abspath(os.path.normpath(os.path.join(self.current_dir, new_filename)))
-        if not new_path.startswith(os.path.abspath(self.current_dir)):
-            print(f"Nowa nazwa pliku '{new_filename}' wykracza poza bieżący katalog.")
+        price_column, waluta, kurs = 'Cena jednostkowa (PLN)', BASE_CURRENCY, 1.0
+        if self._currency_enabled():
+            selected = self._ask_currency(self.df.at[pozycja_idx, CURRENCY_COLUMN])
+            if selected is None:
+                print("Anulowano. Powrót do menu.\n")
+                return
+            price_column, (waluta, kurs) = FOREIGN_PRICE_COLUMN, selected
+        cena_input = self._get_user_input(f"Nowa cena jednostkowa ({waluta}) (Enter aby pozostawić {self.df.at[pozycja_idx, price_column]}, 'q' aby anulować): ", default=str(self.df.at[pozycja_idx, price_column]))
+        if cena_input.lower() == 'q':
+            print("Anulowano. Powrót do menu.\n")
             return
+        if not cena_input:
+            cena_jednostkowa = self.df.at[pozycja_idx, price_column]
+        else:
+            cena_jednostkowa = self._validate_float(cena_input, "Nieprawidłowa wartość. Pozostawiono dotychczasową cenę.")
+            if cena_jednostkowa is None:
+                cena_jednostkowa = self.df.at[pozycja_idx, price_column]
 
-        try:
-            if os.path.exists(new_path):
-                print(f"Plik '{new_filename}' już istnieje w folderze {self.current_dir}.")
-                confirm = self._get_confirmation("Czy chcesz nadpisać plik? [t/n]: ")
-                if confirm != 't':
+        cena_waluta = cena_jednostkowa
+        if waluta != BASE_CURRENCY:
+            cena_jednostkowa = round(cena_waluta * kurs, 2)
+            print(f"  Cena w PLN: {cena_jednostkowa:.2f}")
+        koszt_calkowity = ilosc * cena_jednostkowa
+
+        default_categories = DEFAULT_CATEGORIES
+        categories = sorted(self.df["Kategoria"].dropna().unique()) if not self.df.empty else default_categories
+        print("\n  Dostępne kategorie:")
+        for idx, category in enumerate(categories, 1):
+            print(f"    {idx}. {category}")
+        
+        while True:
+            cat_choice = self._get_user_input(f"\nWpisz numer kategorii lub Enter dla własnej (Enter aby pozostawić '{self.df.at[pozycja_idx, 'Kategoria']}', 'q' aby anulować): ")
+            if cat_choice.lower() == 'q':
+                print("Anulowano. Powrót do menu.\n")
+                return
+            if not cat_choice:
+                kategoria_input = self._get_user_input(f"Własna kategoria (Enter aby pozostawić '{self.df.at[pozycja_idx, 'Kategoria']}', 'q' aby anulować): ", default=self.df.at[pozycja_idx, 'Kategoria'])
+                if kategoria_input.lower() == 'q':
                     print("Anulowano. Powrót do menu.\n")
                     return
-            os.rename(self.filename, new_path)
-            self.filename = new_path
-            print(f"Nazwa kosztorysu zmieniona na: {os.path.basename(self.filename)}\n")
-        except OSError as e:
-            print(f"Błąd podczas zmiany nazwy pliku: {e}")
-            print("Powrót do menu.\n")
+                if len(kategoria_input) > 1000:
+                    print("Kategoria jest za długa (maks. 1000 znaków).")
+                    kategoria = self.df.at[pozycja_idx, 'Kategoria']
+                else:
+                    kategoria = kategoria_input if kategoria_input.strip() else self.df.at[pozycja_idx, 'Kategoria']
+                if kategoria.strip():
+                    break
+                else:
+                    print("Proszę wpisać poprawną kategorię lub 'q'.")
+            try:
+                cat_idx = int(cat_choice) - 1
+                if 0 <= cat_idx < len(categories):
+                    kategoria = categories[cat_idx]
+                    break
+                else:
+                    print(f"Nieprawidłowy numer. Wybierz od 1 do {len(categories)} lub 'q'.")
+            except ValueError:
+                print("Proszę wpisać poprawną liczbę, Enter lub 'q'.")
 
-    def delete_cost_estimate(self):
-        """Usuwa wybrany plik kosztorysu z bieżącego folderu."""
-        print("\n=== Usuwanie pliku kosztorysu ===")
-        excel_files = self.list_excel_files()
-        if not excel_files:
-            print("  Brak plików do usunięcia.\n")
+        opis = self._get_user_input(f"Nowy opis (Enter aby pozostawić '{self.df.at[pozycja_idx, 'Opis']}', 'q' aby anulować): ", default=self.df.at[pozycja_idx, 'Opis'])
+        if opis.lower() == 'q':
+            print("Anulowano. Powrót do menu.\n")
+            return
+        if len(opis) > 1000:
+            print("Opis jest za długi (maks. 1000 znaków).")
+            opis = opis[:1000]
+
+        self._push_undo(f"edycja pozycji '{self.df.at[pozycja_idx, 'Pozycja']}'")
+        self.df.at[pozycja_idx, "Pozycja"] = new_pozycja
+        self.df.at[pozycja_idx, "Ilość"] = ilosc
+        self.df.at[pozycja_idx, "Jednostka"] = jednostka
+        self.df.at[pozycja_idx, "Cena jednostkowa (PLN)"] = cena_jednostkowa
+        self.df.at[pozycja_idx, "Koszt całkowity (PLN)"] = koszt_calkowity
+        self.df.at[pozycja_idx, "Kategoria"] = kategoria
+        self.df.at[pozycja_idx, "Opis"] = opis
+        if self._currency_enabled():
+            self.df.at[pozycja_idx, CURRENCY_COLUMN] = waluta
+            self.df.at[pozycja_idx, FOREIGN_PRICE_COLUMN] = cena_waluta
+        self._mark_rows_changed([pozycja_idx])
+        if self.position_index is not None:
+            self.position_index.remember(new_pozycja, jednostka, kategoria, cena_jednostkowa)
+        self.is_modified = True
+        print("Pozycja zaktualizowana pomyślnie!\n")
+
+    def delete_item(self):
+        """Usuwa pozycję z kosztorysu po numerze pozycji."""
+        print("\n=== Usuwanie pozycji ===")
+        if self.df.empty:
+            print("  Kosztorys jest pusty. Nie można usunąć.\n")
             return
 
+        self.display_cost_estimate()
         while True:
-            choice = self._get_user_input("\nWpisz numer pliku do usunięcia lub 'q' aby anulować: ")
-            if choice.lower() == 'q':
+            pozycja_input = self._get_user_input("Wpisz numer pozycji do usunięcia ('q' aby anulować): ")
+            if pozycja_input.lower() == 'q':
                 print("Anulowano. Powrót do menu.\n")
                 return
             try:
-                file_idx = int(choice) - 1
-                if 0 <= file_idx < len(excel_files):
-                    file_to_delete = os.path.abspath(os.path.normpath(excel_files[file_idx]))
-                    # Sprawdzanie, czy plik jest w bieżącym katalogu
-                    if not file_to_delete.startswith(os.path.abspath(self.current_dir)):
-                        print(f"Plik '{os.path.basename(file_to_delete)}' znajduje się poza bieżącym katalogiem.")
-                        print("Powrót do menu.\n")
-                        return
-                    file_name = os.path.basename(file_to_delete)
-                    while True:
-                        confirm = self._get_confirmation(f"Czy na pewno chcesz usunąć plik '{file_name}'? [t/n]: ")
-                        if confirm == 't':
-                            try:
-                                os.remove(file_to_delete)
-                                print(f"Plik '{file_name}' usunięty pomyślnie!\n")
-                                if self.filename and os.path.abspath(self.filename) == file_to_delete:
-                                    print("Usunięto aktualnie wczytany kosztorys. Tworzenie nowego kosztorysu.\n")
-                                    self.filename = None
-                                    self.df = pd.DataFrame(columns=["Pozycja", "Ilość", "Jednostka", 
-                                                                   "Cena jednostkowa (PLN)", "Koszt całkowity (PLN)", 
-                                                                   "Kategoria", "Opis"])
-                                    self.is_modified = False
-                                break
-                            except PermissionError:
-                                print(f"Brak uprawnień do usunięcia pliku '{file_name}' lub plik jest w użyciu.")
-                                print("Powrót do menu.\n")
-                                return
-                            except OSError as e:
-                                print(f"Błąd podczas usuwania pliku '{file_name}': {e}")
-                                print("Powrót do menu.\n")
-                                return
-                        elif confirm == 'n' or confirm == 'q':
-                            print("Anulowano. Powrót do menu.\n")
-                            return
-                        else:
-                            print("Proszę wpisać 't' (tak), 'n' (nie) lub 'q' (anuluj).")
+                pozycja_idx = int(pozycja_input) - 1
+                if 0 <= pozycja_idx < len(self.df):
                     break
                 else:
-                    print(f"Nieprawidłowy numer. Wybierz od 1 do {len(excel_files)} lub 'q'.")
+                    print(f"Nieprawidłowy numer. Wybierz od 1 do {len(self.df)} lub 'q'.")
             except ValueError:
                 print("Proszę wpisać poprawną liczbę lub 'q'.")
 
-    def select_initial_file(self):
-        """Wybiera plik Excel w trybie interaktywnym."""
-        excel_files = self.list_excel_files()
-        
-        if not excel_files:
-            print("  Brak plików. Tworzenie nowego kosztorysu.\n")
-            self.is_modified = False
-            return
+        pozycja_idx = self.df.index[pozycja_idx]
+        pozycja = self.df.at[pozycja_idx, "Pozycja"]
+        while True:
+            confirm = self._get_confirmation(f"Czy na pewno chcesz usunąć pozycję '{pozycja}'? [t/n]: ")
+            if confirm == 't':
+                self._push_undo(f"usunięcie pozycji '{pozycja}'")
+                self.df = self.df.drop(index=pozycja_idx)
+                self._mark_rows_deleted([pozycja_idx])
+                self.is_modified = True
+                print(f"Pozycja '{pozycja}' usunięta pomyślnie!\n")
+                break
+            elif confirm == 'n' or confirm == 'q':
+                print("Anulowano. Powrót do menu.\n")
+                break
+            else:
+                print("Proszę wpisać 't' (tak), 'n' (nie) lub 'q' (anuluj).")
 
+    def _select_rows(self):
+        """Pyta o wybór wierszy (zakres numerów lub filtr) i zwraca ich pozycje (od 0) albo None po anulowaniu."""
+        print("  Wybór pozycji:")
+        print("    1. Numery pozycji (np. 10-500,612)")
+        print("    2. Kategoria")
+        print("    3. Zakres kosztów")
+        print("    4. Nazwa pozycji zawiera tekst")
         while True:
-            choice = self._get_user_input("\nWpisz numer pliku, Enter dla nowego kosztorysu lub 'q' aby anulować: ")
+            choice = self._get_user_input("Wpisz opcję (1-4, 'q' aby anulować): ")
             if choice.lower() == 'q':
-                print("Anulowano. Tworzenie nowego kosztorysu.\n")
-                self.filename = None
-                self.df = pd.DataFrame(columns=["Pozycja", "Ilość", "Jednostka", "Cena jednostkowa (PLN)", 
-                                               "Koszt całkowity (PLN)", "Kategoria", "Opis"])
-                self.is_modified = False
+                return None
+            if choice in ("1", "2", "3", "4"):
+                break
+            print("Nieprawidłowa opcja. Wybierz od 1 do 4 lub 'q'.")
+
+        if choice == "1":
+            while True:
+                ranges = self._get_user_input(f"Numery pozycji 1-{len(self.df)} ('q' aby anulować): ")
+                if ranges.lower() == 'q':
+                    return None
+                try:
+                    return parse_row_ranges(ranges, len(self.df))
+                except ValueError as e:
+                    print(e)
+        if choice == "2":
+            categories = sorted(self.df["Kategoria"].dropna().unique())
+            if not categories:
+                print("  Brak kategorii w kosztorysie.")
+                return None
+            print("\n  Dostępne kategorie:")
+            for idx, category in enumerate(categories, 1):
+                print(f"    {idx}. {category}")
+            while True:
+                cat_choice = self._get_user_input("\nWpisz numer kategorii ('q' aby anulować): ")
+                if cat_choice.lower() == 'q':
+                    return None
+                if cat_choice.isdigit() and 0 < int(cat_choice) <= len(categories):
+                    mask = self.df["Kategoria"] == categories[int(cat_choice) - 1]
+                    return np.flatnonzero(mask.to_numpy())
+                print(f"Nieprawidłowy numer. Wybierz od 1 do {len(categories)} lub 'q'.")
+        if choice == "3":
+            bounds = []
+            for label in ("Minimalny", "Maksymalny"):
+                while True:
+                    value_input = self._get_user_input(f"{label} koszt (PLN) ('q' aby anulować): ")
+                    if value_input.lower() == 'q':
+                        return None
+                    value = self._validate_float(value_input, "Proszę podać poprawną wartość liczbową lub 'q'.")
+                    if value is not None:
+                        bounds.append(value)
+                        break
+            cost = self.df["Koszt całkowity (PLN)"].to_numpy(dtype=float)
+            return np.flatnonzero((cost >= bounds[0]) & (cost <= bounds[1]))
+        text = self._get_user_input("Fragment nazwy pozycji ('q' aby anulować): ", completer=self._position_completer())
+        if text.lower() == 'q' or not text:
+            return None
+        mask = self.df["Pozycja"].astype(str).str.contains(text, case=False, regex=False)
+        return np.flatnonzero(mask.to_numpy())
+
+    def bulk_edit_items(self):
+        """Zmienia wiele pozycji naraz: ustawia pole, mnoży ceny lub ilości albo zamienia tekst w opisie."""
+        print("\n=== Zmiana wielu pozycji ===")
+        if self.df.empty:
+            print("  Kosztorys jest pusty. Nie można edytować.\n")
+            return
+        positions = self._select_rows()
+        if positions is None:
+            print("Anulowano. Powrót do menu.\n")
+            return
+        if len(positions) == 0:
+            print("  Brak pozycji spełniających kryteria.\n")
+            return
+        labels = self.df.index[positions]
+        print(f"\n  Wybrano pozycji: {len(labels)} (łączny koszt: "
+              f"{self.df.loc[labels, 'Koszt całkowity (PLN)'].sum():.2f} PLN)")
+        print(self.df.loc[labels].head(10).to_string(index=False))
+        if len(labels) > 10:
+            print(f"  ... i {len(labels) - 10} kolejnych")
+
+        print("\n  Operacje:")
+        print("    1. Ustaw wartość pola")
+        print("    2. Zmień ceny jednostkowe (współczynnik lub procent)")
+        print("    3. Zmień ilości (współczynnik lub procent)")
+        print("    4. Zamień tekst w opisie")
+        operation = self._get_user_input("Wpisz opcję (1-4, 'q' aby anulować): ")
+        old_text = None
+        if operation == "1":
+            fields = [col for col in self.df.columns
+                      if (col in COLUMNS or col in RATE_COLUMNS) and col != "Koszt całkowity (PLN)"]
+            for idx, col in enumerate(fields, 1):
+                print(f"    {idx}. {col}")
+            field_choice = self._get_user_input("Wpisz numer pola ('q' aby anulować): ")
+            if not (field_choice.isdigit() and 0 < int(field_choice) <= len(fields)):
+                print("Anulowano. Powrót do menu.\n")
                 return
-            if not choice:
-                print("Tworzenie nowego kosztorysu.\n")
-                self.filename = None
-                self.df = pd.DataFrame(columns=["Pozycja", "Ilość", "Jednostka", "Cena jednostkowa (PLN)", 
-                                               "Koszt całkowity (PLN)", "Kategoria", "Opis"])
-                self.is_modified = False
+            action, column = "set", fields[int(field_choice) - 1]
+            value = self._get_user_input(f"Nowa wartość pola '{column}' ('q' aby anulować): ",
+                                         completer=self._position_completer() if column == "Pozycja" else None)
+            if value.lower() == 'q':
+                print("Anulowano. Powrót do menu.\n")
+                return
+            if column in NUMERIC_COLUMNS or column in RATE_COLUMNS:
+                value = self._validate_float(value, "Proszę podać poprawną wartość liczbową.")
+                if value is None:
+                    return
+            elif len(value) > (50 if column == "Jednostka" else 1000):
+                print(f"Wartość jest za długa (maks. {50 if column == 'Jednostka' else 1000} znaków).\n")
+                return
+            elif column == "Pozycja" and not value.strip():
+                print("Nazwa pozycji nie może być pusta.\n")
+                return
+        elif operation in ("2", "3"):
+            action = "scale"
+            column = "Cena jednostkowa (PLN)" if operation == "2" else "Ilość"
+            factor_input = self._get_user_input("Współczynnik (np. 1.07) lub procent (np. +7% lub -5%), 'q' aby anulować: ")
+            if factor_input.lower() == 'q':
+                print("Anulowano. Powrót do menu.\n")
                 return
-            
             try:
-                file_idx = int(choice) - 1
-                if 0 <= file_idx < len(excel_files):
-                    self.filename = os.path.abspath(os.path.normpath(excel_files[file_idx]))
-                    if not self.filename.startswith(os.path.abspath(self.current_dir)):
-                        print(f"Plik '{os.path.basename(self.filename)}' znajduje się poza bieżącym katalogiem.")
-                        continue
-                    try:
-                        self.df = self.load_cost_estimate()
-                        print(f"\nKosztorys wczytany z pliku: {os.path.basename(self.filename)}\n")
-                        self.is_modified = False
-                        self.display_cost_estimate()
-                        return
-                    except Exception as e:
-                        print(f"Błąd podczas wczytywania pliku {os.path.basename(self.filename)}: {e}")
-                        print("Tworzenie nowego kosztorysu.\n")
-                        self.filename = None
-                        self.df = pd.DataFrame(columns=["Pozycja", "Ilość", "Jednostka", "Cena jednostkowa (PLN)", 
-                                                       "Koszt całkowity (PLN)", "Kategoria", "Opis"])
-                        self.is_modified = False
-                        return
+                if factor_input.strip().endswith("%"):
+                    value = 1 + float(factor_input.strip().rstrip("%").replace(",", ".")) / 100
                 else:
-                    print(f"Nieprawidłowy numer. Wybierz od 1 do {len(excel_files)}.")
+                    value = float(factor_input.replace(",", "."))
+                if value < 0:
+                    raise ValueError
             except ValueError:
-                print("Proszę wpisać poprawną liczbę, Enter lub 'q'.")
+                print("Proszę podać nieujemny współczynnik lub procent.\n")
+                return
+        elif operation == "4":
+            action, column = "replace", "Opis"
+            old_text = self._get_user_input("Szukany tekst w opisie ('q' aby anulować): ")
+            if old_text.lower() == 'q' or not old_text:
+                print("Anulowano. Powrót do menu.\n")
+                return
+            value = self._get_user_input("Zamień na (Enter aby usunąć tekst): ")
+        else:
+            print("Anulowano. Powrót do menu.\n")
+            return
 
-    def load_cost_estimate(self):
-        """Ładuje kosztorys z pliku lub zgłasza błąd, jeśli plik niepoprawny."""
-        if not self.filename or not os.path.exists(self.filename):
-            raise Exception(f"Plik {os.path.basename(self.filename)} nie istnieje.")
-        
+        confirm = self._get_confirmation(f"Czy na pewno zmienić {len(labels)} pozycji? [t/n]: ")
+        if confirm != 't':
+            print("Anulowano. Powrót do menu.\n")
+            return
+        total_before = self.df["Koszt całkowity (PLN)"].sum()
+        self._push_undo(f"zmiana {len(labels)} pozycji")
+        try:
+            with PROFILER.span("bulk_edit", action=action, rows=len(labels)):
+                bulk_edit(self.df, labels, action, column, value, old_text=old_text)
+        except ValueError as e:
+            self.undo_stack.pop()
+            print(f"{e}\nNie wprowadzono zmian.\n")
+            return
+        self._mark_rows_changed(labels)
+        self.is_modified = True
+        print(f"Zmieniono pozycji: {len(labels)}. Łączny koszt: {total_before:.2f} -> "
+              f"{self.df['Koszt całkowity (PLN)'].sum():.2f} PLN\n")
+
+    def _print_computed_totals(self):
+        """Wypisuje sumy kolumn obliczanych (narzut, rabat, netto, VAT, brutto)."""
+        totals = self.computed.get(self.df).sum()
+        print("  " + ", ".join(f"{col}: {totals[col]:.2f}" for col in COMPUTED_COLUMNS) + "\n")
+
+    def _currency_enabled(self):
+        """Sprawdza, czy kosztorys ma kolumny waluty i ceny w walucie pozycji."""
+        return CURRENCY_COLUMN in self.df.columns and FOREIGN_PRICE_COLUMN in self.df.columns
+
+    def _current_rates(self, date=None):
+        """Zwraca kursy walut z lokalnej tabeli obowiązujące w dniu `date` lub None przy błędzie odczytu."""
         try:
-            df = pd.read_excel(self.filename)
-            expected_columns = ["Pozycja", "Ilość", "Jednostka", "Cena jednostkowa (PLN)", 
-                               "Koszt całkowity (PLN)", "Kategoria", "Opis"]
-            if not all(col in df.columns for col in expected_columns):
-                raise Exception(f"Plik {os.path.basename(self.filename)} nie zawiera wszystkich oczekiwanych kolumn.")
-            df = df[df["Pozycja"] != "RAZEM"]
-            for col in ["Ilość", "Cena jednostkowa (PLN)", "Koszt całkowity (PLN)"]:
-                invalid = df[col].isna() | ~pd.to_numeric(df[col], errors='coerce').notna()
-                if invalid.any():
-                    print(f"Ostrzeżenie: Niepoprawne wartości w kolumnie '{col}' zostały zamienione na 0.")
-            df["Ilość"] = pd.to_numeric(df["Ilość"], errors='coerce').fillna(0)
-            df["Cena jednostkowa (PLN)"] = pd.to_numeric(df["Cena jednostkowa (PLN)"], errors='coerce').fillna(0)
-            df["Koszt całkowity (PLN)"] = pd.to_numeric(df["Koszt całkowity (PLN)"], errors='coerce').fillna(0)
-            return df
+            return EXCHANGE_RATES.rates_on(self.rates_path, date)
         except Exception as e:
-            raise Exception(f"Błąd podczas wczytywania pliku {os.path.basename(self.filename)}: {e}")
+            print(f"Błąd podczas wczytywania kursów walut z pliku {EXCHANGE_RATES_FILE}: {e}")
+            return None
 
-    def open_cost_estimate(self):
-        """Wczytuje kosztorys z pliku Excel po numerze."""
-        print("\n=== Otwieranie kosztorysu ===")
-        excel_files = self.list_excel_files()
-        if not excel_files:
-            print("  Brak plików do wczytania. Tworzenie nowego kosztorysu.\n")
-            self.filename = None
-            self.df = pd.DataFrame(columns=["Pozycja", "Ilość", "Jednostka", "Cena jednostkowa (PLN)", 
-                                           "Koszt całkowity (PLN)", "Kategoria", "Opis"])
-            self.is_modified = False
+    def _ask_currency(self, default):
+        """Pyta o walutę ceny; zwraca (waluta, kurs w PLN) lub None po anulowaniu."""
+        rates = self._current_rates()
+        if rates is None:
+            return None
+        print(f"  Dostępne waluty: {', '.join(rates.index)}")
+        while True:
+            waluta = self._get_user_input(f"Waluta ceny (Enter dla {default}, 'q' aby anulować): ", default=default)
+            if waluta.lower() == 'q':
+                return None
+            waluta = (waluta or default).strip().upper()
+            if waluta in rates.index:
+                kurs = float(rates.at[waluta, "Kurs (PLN)"])
+                if waluta != BASE_CURRENCY:
+                    print(f"  Kurs {waluta}: {kurs:.4f} PLN (z dnia {rates.at[waluta, 'Data']:%Y-%m-%d})")
+                return waluta, kurs
+            print(f"Brak kursu waluty '{waluta}' w pliku {EXCHANGE_RATES_FILE}.")
+
+    def _print_currency_totals(self):
+        """Wypisuje sumy kosztów według walut pozycji, w walucie i w PLN."""
+        totals = currency_totals(self.df)
+        if totals.empty or list(totals["Waluta"]) == [BASE_CURRENCY]:
             return
+        for row in totals.itertuples(index=False):
+            print(f"  {row[0]}: {row[1]:.2f} {row[0]} = {row[2]:.2f} PLN")
+        print()
 
-        while True:
-            choice = self._get_user_input("\nWpisz numer pliku lub 'q' aby anulować: ")
-            if choice.lower() == 'q':
+    def currency_menu(self):
+        """Włącza kolumny waluty, pokazuje kursy i sumy według walut oraz przelicza ceny na PLN."""
+        print("\n=== Waluty i kursy ===")
+        if not self._currency_enabled():
+            confirm = self._get_confirmation(
+                f"Dodać do kosztorysu kolumny '{CURRENCY_COLUMN}' i '{FOREIGN_PRICE_COLUMN}' (wszystkie pozycje w PLN)? [t/n]: "
+            )
+            if confirm != 't':
                 print("Anulowano. Powrót do menu.\n")
                 return
+            self._push_undo("dodanie kolumn waluty")
+            self.df[CURRENCY_COLUMN] = BASE_CURRENCY
+            self.df[FOREIGN_PRICE_COLUMN] = self.df["Cena jednostkowa (PLN)"]
+            self._mark_columns_changed()
+            self.is_modified = True
+            print("Dodano kolumny waluty. Waluta jest wybierana przy dodawaniu i edycji pozycji.\n")
+
+        try:
+            table = EXCHANGE_RATES.table(self.rates_path) if os.path.exists(self.rates_path) else None
+        except Exception as e:
+            print(f"Błąd podczas wczytywania kursów walut z pliku {EXCHANGE_RATES_FILE}: {e}")
+            table = None
+        if table is None:
+            print(f"  Brak poprawnego pliku kursów {self.rates_path}.")
+            print(f"  Utwórz plik CSV z kolumnami: {', '.join(ExchangeRates.COLUMNS)} (np. 2025-01-02,EUR,4.27).")
+        else:
+            print(f"  Plik kursów: {self.rates_path} (liczba kursów: {len(table)}, "
+                  f"waluty: {', '.join(sorted(table['Waluta'].unique())) or '-'})")
+        self._print_currency_totals()
+        print("  Opcje:")
+        print("    1. Przelicz ceny wszystkich pozycji na PLN według kursów z wybranego dnia")
+        print("    2. Pokaż kursy z wybranego dnia")
+        print("    3. Usuń kolumny waluty z kosztorysu (ceny w PLN zostają)")
+        choice = self._get_user_input("Wpisz opcję (1-3, 'q' aby anulować): ")
+        if choice in ("1", "2"):
+            today = datetime.now().strftime("%Y-%m-%d")
+            date_input = self._get_user_input(f"Data kursów RRRR-MM-DD (Enter dla {today}): ", default=today)
             try:
-                file_idx = int(choice) - 1
-                if 0 <= file_idx < len(excel_files):
-                    self.filename = os.path.abspath(os.path.normpath(excel_files[file_idx]))
-                    if not self.filename.startswith(os.path.abspath(self.current_dir)):
-                        print(f"Plik '{os.path.basename(self.filename)}' znajduje się poza bieżącym katalogiem.")
-                        continue
-                    try:
-                        self.df = self.load_cost_estimate()
-                        print(f"\nKosztorys wczytany z pliku: {os.path.basename(self.filename)}\n")
-                        self.is_modified = False
-                        self.display_cost_estimate()
-                        break
-                    except Exception as e:
-                        print(f"Błąd podczas wczytywania pliku {os.path.basename(self.filename)}: {e}")
-                        self.filename = None
-                        self.df = pd.DataFrame(columns=["Pozycja", "Ilość", "Jednostka", "Cena jednostkowa (PLN)", 
-                                                       "Koszt całkowity (PLN)", "Kategoria", "Opis"])
-                        self.is_modified = False
-                        break
-                else:
-                    print(f"Nieprawidłowy numer. Wybierz od 1 do {len(excel_files)}.")
+                date = datetime.strptime(date_input or today, "%Y-%m-%d")
             except ValueError:
-                print("Proszę wpisać poprawną liczbę lub 'q'.")
-
-    def display_cost_estimate(self):
-        """Wyświetla aktualny kosztorys z numerami pozycji."""
-        print("\n=== Aktualny kosztorys ===")
-        if self.df.empty:
-            print("  Kosztorys jest pusty.\n")
+                print("Niepoprawna data. Użyj formatu RRRR-MM-DD.\n")
+                return
+            rates = self._current_rates(date)
+            if rates is None:
+                return
+            if choice == "2":
+                print(rates.reset_index().to_string(index=False))
+                print()
+                return
+            with PROFILER.span("currency.convert", rows=len(self.df)):
+                prices = convert_to_base_currency(self.df, rates)
+                missing = prices.isna()
+                changed = ~missing & (prices != self.df["Cena jednostkowa (PLN)"])
+                labels = self.df.index[changed.to_numpy()]
+                if len(labels):
+                    self._push_undo(f"przeliczenie cen według kursów z dnia {date:%Y-%m-%d}")
+                self.df.loc[labels, "Cena jednostkowa (PLN)"] = prices[changed].to_numpy()
+                self.df.loc[labels, "Koszt całkowity (PLN)"] = (
+                    self.df.loc[labels, "Ilość"].astype(float) * self.df.loc[labels, "Cena jednostkowa (PLN)"]
+                ).to_numpy()
+            if missing.any():
+                unknown = sorted(self.df.loc[missing.to_numpy(), CURRENCY_COLUMN].unique())
+                print(f"  Brak kursu dla walut: {', '.join(unknown)} – te pozycje pozostawiono bez zmian.")
+            if len(labels):
+                self._mark_rows_changed(labels)
+                self.is_modified = True
+            print(f"Przeliczono pozycji: {len(labels)} (kursy z dnia {date:%Y-%m-%d}).\n")
+            self._print_currency_totals()
+        elif choice == "3":
+            confirm = self._get_confirmation("Czy na pewno usunąć kolumny waluty? [t/n]: ")
+            if confirm == 't':
+                self._push_undo("usunięcie kolumn waluty")
+                self.df = self.df.drop(columns=[CURRENCY_COLUMN, FOREIGN_PRICE_COLUMN])
+                self._mark_columns_changed()
+                self.is_modified = True
+                print("Usunięto kolumny waluty.\n")
         else:
-            display_df = self.df.copy()
-            display_df.insert(0, "Nr", range(1, len(display_df) + 1))
-            print(display_df.to_string(index=False))
-            print(f"  Łączny koszt: {self.df['Koszt całkowity (PLN)'].sum():.2f} PLN\n")
+            print("Powrót do menu.\n")
 
-    def add_item(self):
-        """Dodaje nową pozycję do kosztorysu."""
-        print("\n=== Dodawanie nowej pozycji ===")
+    def new_from_template(self):
+        """Tworzy nowy kosztorys z wybranego szablonu; zwraca True, jeśli kosztorys utworzono."""
+        names = self.templates.names()
+        if not names:
+            print(f"  Brak szablonów w folderze {self.templates.directory}.")
+            print("  Szablon utworzysz opcją 'Szablony kosztorysów' -> 'Zapisz bieżący kosztorys jako szablon'.\n")
+            return False
+        print("\n  Dostępne szablony:")
+        for idx, name in enumerate(names, 1):
+            print(f"    {idx}. {name}")
         while True:
-            pozycja = self._get_user_input("Nazwa pozycji ('q' aby anulować): ")
-            if pozycja.lower() == 'q':
-                print("Anulowano. Powrót do menu.\n")
-                return
-            if len(pozycja) > 1000:
-                print("Nazwa pozycji jest za długa (maks. 1000 znaków).")
-                continue
-            if pozycja.strip():
+            choice = self._get_user_input(f"Wpisz numer szablonu (1-{len(names)}, 'q' aby anulować): ")
+            if choice.lower() == 'q':
+                print("Anulowano.\n")
+                return False
+            if choice.isdigit() and 1 <= int(choice) <= len(names):
+                name = names[int(choice) - 1]
                 break
-            print("Nazwa pozycji nie może być pusta.")
+            print(f"Nieprawidłowy numer. Wybierz od 1 do {len(names)} lub 'q'.")
+        try:
+            df = self.templates.instantiate(name)
+        except Exception as e:
+            print(f"Błąd podczas wczytywania szablonu {name}: {e}\n")
+            return False
+        self._park_current()
+        self.df = df
+        self.is_modified = True
+        print(f"\nUtworzono nowy kosztorys z szablonu '{name}' ({len(self.df)} pozycji).")
+        print("Zapisz kosztorys, aby utworzyć plik .xlsx.\n")
+        return True
 
-        while True:
-            ilosc_input = self._get_user_input("Ilość (Enter dla 1, 'q' aby anulować): ", default="1")
-            if ilosc_input.lower() == 'q':
+    def templates_menu(self):
+        """Tworzy kosztorys z szablonu albo zapisuje bieżący kosztorys jako szablon."""
+        print("\n=== Szablony kosztorysów ===")
+        print(f"  Folder szablonów: {self.templates.directory}")
+        print("  Opcje:")
+        print("    1. Nowy kosztorys z szablonu")
+        print("    2. Zapisz bieżący kosztorys jako szablon")
+        choice = self._get_user_input("Wpisz opcję (1-2, 'q' aby anulować): ")
+        if choice == "1":
+            if self.new_from_template():
+                self.display_cost_estimate()
+        elif choice == "2":
+            if self.df.empty:
+                print("  Kosztorys jest pusty. Nie można zapisać szablonu.\n")
+                return
+            name = self._get_user_input("Nazwa szablonu ('q' aby anulować): ", is_filename=True)
+            if not name or name.lower() == 'q':
                 print("Anulowano. Powrót do menu.\n")
                 return
-            if not ilosc_input:
-                ilosc = 1.0
-                break
-            ilosc = self._validate_float(ilosc_input, "Proszę podać poprawną wartość liczbową lub 'q'.")
-            if ilosc is not None:
-                break
+            filename = self._validate_filename(name)
+            if not filename:
+                return
+            name = os.path.splitext(filename)[0]
+            if name in self.templates.names():
+                confirm = self._get_confirmation(f"Szablon '{name}' już istnieje. Nadpisać? [t/n]: ")
+                if confirm != 't':
+                    print("Anulowano. Powrót do menu.\n")
+                    return
+            try:
+                self.templates.save(name, self.df)
+                print(f"Zapisano szablon: {name}\n")
+            except Exception as e:
+                print(f"Błąd podczas zapisu szablonu: {e}")
+        else:
+            print("Powrót do menu.\n")
 
-        units = ["szt", "m²", "godz", "m³", "kg", "l", "m", "t", "kWh"]
-        print("\n  Dostępne jednostki:")
-        for idx, unit in enumerate(units, 1):
-            print(f"    {idx}. {unit}")
-        
-        while True:
-            unit_choice = self._get_user_input("\nWpisz numer jednostki lub własną jednostkę ('q' aby anulować): ")
-            if unit_choice.lower() == 'q':
+    def show_history(self):
+        """Pokazuje historię łącznego kosztu i kosztów kategorii z indeksu historii (bez otwierania plików)."""
+        print("\n=== Historia kosztorysu ===")
+        print("  Opcje:")
+        if self.store_table:
+            key = self._store_history_key(self.store_table)
+        else:
+            key = self.history.relpath(self.filename) if self.filename else None
+        print("    1. Historia bieżącego kosztorysu" + ("" if key else " (niedostępna – kosztorys niezapisany)"))
+        print("    2. Ostatnie zapisy wszystkich kosztorysów")
+        print("    3. Uzupełnij historię z kopii zapasowych")
+        choice = self._get_user_input("Wpisz opcję (1-3, 'q' aby anulować): ")
+        if choice == "3":
+            print("  Wczytywanie kopii zapasowych...")
+            with PROFILER.span("history.backfill"):
+                added, failed = self.history.backfill()
+            print(f"Dopisano wpisów: {added}" + (f", pominięto nieczytelnych plików: {failed}" if failed else "") + "\n")
+            return
+        if choice == "1" and key:
+            records = self.history.read(key)
+        elif choice == "2":
+            records = self.history.read()
+        else:
+            print("Powrót do menu.\n")
+            return
+        if not records:
+            print("  Brak wpisów w historii. Zapisz kosztorys lub uzupełnij historię z kopii zapasowych.\n")
+            return
+        limit = 20
+        records = records[-limit:]
+        table = pd.DataFrame({
+            "Data": [record["ts"].replace("T", " ") for record in records],
+            "Plik": [record["file"] for record in records],
+            "Pozycje": [record["rows"] for record in records],
+            "Łączny koszt (PLN)": [record["total"] for record in records],
+        })
+        if choice == "1":
+            table = table.drop(columns="Plik")
+            table["Zmiana (PLN)"] = table["Łączny koszt (PLN)"].diff().fillna(0).round(2)
+        print(f"  Ostatnie wpisy (najwyżej {limit}):")
+        print(table.to_string(index=False))
+        if choice == "1":
+            categories = pd.DataFrame([record["categories"] for record in records]).fillna(0)
+            categories = categories[categories.iloc[-1].sort_values(ascending=False).index]
+            categories.insert(0, "Data", table["Data"].str[:16])
+            print("\n  Koszty według kategorii (PLN):")
+            print(categories.to_string(index=False, float_format=lambda value: f"{value:.2f}"))
+        print()
+
+    def computed_columns_menu(self):
+        """Włącza kolumny stawek (VAT, narzut, rabat), pokazuje kolumny obliczane i ustawia sposób ich zapisu."""
+        print("\n=== Kolumny obliczane (VAT, narzut, rabat) ===")
+        if not self._computed_enabled():
+            confirm = self._get_confirmation(
+                f"Dodać do kosztorysu kolumny stawek ({', '.join(RATE_COLUMNS)})? [t/n]: "
+            )
+            if confirm != 't':
                 print("Anulowano. Powrót do menu.\n")
                 return
-            if len(unit_choice) > 50:
-                print("Jednostka jest za długa (maks. 50 znaków).")
-                continue
-            try:
-                unit_idx = int(unit_choice) - 1
-                if 0 <= unit_idx < len(units):
-                    jednostka = units[unit_idx]
+            vat_input = self._get_user_input("Stawka VAT (%) dla wszystkich pozycji (Enter dla 23): ", default="23")
+            vat = self._validate_float(vat_input or "23", "Proszę podać poprawną wartość liczbową.")
+            if vat is None or vat > 100:
+                print("Stawka VAT musi mieścić się w zakresie 0-100.\n")
+                return
+            self._push_undo("dodanie kolumn stawek")
+            for col, default in RATE_COLUMNS.items():
+                self.df[col] = vat if col == "Stawka VAT (%)" else default
+            self.computed.reset()
+            self._mark_columns_changed()
+            self.is_modified = True
+            print("Dodano kolumny stawek. Stawki wielu pozycji zmienisz opcją 'Zmień wiele pozycji'.\n")
+
+        mode = "formuły Excela" if self.formula_mode else "wartości"
+        print("  Opcje:")
+        print("    1. Pokaż wartości netto, VAT i brutto")
+        print(f"    2. Przełącz zapis kolumn obliczanych do .xlsx (teraz: {mode})")
+        print("    3. Usuń kolumny stawek z kosztorysu")
+        choice = self._get_user_input("Wpisz opcję (1-3, 'q' aby anulować): ")
+        if choice == "1":
+            if self.df.empty:
+                print("  Kosztorys jest pusty.\n")
+                return
+            table = pd.concat([self.df[["Pozycja"] + list(RATE_COLUMNS)], self.computed.get(self.df)], axis=1)
+            table.insert(0, "Nr", range(1, len(table) + 1))
+            print(table.to_string(index=False))
+            self._print_computed_totals()
+        elif choice == "2":
+            self.formula_mode = not self.formula_mode
+            mode = "formuły Excela" if self.formula_mode else "wartości"
+            print(f"Kolumny obliczane będą zapisywane jako: {mode}.\n")
+        elif choice == "3":
+            confirm = self._get_confirmation("Czy na pewno usunąć kolumny stawek i kolumny obliczane? [t/n]: ")
+            if confirm == 't':
+                self._push_undo("usunięcie kolumn stawek")
+                self.df = self.df.drop(columns=list(RATE_COLUMNS))
+                self.computed.reset()
+                self._mark_columns_changed()
+                self.is_modified = True
+                print("Usunięto kolumny stawek.\n")
+        else:
+            print("Powrót do menu.\n")
+
+    def sort_cost_estimate(self):
+        """Sortuje kosztorys według wybranego kryterium."""
+        print("\n=== Sortowanie kosztorysu ===")
+        if self.df.empty:
+            print("  Kosztorys jest pusty. Nie można sortować.\n")
+            return
+
+        print("  Opcje sortowania:")
+        print("    1. Po nazwie pozycji (A-Z)")
+        print("    2. Po koszcie (rosnąco)")
+        print("    3. Po kategorii (A-Z)")
+        print("    4. Po koszcie (malejąco)")
+        choice = self._get_user_input("Wpisz opcję (1-4, 'q' aby anulować): ")
+        if choice.lower() == 'q':
+            print("Anulowano. Powrót do menu.\n")
+            return
+
+        if choice not in ("1", "2", "3", "4"):
+            print("Nieprawidłowa opcja.\n")
+            return
+        self._push_undo("sortowanie")
+        with PROFILER.span("sort", option=choice, rows=len(self.df)):
+            if choice == "1":
+                self.df = self.df.sort_values(by="Pozycja")
+                print("Kosztorys posortowany po nazwie pozycji.\n")
+            elif choice == "2":
+                self.df = self.df.sort_values(by="Koszt całkowity (PLN)")
+                print("Kosztorys posortowany po koszcie (rosnąco).\n")
+            elif choice == "3":
+                self.df = self.df.sort_values(by="Kategoria")
+                print("Kosztorys posortowany po kategorii.\n")
+            else:
+                self.df = self.df.sort_values(by="Koszt całkowity (PLN)", ascending=False)
+                print("Kosztorys posortowany po koszcie (malejąco).\n")
+
+        self._mark_order_changed()
+        self.is_modified = True
+        self.display_cost_estimate()
+
+    def filter_cost_estimate(self):
+        """Filtruje kosztorys według kategorii lub zakresu kosztów."""
+        print("\n=== Filtrowanie kosztorysu ===")
+        if self.df.empty:
+            print("  Kosztorys jest pusty. Nie można filtrować.\n")
+            return
+
+        print("  Opcje filtrowania:")
+        print("    1. Po kategorii")
+        print("    2. Po zakresie kosztów")
+        choice = self._get_user_input("Wpisz opcję (1-2, 'q' aby anulować): ")
+        if choice.lower() == 'q':
+            print("Anulowano. Powrót do menu.\n")
+            return
+
+        if choice == "1":
+            categories = sorted(self.df["Kategoria"].dropna().unique())
+            if not categories:
+                print("  Brak kategorii w kosztorysie.\n")
+                return
+            print("\n  Dostępne kategorie:")
+            for idx, category in enumerate(categories, 1):
+                print(f"    {idx}. {category}")
+            
+            while True:
+                cat_choice = self._get_user_input("\nWpisz numer kategorii ('q' aby anulować): ")
+                if cat_choice.lower() == 'q':
+                    print("Anulowano. Powrót do menu.\n")
+                    return
+                try:
+                    cat_idx = int(cat_choice) - 1
+                    if 0 <= cat_idx < len(categories):
+                        kategoria = categories[cat_idx]
+                        with PROFILER.span("filter", by="kategoria", rows=len(self.df)):
+                            filtered_df = self.df[self.df["Kategoria"] == kategoria]
+                            if filtered_df.empty:
+                                print(f"  Brak pozycji w kategorii: {kategoria}\n")
+                            else:
+                                print(f"\n  Pozycje w kategorii {kategoria}:")
+                                print(filtered_df.to_string(index=False))
+                                print(f"  Łączny koszt w kategorii: {filtered_df['Koszt całkowity (PLN)'].sum():.2f} PLN\n")
+                        break
+                    else:
+                        print(f"Nieprawidłowy numer. Wybierz od 1 do {len(categories)} lub 'q'.")
+                except ValueError:
+                    print("Proszę wpisać poprawną liczbę lub 'q'.")
+        elif choice == "2":
+            while True:
+                min_koszt_input = self._get_user_input("Minimalny koszt (PLN) ('q' aby anulować): ")
+                if min_koszt_input.lower() == 'q':
+                    print("Anulowano. Powrót do menu.\n")
+                    return
+                min_koszt = self._validate_float(min_koszt_input, "Proszę podać poprawną wartość liczbową lub 'q'.")
+                if min_koszt is not None:
                     break
-                else:
-                    print(f"Nieprawidłowy numer. Wybierz od 1 do {len(units)}, wpisz własną jednostkę lub 'q'.")
-            except ValueError:
-                jednostka = unit_choice
-                if jednostka.strip():
+            while True:
+                max_koszt_input = self._get_user_input("Maksymalny koszt (PLN) ('q' aby anulować): ")
+                if max_koszt_input.lower() == 'q':
+                    print("Anulowano. Powrót do menu.\n")
+                    return
+                max_koszt = self._validate_float(max_koszt_input, "Proszę podać poprawną wartość liczbową lub 'q'.")
+                if max_koszt is not None:
                     break
+            with PROFILER.span("filter", by="koszt", rows=len(self.df)):
+                filtered_df = self.df[(self.df["Koszt całkowity (PLN)"] >= min_koszt) & 
+                                     (self.df["Koszt całkowity (PLN)"] <= max_koszt)]
+                if filtered_df.empty:
+                    print(f"  Brak pozycji w zakresie kosztów {min_koszt:.2f} - {max_koszt:.2f} PLN\n")
                 else:
-                    print("Proszę wpisać poprawną jednostkę, numer lub 'q'.")
+                    print(f"\n  Pozycje w zakresie kosztów {min_koszt:.2f} - {max_koszt:.2f} PLN:")
+                    print(filtered_df.to_string(index=False))
+                    print(f"  Łączny koszt w zakresie: {filtered_df['Koszt całkowity (PLN)'].sum():.2f} PLN\n")
+        else:
+            print("Nieprawidłowa opcja.\n")
+
+    def compare_cost_estimate(self):
+        """Porównuje bieżący kosztorys z kopią zapasową lub innym plikiem .xlsx."""
+        print("\n=== Porównanie wersji kosztorysu ===")
+        backups = []
+        if self.filename:
+            pattern = os.path.join(self.current_dir, f"backup_*_{os.path.basename(self.filename)}")
+            backups = sorted(glob.glob(pattern), key=os.path.getmtime, reverse=True)
+        others = [f for f in DIRECTORY_CACHE.files(self.current_dir, (".xlsx",))
+                  if f not in backups
+                  and not (self.filename and os.path.abspath(f) == os.path.abspath(self.filename))]
+        candidates = backups + sorted(others, key=os.path.getmtime, reverse=True)
+        if not candidates:
+            print("  Brak kopii zapasowych ani innych plików do porównania.\n")
+            return
+
+        print("  Pliki do porównania (najpierw kopie zapasowe bieżącego kosztorysu):")
+        for idx, file in enumerate(candidates, 1):
+            mod_time = datetime.fromtimestamp(os.path.getmtime(file)).strftime("%Y-%m-%d %H:%M:%S")
+            print(f"    {idx}. {os.path.basename(file)} (zmodyfikowany: {mod_time})")
 
         while True:
-            cena_input = self._get_user_input("Cena jednostkowa (PLN) (Enter dla 0, 'q' aby anulować): ", default="0")
-            if cena_input.lower() == 'q':
+            choice = self._get_user_input("\nWpisz numer pliku do porównania lub ścieżkę (Tab podpowiada), 'q' aby anulować: ",
+                                          completer=self._path_completer())
+            if choice.lower() == 'q':
                 print("Anulowano. Powrót do menu.\n")
                 return
-            if not cena_input:
-                cena_jednostkowa = 0.0
-                break
-            cena_jednostkowa = self._validate_float(cena_input, "Proszę podać poprawną wartość liczbową lub 'q'.")
-            if cena_jednostkowa is not None:
+            other_file = self._pick_path(choice, candidates)
+            if other_file is not None:
                 break
 
-        koszt_calkowity = ilosc * cena_jednostkowa
+        try:
+            old_df = read_cost_estimate(other_file)
+        except Exception as e:
+            print(f"{e}\nPowrót do menu.\n")
+            return
 
-        default_categories = ["Materiały", "Robocizna", "Meble", "Transport"]
-        categories = sorted(self.df["Kategoria"].dropna().unique()) if not self.df.empty else default_categories
-        if categories:
-            print("\n  Dostępne kategorie:")
-            for idx, category in enumerate(categories, 1):
-                print(f"    {idx}. {category}")
-        
-        while True:
-            cat_choice = self._get_user_input("\nWpisz numer kategorii lub Enter dla własnej ('q' aby anulować): ")
-            if cat_choice.lower() == 'q':
-                print("Anulowano. Powrót do menu.\n")
-                return
-            if not cat_choice:
-                kategoria = self._get_user_input("Własna kategoria ('q' aby anulować): ")
-                if kategoria.lower() == 'q':
-                    print("Anulowano. Powrót do menu.\n")
-                    return
-                if len(kategoria) > 1000:
-                    print("Kategoria jest za długa (maks. 1000 znaków).")
-                    continue
-                if kategoria.strip():
-                    break
-                else:
-                    print("Proszę wpisać poprawną kategorię lub 'q'.")
-            try:
-                cat_idx = int(cat_choice) - 1
-                if 0 <= cat_idx < len(categories):
-                    kategoria = categories[cat_idx]
-                    break
-                else:
-                    print(f"Nieprawidłowy numer. Wybierz od 1 do {len(categories)} lub 'q'.")
-            except ValueError:
-                print("Proszę wpisać poprawną liczbę, Enter lub 'q'.")
+        diff = diff_cost_estimates(old_df, self.df)
+        print(f"\n  Zmiany od '{os.path.basename(other_file)}' do bieżącego kosztorysu:")
+        print_diff_report(diff)
 
-        opis = self._get_user_input("Opis (opcjonalny, Enter aby pominąć, 'q' aby anulować): ")
-        if opis.lower() == 'q':
+        confirm = self._get_confirmation("Czy zapisać raport różnic do pliku .xlsx? [t/n]: ")
+        if confirm != 't':
+            return
+        default_name = "roznice.xlsx"
+        filename_input = self._get_user_input(f"Podaj nazwę pliku raportu (Enter dla '{default_name}'): ",
+                                              default=default_name, is_filename=True,
+                                              completer=self._path_completer(include_directories=False))
+        filename_input = self._validate_filename(filename_input or default_name)
+        if not filename_input:
             print("Anulowano. Powrót do menu.\n")
             return
-        if len(opis) > 1000:
-            print("Opis jest za długi (maks. 1000 znaków).")
-            opis = opis[:1000]
-
-        new_row = pd.DataFrame({
-            "Pozycja": [pozycja],
-            "Ilość": [ilosc],
-            "Jednostka": [jednostka],
-            "Cena jednostkowa (PLN)": [cena_jednostkowa],
-            "Koszt całkowity (PLN)": [koszt_calkowity],
-            "Kategoria": [kategoria],
-            "Opis": [opis]
-        })
-        self.df = pd.concat([self.df, new_row], ignore_index=True)
-        self.is_modified = True
-        print("Pozycja dodana pomyślnie!\n")
+        report_path = os.path.abspath(os.path.join(self.current_dir, filename_input))
+        try:
+            write_diff_excel(diff, report_path)
+            print(f"Raport różnic zapisany do: {os.path.basename(report_path)}\n")
+        except OSError as e:
+            print(f"Błąd podczas zapisu raportu różnic: {e}\n")
 
-    def edit_item(self):
-        """Edytuje istniejącą pozycję w kosztorysie po numerze pozycji."""
-        print("\n=== Edycja pozycji ===")
+    def export_data(self):
+        """Eksportuje bieżący kosztorys do pliku CSV, JSON Lines lub Parquet."""
+        print("\n=== Eksport kosztorysu ===")
         if self.df.empty:
-            print("  Kosztorys jest pusty. Nie można edytować.\n")
+            print("  Kosztorys jest pusty. Nie można eksportować.\n")
             return
 
-        self.display_cost_estimate()
+        formats = list(EXPORT_FORMATS)
+        print("  Dostępne formaty:")
+        for idx, ext in enumerate(formats, 1):
+            print(f"    {idx}. {EXPORT_FORMATS[ext]} ({ext})")
         while True:
-            pozycja_input = self._get_user_input("Wpisz numer pozycji do edycji ('q' aby anulować): ")
-            if pozycja_input.lower() == 'q':
+            choice = self._get_user_input("Wpisz numer formatu lub 'q' aby anulować: ")
+            if choice.lower() == 'q':
                 print("Anulowano. Powrót do menu.\n")
                 return
             try:
-                pozycja_idx = int(pozycja_input) - 1
-                if 0 <= pozycja_idx < len(self.df):
+                fmt_idx = int(choice) - 1
+                if 0 <= fmt_idx < len(formats):
+                    ext = formats[fmt_idx]
                     break
-                else:
-                    print(f"Nieprawidłowy numer. Wybierz od 1 do {len(self.df)} lub 'q'.")
+                print(f"Nieprawidłowy numer. Wybierz od 1 do {len(formats)} lub 'q'.")
             except ValueError:
                 print("Proszę wpisać poprawną liczbę lub 'q'.")
 
-        print(f"\nEdycja pozycji: {self.df.at[pozycja_idx, 'Pozycja']}")
-        pozycja = self.df.at[pozycja_idx, 'Pozycja']
-        
-        new_pozycja = self._get_user_input(f"Nowa nazwa pozycji (Enter aby pozostawić '{pozycja}', 'q' aby anulować): ", default=pozycja)
-        if new_pozycja.lower() == 'q':
+        base_name = os.path.splitext(os.path.basename(self.filename))[0] if self.filename else "wycennik"
+        default_name = base_name + ext
+        filename_input = self._get_user_input(
+            f"Podaj nazwę pliku w folderze {self.current_dir} (Enter dla '{default_name}', 'q' aby anulować): ",
+            default=default_name, is_filename=True,
+            completer=self._path_completer(extensions=tuple(EXPORT_FORMATS), include_directories=False)
+        )
+        if filename_input.lower() == 'q':
             print("Anulowano. Powrót do menu.\n")
             return
-        if len(new_pozycja) > 1000:
-            print("Nazwa pozycji jest za długa (maks. 1000 znaków).")
-            new_pozycja = pozycja
-        if not new_pozycja.strip():
-            new_pozycja = pozycja
-
-        ilosc_input = self._get_user_input(f"Nowa ilość (Enter aby pozostawić {self.df.at[pozycja_idx, 'Ilość']}, 'q' aby anulować): ", default=str(self.df.at[pozycja_idx, 'Ilość']))
-        if ilosc_input.lower() == 'q':
+        filename_input = self._validate_filename(os.path.splitext(filename_input or default_name)[0] + ".xlsx")
+        if not filename_input:
             print("Anulowano. Powrót do menu.\n")
             return
-        if not ilosc_input:
-            ilosc = self.df.at[pozycja_idx, 'Ilość']
-        else:
-            ilosc = self._validate_float(ilosc_input, "Nieprawidłowa wartość. Pozostawiono dotychczasową ilość.")
-            if ilosc is None:
-                ilosc = self.df.at[pozycja_idx, 'Ilość']
+        export_path = os.path.abspath(os.path.join(self.current_dir, os.path.splitext(filename_input)[0] + ext))
+        if os.path.exists(export_path):
+            confirm = self._get_confirmation(f"Plik '{os.path.basename(export_path)}' już istnieje. Nadpisać? [t/n]: ")
+            if confirm != 't':
+                print("Anulowano. Powrót do menu.\n")
+                return
+        try:
+            export_cost_estimate(self.df, export_path)
+            print(f"Kosztorys wyeksportowany do: {os.path.basename(export_path)}\n")
+        except Exception as e:
+            print(f"Błąd podczas eksportu: {e}\n")
+
+    def import_data(self):
+        """Wczytuje kosztorys z pliku CSV, JSON Lines lub Parquet w bieżącym folderze."""
+        print("\n=== Import kosztorysu ===")
+        data_files = DIRECTORY_CACHE.files(self.current_dir, tuple(EXPORT_FORMATS))
+        if not data_files:
+            print(f"  Brak plików {', '.join(EXPORT_FORMATS)} w folderze: {self.current_dir}\n")
+            return
+        data_files = sorted(data_files, key=os.path.getmtime, reverse=True)
+        print(f"  Dostępne pliki danych w folderze {self.current_dir}:")
+        for idx, file in enumerate(data_files, 1):
+            mod_time = datetime.fromtimestamp(os.path.getmtime(file)).strftime("%Y-%m-%d %H:%M:%S")
+            print(f"    {idx}. {os.path.basename(file)} (zmodyfikowany: {mod_time})")
 
-        units = ["szt", "m²", "godz", "m³", "kg", "l", "m", "t", "kWh"]
-        print("\n  Dostępne jednostki:")
-        for idx, unit in enumerate(units, 1):
-            print(f"    {idx}. {unit}")
-        
         while True:
-            unit_choice = self._get_user_input(f"\nWpisz numer jednostki lub własną jednostkę (Enter aby pozostawić '{self.df.at[pozycja_idx, 'Jednostka']}', 'q' aby anulować): ", default=self.df.at[pozycja_idx, 'Jednostka'])
-            if unit_choice.lower() == 'q':
+            choice = self._get_user_input("\nWpisz numer pliku lub ścieżkę (Tab podpowiada), 'q' aby anulować: ",
+                                          completer=self._path_completer(extensions=tuple(EXPORT_FORMATS)))
+            if choice.lower() == 'q':
                 print("Anulowano. Powrót do menu.\n")
                 return
-            if not unit_choice:
-                jednostka = self.df.at[pozycja_idx, 'Jednostka']
+            data_file = self._pick_path(choice, data_files, extensions=tuple(EXPORT_FORMATS))
+            if data_file is not None:
                 break
-            if len(unit_choice) > 50:
-                print("Jednostka jest za długa (maks. 50 znaków).")
-                continue
-            try:
-                unit_idx = int(unit_choice) - 1
-                if 0 <= unit_idx < len(units):
-                    jednostka = units[unit_idx]
-                    break
-                else:
-                    print(f"Nieprawidłowy numer. Wybierz od 1 do {len(units)}, wpisz własną jednostkę lub 'q'.")
-            except ValueError:
-                jednostka = unit_choice
-                if jednostka.strip():
-                    break
-                else:
-                    print("Proszę wpisać poprawną jednostkę, numer lub 'q'.")
 
-        cena_input = self._get_user_input(f"Nowa cena jednostkowa (Enter aby pozostawić {self.df.at[pozycja_idx, 'Cena jednostkowa (PLN)']}, 'q' aby anulować): ", default=str(self.df.at[pozycja_idx, 'Cena jednostkowa (PLN)']))
-        if cena_input.lower() == 'q':
-            print("Anulowano. Powrót do menu.\n")
+        try:
+            df = import_cost_estimate(data_file)
+        except Exception as e:
+            print(f"{e}\nPowrót do menu.\n")
             return
-        if not cena_input:
-            cena_jednostkowa = self.df.at[pozycja_idx, 'Cena jednostkowa (PLN)']
-        else:
-            cena_jednostkowa = self._validate_float(cena_input, "Nieprawidłowa wartość. Pozostawiono dotychczasową cenę.")
-            if cena_jednostkowa is None:
-                cena_jednostkowa = self.df.at[pozycja_idx, 'Cena jednostkowa (PLN)']
+        self._park_current()
+        self.df = df
+        self.is_modified = True
+        print(f"\nKosztorys zaimportowany z pliku: {os.path.basename(data_file)}")
+        print("Zapisz kosztorys, aby utworzyć plik .xlsx.\n")
+        self.display_cost_estimate()
+        self._validate_after_load()
 
-        koszt_calkowity = ilosc * cena_jednostkowa
+    def _validate_after_load(self):
+        """Sprawdza wczytany kosztorys i wypisuje krótkie podsumowanie znalezionych problemów."""
+        with PROFILER.span("validate", rows=len(self.df)):
+            report = validate_cost_estimate(self.df)
+        if report.empty:
+            return
+        errors = int((report["Poziom"] == VALIDATION_ERROR).sum())
+        print(f"  Sprawdzenie kosztorysu: błędy {errors}, ostrzeżenia {len(report) - errors} "
+              f"(pozycje {_format_row_numbers(report['Nr'].unique() - 1, limit=5)}).")
+        print("  Szczegóły: opcja 'Sprawdź poprawność kosztorysu' w menu głównym.\n")
 
-        default_categories = ["Materiały", "Robocizna", "Meble", "Transport"]
-        categories = sorted(self.df["Kategoria"].dropna().unique()) if not self.df.empty else default_categories
-        print("\n  Dostępne kategorie:")
-        for idx, category in enumerate(categories, 1):
-            print(f"    {idx}. {category}")
-        
-        while True:
-            cat_choice = self._get_user_input(f"\nWpisz numer kategorii lub Enter dla własnej (Enter aby pozostawić '{self.df.at[pozycja_idx, 'Kategoria']}', 'q' aby anulować): ")
-            if cat_choice.lower() == 'q':
-                print("Anulowano. Powrót do menu.\n")
-                return
-            if not cat_choice:
-                kategoria_input = self._get_user_input(f"Własna kategoria (Enter aby pozostawić '{self.df.at[pozycja_idx, 'Kategoria']}', 'q' aby anulować): ", default=self.df.at[pozycja_idx, 'Kategoria'])
-                if kategoria_input.lower() == 'q':
+    def validate_items(self):
+        """Sprawdza cały kosztorys i wyświetla raport problemów z numerami pozycji, z opcją zapisu do .xlsx."""
+        print("\n=== Sprawdzanie poprawności kosztorysu ===")
+        if self.df.empty:
+            print("  Kosztorys jest pusty.\n")
+            return
+        with PROFILER.span("validate", rows=len(self.df)):
+            report = validate_cost_estimate(self.df)
+        print_validation_report(report)
+        if report.empty:
+            return
+        filename_input = self._get_user_input(
+            "Podaj nazwę pliku .xlsx na raport (Enter aby pominąć): ", is_filename=True,
+            completer=self._path_completer(include_directories=False)
+        )
+        if not filename_input:
+            return
+        filename_input = self._validate_filename(filename_input)
+        if not filename_input:
+            return
+        report_path = os.path.abspath(os.path.normpath(os.path.join(self.current_dir, filename_input)))
+        if not report_path.startswith(os.path.abspath(self.current_dir)):
+            print(f"Nazwa pliku '{filename_input}' wykracza poza bieżący katalog.")
+            return
+        try:
+            write_styled_excel(report, report_path, total_row=False)
+            print(f"Raport zapisany do: {os.path.basename(report_path)}\n")
+        except Exception as e:
+            print(f"Błąd podczas zapisu raportu: {e}")
+
+    def merge_duplicate_items(self):
+        """Wyszukuje powtórzone pozycje, pokazuje ich grupy i scala wybrane (suma ilości, nowy koszt)."""
+        print("\n=== Duplikaty pozycji ===")
+        if self.df.empty:
+            print("  Kosztorys jest pusty.\n")
+            return
+        with PROFILER.span("dedupe.find", rows=len(self.df)):
+            duplicates = find_duplicates(self.df)
+        if duplicates.empty:
+            print("  Nie znaleziono powtórzonych pozycji.\n")
+            return
+        group_count = int(duplicates["Grupa"].max())
+        exact = int(duplicates.drop_duplicates("Grupa")["Rodzaj"].eq("dokładne").sum())
+        print(f"  Grup duplikatów: {group_count} (dokładne: {exact}, po normalizacji: {group_count - exact}), "
+              f"pozycji do usunięcia po scaleniu: {len(duplicates) - group_count}")
+        limit = 50
+        print(duplicates.head(limit).to_string(index=False))
+        if len(duplicates) > limit:
+            print(f"  ... i {len(duplicates) - limit} kolejnych")
+        print("\n  Scalenie sumuje ilości w pierwszej pozycji grupy i przelicza jej koszt; pozostałe pozycje są usuwane.")
+        print("  Opcje:")
+        print("    1. Scal wszystkie grupy")
+        print("    2. Scal wybrane grupy (np. 1-5,8)")
+        choice = self._get_user_input("Wpisz opcję (1-2, 'q' aby anulować): ")
+        if choice == "1":
+            groups = None
+        elif choice == "2":
+            while True:
+                groups_input = self._get_user_input(f"Numery grup 1-{group_count} ('q' aby anulować): ")
+                if groups_input.lower() == 'q':
                     print("Anulowano. Powrót do menu.\n")
                     return
-                if len(kategoria_input) > 1000:
-                    print("Kategoria jest za długa (maks. 1000 znaków).")
-                    kategoria = self.df.at[pozycja_idx, 'Kategoria']
-                else:
-                    kategoria = kategoria_input if kategoria_input.strip() else self.df.at[pozycja_idx, 'Kategoria']
-                if kategoria.strip():
+                try:
+                    groups = parse_row_ranges(groups_input, group_count) + 1
                     break
-                else:
-                    print("Proszę wpisać poprawną kategorię lub 'q'.")
+                except ValueError as e:
+                    print(e)
+        else:
+            print("Anulowano. Powrót do menu.\n")
+            return
+        confirm = self._get_confirmation("Czy na pewno scalić duplikaty? [t/n]: ")
+        if confirm != 't':
+            print("Anulowano. Powrót do menu.\n")
+            return
+        self._push_undo("scalenie powtórzonych pozycji")
+        with PROFILER.span("dedupe.merge", rows=len(duplicates)):
+            self.df, kept, removed = merge_duplicates(self.df, duplicates, groups)
+        self._mark_rows_deleted(removed)
+        self._mark_rows_changed(kept)
+        self.is_modified = True
+        print(f"Scalono grup: {len(kept)}, usunięto pozycji: {len(removed)}.\n")
+
+    def get_reports(self, top_n=REPORT_TOP_N):
+        """Zwraca raporty kosztorysu, licząc je ponownie tylko po zmianie danych."""
+        if top_n not in self._reports:
+            self._reports[top_n] = compute_reports(self.df, top_n)
+        return self._reports[top_n]
+
+    def _report_sheets(self):
+        """Zwraca arkusze raportów do zapisu w pliku .xlsx lub None, jeśli są wyłączone."""
+        if not self.report_sheets or self.df.empty:
+            return None
+        return report_sheets(self.get_reports())
+
+    def show_reports(self):
+        """Wyświetla zestawienie kosztów według kategorii i jednostek oraz najdroższe pozycje."""
+        print("\n=== Raporty kosztorysu ===")
+        if self.df.empty:
+            print("  Kosztorys jest pusty.\n")
+            return
+        top_input = self._get_user_input(
+            f"Ile najdroższych pozycji pokazać? (Enter dla {REPORT_TOP_N}, 'q' aby anulować): ", default=str(REPORT_TOP_N)
+        )
+        if top_input.lower() == 'q':
+            print("Anulowano. Powrót do menu.\n")
+            return
+        try:
+            top_n = int(top_input or REPORT_TOP_N)
+            if top_n < 1:
+                raise ValueError
+        except ValueError:
+            print("Proszę podać dodatnią liczbę całkowitą.\n")
+            return
+
+        reports = self.get_reports(top_n)
+        print("\n  Koszty według kategorii:")
+        print(reports["categories"].to_string(index=False))
+        print("\n  Ilości i koszty według jednostek:")
+        print(reports["units"].to_string(index=False))
+        print(f"\n  {top_n} najdroższych pozycji:")
+        print(reports["top"].to_string(index=False))
+        print(f"  Łączny koszt: {reports['total']:.2f} PLN\n")
+
+        state = "włączone" if self.report_sheets else "wyłączone"
+        confirm = self._get_confirmation(
+            f"Dołączanie raportów jako arkuszy przy zapisie .xlsx jest {state}. Zmienić? [t/n]: "
+        )
+        if confirm == 't':
+            self.report_sheets = not self.report_sheets
+            state = "włączone" if self.report_sheets else "wyłączone"
+            print(f"Arkusze raportów przy zapisie: {state}.\n")
+
+    def list_store_estimates(self):
+        """Wyświetla listę kosztorysów zapisanych w magazynie SQLite."""
+        names = self.store.list_estimates()
+        if not names:
+            print(f"  Brak kosztorysów w magazynie: {os.path.basename(self.store.path)}")
+            return []
+        print(f"\n  Kosztorysy w magazynie {os.path.basename(self.store.path)}:")
+        for idx, name in enumerate(names, 1):
+            print(f"    {idx}. {name}")
+        return names
+
+    def open_store_estimate(self, allow_new=False):
+        """Wczytuje kosztorys z magazynu SQLite po numerze.
+
+        Zwraca False, jeśli użytkownik chce zamiast tego wybrać plik .xlsx z bieżącego folderu.
+        """
+        names = self.list_store_estimates()
+        new_hint = "Enter dla nowego kosztorysu, " if allow_new else ""
+        while True:
+            choice = self._get_user_input(
+                f"\nWpisz numer kosztorysu, {new_hint}'x' aby wczytać plik .xlsx lub 'q' aby anulować: "
+            )
+            if choice.lower() == 'x':
+                return False
+            if choice.lower() == 'q' or (allow_new and not choice):
+                print("Tworzenie nowego kosztorysu.\n" if allow_new else "Anulowano. Powrót do menu.\n")
+                return True
             try:
-                cat_idx = int(cat_choice) - 1
-                if 0 <= cat_idx < len(categories):
-                    kategoria = categories[cat_idx]
+                name_idx = int(choice) - 1
+                if 0 <= name_idx < len(names):
                     break
-                else:
-                    print(f"Nieprawidłowy numer. Wybierz od 1 do {len(categories)} lub 'q'.")
+                print(f"Nieprawidłowy numer. Wybierz od 1 do {len(names)}, 'x' lub 'q'.")
             except ValueError:
-                print("Proszę wpisać poprawną liczbę, Enter lub 'q'.")
+                print("Proszę wpisać poprawną liczbę, 'x' lub 'q'.")
 
-        opis = self._get_user_input(f"Nowy opis (Enter aby pozostawić '{self.df.at[pozycja_idx, 'Opis']}', 'q' aby anulować): ", default=self.df.at[pozycja_idx, 'Opis'])
-        if opis.lower() == 'q':
+        if self._switch_to_open(store_table=names[name_idx]):
+            self.display_cost_estimate()
+            return True
+        try:
+            df = self.store.load(names[name_idx])
+        except (sqlite3.Error, pd.errors.DatabaseError) as e:
+            print(f"Błąd podczas wczytywania kosztorysu {names[name_idx]}: {e}\n")
+            return True
+        self._park_current()
+        self.df = df
+        self.store_table = names[name_idx]
+        print(f"\nKosztorys wczytany z magazynu: {self.store_table}\n")
+        self.display_cost_estimate()
+        return True
+
+    def _store_history_key(self, name):
+        """Zwraca klucz kosztorysu `name` z magazynu w historii kosztów (plik magazynu i nazwa tabeli)."""
+        return f"{self.history.relpath(self.store.path)}:{name}"
+
+    def _last_store_history(self, key):
+        """Zwraca ostatni wpis historii kosztorysu z magazynu (z pamięci, a przy pierwszym zapisie z pliku historii)."""
+        if self._store_history is not None and self._store_history["file"] == key:
+            return self._store_history
+        records = self.history.read(key)
+        return records[-1] if records else None
+
+    def save_to_store(self):
+        """Zapisuje kosztorys w magazynie SQLite.
+
+        Jeśli kosztorys pochodzi z tej samej tabeli, zapisywane są tylko wiersze z dziennika
+        zmian, więc czas zapisu nie zależy od wielkości kosztorysu.
+        """
+        if self.store_table:
+            default_name = self.store_table
+        elif self.filename:
+            default_name = os.path.splitext(os.path.basename(self.filename))[0]
+        else:
+            default_name = "wycennik"
+        name = self._get_user_input(
+            f"Podaj nazwę kosztorysu w magazynie (Enter dla '{default_name}', 'q' aby anulować): ",
+            default=default_name, is_filename=True
+        )
+        if name.lower() == 'q':
             print("Anulowano. Powrót do menu.\n")
             return
-        if len(opis) > 1000:
-            print("Opis jest za długi (maks. 1000 znaków).")
-            opis = opis[:1000]
+        name = self._validate_folder_name(name.strip() or default_name)
+        if not name:
+            print("Anulowano. Powrót do menu.\n")
+            return
+        if name != self.store_table and self.store.exists(name):
+            confirm = self._get_confirmation(f"Kosztorys '{name}' już istnieje w magazynie. Nadpisać? [t/n]: ")
+            if confirm != 't':
+                print("Anulowano. Powrót do menu.\n")
+                return
+        extra = [col for col in self.df.columns if col not in COLUMNS]
+        if extra:
+            print(f"Uwaga: magazyn przechowuje tylko kolumny {', '.join(COLUMNS)}. "
+                  f"Kolumny {', '.join(extra)} nie zostaną zapisane w magazynie.")
+            confirm = self._get_confirmation("Czy mimo to zapisać kosztorys w magazynie? [t/n]: ")
+            if confirm != 't':
+                print("Anulowano. Zapisz kosztorys do pliku .xlsx, aby zachować te kolumny.\n")
+                return
 
-        self.df.at[pozycja_idx, "Pozycja"] = new_pozycja
-        self.df.at[pozycja_idx, "Ilość"] = ilosc
-        self.df.at[pozycja_idx, "Jednostka"] = jednostka
-        self.df.at[pozycja_idx, "Cena jednostkowa (PLN)"] = cena_jednostkowa
-        self.df.at[pozycja_idx, "Koszt całkowity (PLN)"] = koszt_calkowity
-        self.df.at[pozycja_idx, "Kategoria"] = kategoria
-        self.df.at[pozycja_idx, "Opis"] = opis
-        self.is_modified = True
-        print("Pozycja zaktualizowana pomyślnie!\n")
+        key = self._store_history_key(name)
+        previous = None
+        try:
+            if name == self.store_table:
+                # Wpis historii powstaje z poprzedniego wpisu i zapisanych wierszy, bez sum całej tabeli
+                previous = self._last_store_history(key)
+                if previous is not None:
+                    removed = self.store.rows_by_id(name, self._changed_rows | self._deleted_rows)
+                self.store.commit_changes(name, self.df, self._changed_rows, self._deleted_rows,
+                                          self._order_changed)
+                print(f"Zapisano zmienione wiersze: {len(self._changed_rows)}, usunięte: {len(self._deleted_rows)}.")
+            else:
+                if not self.df.index.is_unique or not pd.api.types.is_integer_dtype(self.df.index):
+                    self.df = self.df.reset_index(drop=True)
+                self.store.write_full(name, self.df)
+        except sqlite3.Error as e:
+            print(f"Błąd podczas zapisu do magazynu: {e}\n")
+            return
+        if previous is None:
+            record = history_record(self.df, key, datetime.now())
+        else:
+            added = self.df.loc[[label for label in self._changed_rows if label in self.df.index]]
+            record = updated_history_record(previous, removed, added, key, datetime.now())
+        self.history.append([record])
+        self._store_history = record
+        self._reset_change_journal(keep_undo=True)
+        self._mark_undo_saved()
+        self.store_table = name
+        self.is_modified = False
+        print(f"Kosztorys zapisany w magazynie: {name}\n")
 
-    def delete_item(self):
-        """Usuwa pozycję z kosztorysu po numerze pozycji."""
-        print("\n=== Usuwanie pozycji ===")
         if self.df.empty:
-            print("  Kosztorys jest pusty. Nie można usunąć.\n")
             return
+        confirm = self._get_confirmation("Czy wyeksportować kosztorys do sformatowanego pliku .xlsx? [t/n]: ")
+        if confirm != 't':
+            return
+        excel_path = os.path.join(self.current_dir, f"{name}.xlsx")
+        if os.path.exists(excel_path):
+            confirm = self._get_confirmation(f"Plik '{name}.xlsx' już istnieje. Nadpisać? [t/n]: ")
+            if confirm != 't':
+                print("Anulowano eksport.\n")
+                return
+        try:
+            df_to_save, formulas = self._frame_for_excel()
+            write_styled_excel(df_to_save, excel_path, extra_sheets=self._report_sheets(), formulas=formulas)
+            print(f"Kosztorys wyeksportowany do: {name}.xlsx\n")
+        except OSError as e:
+            print(f"Błąd podczas eksportu do pliku .xlsx: {e}\n")
 
-        self.display_cost_estimate()
+    def rename_store_estimate(self):
+        """Zmienia nazwę bieżącego kosztorysu w magazynie SQLite."""
+        if not self.store_table:
+            print("  Brak kosztorysu wczytanego z magazynu. Najpierw otwórz lub zapisz kosztorys.\n")
+            return
+        new_name = self._get_user_input(
+            f"Podaj nową nazwę kosztorysu (Enter dla '{self.store_table}', 'q' aby anulować): ",
+            default=self.store_table, is_filename=True
+        )
+        if new_name.lower() == 'q' or not new_name.strip() or new_name == self.store_table:
+            print("Nazwa kosztorysu nie zmieniona. Powrót do menu.\n")
+            return
+        new_name = self._validate_folder_name(new_name.strip())
+        if not new_name:
+            print("Powrót do menu.\n")
+            return
+        if self.store.exists(new_name):
+            print(f"Kosztorys '{new_name}' już istnieje w magazynie.\n")
+            return
+        try:
+            self.store.rename(self.store_table, new_name)
+        except sqlite3.Error as e:
+            print(f"Błąd podczas zmiany nazwy kosztorysu: {e}\n")
+            return
+        self.store_table = new_name
+        print(f"Nazwa kosztorysu zmieniona na: {new_name}\n")
+
+    def delete_store_estimate(self):
+        """Usuwa wybrany kosztorys z magazynu SQLite."""
+        names = self.list_store_estimates()
+        if not names:
+            print("  Brak kosztorysów do usunięcia.\n")
+            return
         while True:
-            pozycja_input = self._get_user_input("Wpisz numer pozycji do usunięcia ('q' aby anulować): ")
-            if pozycja_input.lower() == 'q':
+            choice = self._get_user_input("\nWpisz numer kosztorysu do usunięcia lub 'q' aby anulować: ")
+            if choice.lower() == 'q':
                 print("Anulowano. Powrót do menu.\n")
                 return
             try:
-                pozycja_idx = int(pozycja_input) - 1
-                if 0 <= pozycja_idx < len(self.df):
+                name_idx = int(choice) - 1
+                if 0 <= name_idx < len(names):
                     break
-                else:
-                    print(f"Nieprawidłowy numer. Wybierz od 1 do {len(self.df)} lub 'q'.")
+                print(f"Nieprawidłowy numer. Wybierz od 1 do {len(names)} lub 'q'.")
             except ValueError:
                 print("Proszę wpisać poprawną liczbę lub 'q'.")
-
-        pozycja = self.df.at[pozycja_idx, "Pozycja"]
-        while True:
-            confirm = self._get_confirmation(f"Czy na pewno chcesz usunąć pozycję '{pozycja}'? [t/n]: ")
-            if confirm == 't':
-                self.df = self.df.drop(index=pozycja_idx).reset_index(drop=True)
-                self.is_modified = True
-                print(f"Pozycja '{pozycja}' usunięta pomyślnie!\n")
-                break
-            elif confirm == 'n' or confirm == 'q':
-                print("Anulowano. Powrót do menu.\n")
-                break
-            else:
-                print("Proszę wpisać 't' (tak), 'n' (nie) lub 'q' (anuluj).")
-
-    def sort_cost_estimate(self):
-        """Sortuje kosztorys według wybranego kryterium."""
-        print("\n=== Sortowanie kosztorysu ===")
-        if self.df.empty:
-            print("  Kosztorys jest pusty. Nie można sortować.\n")
-            return
-
-        print("  Opcje sortowania:")
-        print("    1. Po nazwie pozycji (A-Z)")
-        print("    2. Po koszcie (rosnąco)")
-        print("    3. Po kategorii (A-Z)")
-        print("    4. Po koszcie (malejąco)")
-        choice = self._get_user_input("Wpisz opcję (1-4, 'q' aby anulować): ")
-        if choice.lower() == 'q':
+        name = names[name_idx]
+        confirm = self._get_confirmation(f"Czy na pewno chcesz usunąć kosztorys '{name}' z magazynu? [t/n]: ")
+        if confirm != 't':
             print("Anulowano. Powrót do menu.\n")
             return
-
-        if choice == "1":
-            self.df = self.df.sort_values(by="Pozycja")
-            print("Kosztorys posortowany po nazwie pozycji.\n")
-        elif choice == "2":
-            self.df = self.df.sort_values(by="Koszt całkowity (PLN)")
-            print("Kosztorys posortowany po koszcie (rosnąco).\n")
-        elif choice == "3":
-            self.df = self.df.sort_values(by="Kategoria")
-            print("Kosztorys posortowany po kategorii.\n")
-        elif choice == "4":
-            self.df = self.df.sort_values(by="Koszt całkowity (PLN)", ascending=False)
-            print("Kosztorys posortowany po koszcie (malejąco).\n")
-        else:
-            print("Nieprawidłowa opcja.\n")
+        try:
+            self.store.delete(name)
+        except sqlite3.Error as e:
+            print(f"Błąd podczas usuwania kosztorysu '{name}': {e}\n")
             return
+        print(f"Kosztorys '{name}' usunięty z magazynu.\n")
+        if name == self.store_table:
+            print("Usunięto aktualnie wczytany kosztorys. Tworzenie nowego kosztorysu.\n")
+            self.df = pd.DataFrame(columns=COLUMNS)
+            self._reset_change_journal()
+            self.is_modified = False
 
-        self.is_modified = True
-        self.display_cost_estimate()
+    def _computed_enabled(self):
+        """Sprawdza, czy kosztorys ma kolumny stawek (VAT, narzut, rabat), a więc i kolumny obliczane."""
+        return all(col in self.df.columns for col in RATE_COLUMNS)
 
-    def filter_cost_estimate(self):
-        """Filtruje kosztorys według kategorii lub zakresu kosztów."""
-        print("\n=== Filtrowanie kosztorysu ===")
-        if self.df.empty:
-            print("  Kosztorys jest pusty. Nie można filtrować.\n")
-            return
+    def _frame_for_excel(self):
+        """Zwraca (kosztorys z wierszem RAZEM do zapisu, formuły kolumn obliczanych lub None).
 
-        print("  Opcje filtrowania:")
-        print("    1. Po kategorii")
-        print("    2. Po zakresie kosztów")
-        choice = self._get_user_input("Wpisz opcję (1-2, 'q' aby anulować): ")
-        if choice.lower() == 'q':
-            print("Anulowano. Powrót do menu.\n")
-            return
+        Kolumny obliczane są dołączane jako wartości albo, w trybie formuł, jako formuły Excela.
+        """
+        if not self._computed_enabled():
+            return with_summary_row(self.df), None
+        df = pd.concat([self.df, self.computed.get(self.df)], axis=1)
+        formulas = computed_column_formulas(df.columns) if self.formula_mode else None
+        return with_summary_row(df), formulas
 
-        if choice == "1":
-            categories = sorted(self.df["Kategoria"].dropna().unique())
-            if not categories:
-                print("  Brak kategorii w kosztorysie.\n")
-                return
-            print("\n  Dostępne kategorie:")
-            for idx, category in enumerate(categories, 1):
-                print(f"    {idx}. {category}")
-            
-            while True:
-                cat_choice = self._get_user_input("\nWpisz numer kategorii ('q' aby anulować): ")
-                if cat_choice.lower() == 'q':
-                    print("Anulowano. Powrót do menu.\n")
-                    return
-                try:
-                    cat_idx = int(cat_choice) - 1
-                    if 0 <= cat_idx < len(categories):
-                        kategoria = categories[cat_idx]
-                        filtered_df = self.df[self.df["Kategoria"] == kategoria]
-                        if filtered_df.empty:
-                            print(f"  Brak pozycji w kategorii: {kategoria}\n")
-                        else:
-                            print(f"\n  Pozycje w kategorii {kategoria}:")
-                            print(filtered_df.to_string(index=False))
-                            print(f"  Łączny koszt w kategorii: {filtered_df['Koszt całkowity (PLN)'].sum():.2f} PLN\n")
-                        break
-                    else:
-                        print(f"Nieprawidłowy numer. Wybierz od 1 do {len(categories)} lub 'q'.")
-                except ValueError:
-                    print("Proszę wpisać poprawną liczbę lub 'q'.")
-        elif choice == "2":
-            while True:
-                min_koszt_input = self._get_user_input("Minimalny koszt (PLN) ('q' aby anulować): ")
-                if min_koszt_input.lower() == 'q':
-                    print("Anulowano. Powrót do menu.\n")
-                    return
-                min_koszt = self._validate_float(min_koszt_input, "Proszę podać poprawną wartość liczbową lub 'q'.")
-                if min_koszt is not None:
-                    break
-            while True:
-                max_koszt_input = self._get_user_input("Maksymalny koszt (PLN) ('q' aby anulować): ")
-                if max_koszt_input.lower() == 'q':
-                    print("Anulowano. Powrót do menu.\n")
-                    return
-                max_koszt = self._validate_float(max_koszt_input, "Proszę podać poprawną wartość liczbową lub 'q'.")
-                if max_koszt is not None:
-                    break
-            filtered_df = self.df[(self.df["Koszt całkowity (PLN)"] >= min_koszt) & 
-                                 (self.df["Koszt całkowity (PLN)"] <= max_koszt)]
-            if filtered_df.empty:
-                print(f"  Brak pozycji w zakresie kosztów {min_koszt:.2f} - {max_koszt:.2f} PLN\n")
+    def _write_estimate_with_backup(self, backup_filename):
+        """Zapisuje kosztorys z wierszem RAZEM do pliku i tworzy kopię zapasową; zwraca False przy błędzie zapisu."""
+        with PROFILER.span("save.prepare"):
+            df_to_save, formulas = self._frame_for_excel()
+            extra_sheets = self._report_sheets()
+        
+        try:
+            write_styled_excel(df_to_save, self.filename, extra_sheets=extra_sheets, formulas=formulas)
+        except PermissionError:
+            print(f"Brak uprawnień do zapisu pliku: {os.path.basename(self.filename)}")
+            return False
+        except OSError as e:
+            if e.errno == 28:  # errno.ENOSPC - brak miejsca na urządzeniu
+                print("Brak miejsca na dysku. Nie można zapisać pliku.")
             else:
-                print(f"\n  Pozycje w zakresie kosztów {min_koszt:.2f} - {max_koszt:.2f} PLN:")
-                print(filtered_df.to_string(index=False))
-                print(f"  Łączny koszt w zakresie: {filtered_df['Koszt całkowity (PLN)'].sum():.2f} PLN\n")
-        else:
-            print("Nieprawidłowa opcja.\n")
+                print(f"Błąd podczas zapisu pliku: {e}")
+            return False
+        
+        if os.path.exists(self.filename) and os.path.getsize(self.filename) > 0:
+            try:
+                with PROFILER.span("save.backup"):
+                    write_styled_excel(df_to_save, backup_filename, extra_sheets=extra_sheets, formulas=formulas)
+                print(f"Utworzono kopię zapasową: {os.path.basename(backup_filename)}")
+            except Exception as e:
+                print(f"Błąd podczas tworzenia kopii zapasowej: {e}")
+        return True
+
+    def _confirm_save_with_errors(self, labels=None):
+        """Sprawdza kosztorys przed zapisem; przy błędach pokazuje je i pyta, czy mimo to zapisać.
+
+        Z `labels` sprawdzane są tylko te wiersze (etykiety indeksu), a numery pozycji w raporcie
+        odnoszą się do całego kosztorysu.
+        """
+        df = self.df if labels is None else self.df.loc[list(labels)]
+        with PROFILER.span("validate", rows=len(df)):
+            report = validate_cost_estimate(df)
+        errors = report[report["Poziom"] == VALIDATION_ERROR]
+        if errors.empty:
+            return True
+        if labels is not None:
+            errors = errors.assign(Nr=self.df.index.get_indexer(df.index[errors["Nr"].to_numpy() - 1]) + 1)
+            errors = errors.sort_values("Nr", kind="stable")
+        print("  Kosztorys zawiera błędy:")
+        print_validation_report(errors, limit=10)
+        if self._get_confirmation("Czy mimo to zapisać kosztorys? [t/n]: ") != 't':
+            print("Anulowano. Powrót do menu.\n")
+            return False
+        return True
 
     def save_cost_estimate(self):
         """Zapisuje kosztorys do pliku Excel z formatowaniem i kopią zapasową."""
         print("\n=== Zapisywanie kosztorysu ===")
+        # Zapis zmian do magazynu sprawdza tylko wiersze z dziennika, więc jego koszt nie zależy od wielkości kosztorysu
+        labels = self._changed_rows if self.store and self.store_table else None
+        if not self._confirm_save_with_errors(labels):
+            return
+        if self.store:
+            self.save_to_store()
+            return
         if self.df.empty:
             print("  Kosztorys jest pusty. Nie można zapisać.\n")
             return
 
         default_name = os.path.basename(self.filename) if self.filename else "wycennik.xlsx"
         prompt_message = f"Podaj nazwę pliku w folderze {self.current_dir} (Enter dla '{default_name}', 'q' aby anulować): "
-        filename_input = self._get_user_input(prompt_message, default=default_name, is_filename=True)
+        filename_input = self._get_user_input(prompt_message, default=default_name, is_filename=True,
+                                              completer=self._path_completer(include_directories=False))
         
         if filename_input.lower() == 'q':
             print("Anulowano. Powrót do menu.\n")
@@ -984,121 +4898,34 @@ class CostEstimateManager:
                 return
             else:
                 print("Proszę wpisać 't' (tak), 'n' (nie) lub 'q' (anuluj).")
+        if not self._confirm_overwrite_external():
+            return
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         backup_filename = os.path.join(self.current_dir, f"backup_{timestamp}_{os.path.basename(self.filename)}")
         
-        total_cost = self.df["Koszt całkowity (PLN)"].sum()
-        summary_row = pd.DataFrame({
-            "Pozycja": ["RAZEM"],
-            "Ilość": [""],
-            "Jednostka": [""],
-            "Cena jednostkowa (PLN)": [""],
-            "Koszt całkowity (PLN)": [total_cost],
-            "Kategoria": [""],
-            "Opis": [""]
-        })
-        df_to_save = pd.concat([self.df, summary_row], ignore_index=True)
-        
-        try:
-            df_to_save.to_excel(self.filename, index=False)
-        except PermissionError:
-            print(f"Brak uprawnień do zapisu pliku: {os.path.basename(self.filename)}")
-            return
-        except OSError as e:
-            if e.errno == 28:  # errno.ENOSPC - brak miejsca na urządzeniu
-                print("Brak miejsca na dysku. Nie można zapisać pliku.")
-            else:
-                print(f"Błąd podczas zapisu pliku: {e}")
+        with PROFILER.span("save", file=os.path.basename(self.filename), rows=len(self.df)):
+            saved = self._write_estimate_with_backup(backup_filename)
+        if not saved:
             return
-        
-        wb = load_workbook(self.filename)
-        ws = wb.active
-        
-        header_font = Font(bold=True)
-        header_fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
-        total_font = Font(bold=True)
-        border = Border(left=Side(style='thin'), right=Side(style='thin'), 
-                       top=Side(style='thin'), bottom=Side(style='thin'))
-        center_align = Alignment(horizontal='center', vertical='center')
-        left_align = Alignment(horizontal='left', vertical='center')
-        
-        for col_idx, column in enumerate(df_to_save.columns, 1):
-            cell = ws.cell(row=1, column=col_idx)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.border = border
-            
-        for row_idx in range(2, ws.max_row + 1):
-            for col_idx in range(1, ws.max_column + 1):
-                cell = ws.cell(row=row_idx, column=col_idx)
-                cell.border = border
-                if col_idx in [2, 3, 4, 5]:
-                    cell.alignment = center_align
-                    if col_idx in [2, 4, 5]:
-                        cell.number_format = '#,##0.00'
-                else:
-                    cell.alignment = left_align
-                if row_idx == ws.max_row:
-                    cell.font = total_font
-        
-        for col_idx, column in enumerate(df_to_save.columns, 1):
-            max_length = max(len(str(column)), 10)
-            for value in df_to_save[column]:
-                try:
-                    max_length = max(max_length, len(str(value)))
-                except:
-                    pass
-                adjusted_width = max_length * 1.2
-                ws.column_dimensions[get_column_letter(col_idx)].width = max(adjusted_width, 10)
-        
-        wb.save(self.filename)
-        
-        if os.path.exists(self.filename) and os.path.getsize(self.filename) > 0:
-            try:
-                df_to_save.to_excel(backup_filename, index=False)
-                wb_backup = load_workbook(backup_filename)
-                ws_backup = wb_backup.active
-                
-                for col_idx, column in enumerate(df_to_save.columns, 1):
-                    cell = ws_backup.cell(row=1, column=col_idx)
-                    cell.font = header_font
-                    cell.fill = header_fill
-                    cell.border = border
-                for row_idx in range(2, ws_backup.max_row + 1):
-                    for col_idx in range(1, ws_backup.max_column + 1):
-                        cell = ws_backup.cell(row=row_idx, column=col_idx)
-                        cell.border = border
-                        if col_idx in [2, 3, 4, 5]:
-                            cell.alignment = center_align
-                            if col_idx in [2, 4, 5]:
-                                cell.number_format = '#,##0.00'
-                        else:
-                            cell.alignment = left_align
-                        if row_idx == ws_backup.max_row:
-                            cell.font = total_font
-                for col_idx, column in enumerate(df_to_save.columns, 1):
-                    max_length = max(len(str(column)), 10)
-                    for value in df_to_save[column]:
-                        try:
-                            max_length = max(max_length, len(str(value)))
-                        except:
-                            pass
-                    adjusted_width = max_length * 1.2
-                    ws_backup.column_dimensions[get_column_letter(col_idx)].width = max(adjusted_width, 10)
-                wb_backup.save(backup_filename)
-                print(f"Utworzono kopię zapasową: {os.path.basename(backup_filename)}")
-            except Exception as e:
-                print(f"Błąd podczas tworzenia kopii zapasowej: {e}")
-        
+
         self.is_modified = False
+        self._mark_undo_saved()
+        self._track_shared_file(self.df)
+        if self.position_index is not None:
+            self.position_index.update_file(self.filename, self.df)
+        with PROFILER.span("save.history"):
+            self.history.record_save(self.df, self.filename, backup_filename)
         print(f"Kosztorys zapisany do: {os.path.basename(self.filename)}\n")
 
     def run(self):
         """Główna pętla programu z menu głównym."""
         while True:
+            self._check_external_change()
             print("\n=== Wycennik - Zarządzanie kosztorysem ===")
             print(f"  Bieżący folder: {self.current_dir}")
+            in_background = f" (w tle otwartych: {len(self.workspace)})" if len(self.workspace) else ""
+            print(f"  Bieżący kosztorys: {self._estimate_label()}{in_background}")
             print("  1. Otwórz kosztorys z pliku")
             print("  2. Wyświetl kosztorys")
             print("  3. Dodaj pozycję")
@@ -1112,8 +4939,22 @@ class CostEstimateManager:
             print("  11. Przenieś kosztorys do folderu")
             print("  12. Zmień nazwę kosztorysu")
             print("  13. Usuń plik kosztorysu")
-            print("  14. Wyjdź")
-            choice = self._get_user_input("\nWpisz opcję (1-14): ")
+            print("  14. Porównaj z kopią zapasową lub innym plikiem")
+            print("  15. Eksportuj kosztorys (CSV, JSON Lines, Parquet)")
+            print("  16. Importuj kosztorys (CSV, JSON Lines, Parquet)")
+            print("  17. Raporty (kategorie, jednostki, najdroższe pozycje)")
+            print("  18. Zmień wiele pozycji (zakres, kategoria, koszt, nazwa)")
+            print("  19. Kolumny obliczane (VAT, narzut, rabat)")
+            print("  20. Sprawdź poprawność kosztorysu")
+            print("  21. Scal powtórzone pozycje")
+            print("  22. Przeglądaj duży kosztorys (tylko odczyt)")
+            print("  23. Waluty i kursy")
+            print("  24. Szablony kosztorysów")
+            print("  25. Historia kosztorysu")
+            print("  26. Otwarte kosztorysy (przełącz, nowy, zamknij)")
+            print("  27. Cofnij ostatnią zmianę")
+            print("  28. Wyjdź")
+            choice = self._get_user_input("\nWpisz opcję (1-28): ")
             print()
 
             if choice == "1":
@@ -1143,7 +4984,39 @@ class CostEstimateManager:
             elif choice == "13":
                 self.delete_cost_estimate()
             elif choice == "14":
-                if self.is_modified:
+                self.compare_cost_estimate()
+            elif choice == "15":
+                self.export_data()
+            elif choice == "16":
+                self.import_data()
+            elif choice == "17":
+                self.show_reports()
+            elif choice == "18":
+                self.bulk_edit_items()
+            elif choice == "19":
+                self.computed_columns_menu()
+            elif choice == "20":
+                self.validate_items()
+            elif choice == "21":
+                self.merge_duplicate_items()
+            elif choice == "22":
+                self.browse_cost_estimate()
+            elif choice == "23":
+                self.currency_menu()
+            elif choice == "24":
+                self.templates_menu()
+            elif choice == "25":
+                self.show_history()
+            elif choice == "26":
+                self.workspace_menu()
+            elif choice == "27":
+                self.undo_last_change()
+            elif choice == "28":
+                unsaved = [self._estimate_label()] if self.is_modified else []
+                unsaved += [self._estimate_label(state) for state in self.workspace.entries.values()
+                            if state["is_modified"]]
+                if unsaved:
+                    print(f"Niezapisane zmiany w kosztorysach: {', '.join(unsaved)}")
                     while True:
                         confirm = self._get_confirmation("Czy na pewno chcesz wyjść bez zapisywania zmian? [t/n]: ")
                         if confirm == 't':
@@ -1158,11 +5031,576 @@ class CostEstimateManager:
                     print("Zakończenie programu.\n")
                     return
             else:
-                print("Nieprawidłowa opcja. Wybierz od 1 do 14.\n")
+                print("Nieprawidłowa opcja. Wybierz od 1 do 28.\n")
+
+class EstimateCache:
+    """Pamięć podręczna LRU wczytanych kosztorysów (klucz: ścieżka pliku).
+
+    Wpis z niezapisanymi zmianami nie jest usuwany z pamięci, nawet po przekroczeniu pojemności.
+    """
+
+    def __init__(self, capacity=8):
+        """Tworzy pustą pamięć podręczną na `capacity` kosztorysów."""
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+    def get(self, path):
+        """Zwraca wpis {df, mtime, modified, shared} dla ścieżki lub None i oznacza go jako ostatnio używany."""
+        entry = self.entries.get(path)
+        if entry is not None:
+            self.entries.move_to_end(path)
+        return entry
+
+    def put(self, path, df, mtime, shared=None):
+        """Dodaje wczytany kosztorys (z jego SharedFile) i usuwa najdawniej używane, niezmodyfikowane wpisy."""
+        self.entries[path] = {"df": df, "mtime": mtime, "modified": False, "shared": shared}
+        self.entries.move_to_end(path)
+        for old_path in list(self.entries):
+            if len(self.entries) <= self.capacity:
+                break
+            if old_path != path and not self.entries[old_path]["modified"]:
+                del self.entries[old_path]
+        return self.entries[path]
+
+
+class EstimateConflict(Exception):
+    """Plik kosztorysu zmienił się poza serwerem od wczytania (odpowiedź 409)."""
+
+
+class EstimateServer:
+    """Lokalny serwer HTTP/JSON (asyncio) udostępniający operacje na kosztorysach z jednego katalogu.
+
+    Wczytane kosztorysy są trzymane w pamięci podręcznej LRU, wczytywanie i zapis plików .xlsx
+    odbywa się w puli wątków, a operacje zmieniające dany plik są wykonywane po kolei (blokada na plik).
+    Kosztorys z niezapisanymi zmianami ma blokadę informacyjną we wspólnym folderze (jak w menu),
+    a zapis pliku zmienionego z zewnątrz wymaga scalenia zmian lub jawnego nadpisania.
+    """
+
+    MAX_BODY = 1024 * 1024
+    DEFAULT_LIMIT = 100
+    EDITABLE_COLUMNS = ["Pozycja", "Ilość", "Jednostka", "Cena jednostkowa (PLN)", "Kategoria", "Opis"]
+
+    def __init__(self, root_dir, host="127.0.0.1", port=8765, cache_size=8):
+        """Przygotowuje serwer dla katalogu `root_dir`."""
+        self.root_dir = os.path.abspath(root_dir)
+        self.host = host
+        self.port = port
+        self.cache = EstimateCache(cache_size)
+        self.history = EstimateHistory(self.root_dir)
+        self.locks = {}
+        self.server = None
+
+    def run(self):
+        """Uruchamia serwer i obsługuje żądania do przerwania (Ctrl+C)."""
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            print("\nZatrzymano serwer.")
+
+    async def serve_forever(self):
+        """Nasłuchuje na skonfigurowanym adresie i obsługuje połączenia."""
+        await self.start()
+        print(f"Serwer kosztorysów: http://{self.host}:{self.port}/estimates (folder: {self.root_dir})")
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            self.release_locks()
+
+    def release_locks(self):
+        """Zdejmuje blokady plików założone przez serwer (przy zatrzymaniu)."""
+        for entry in self.cache.entries.values():
+            if entry["shared"] is not None:
+                entry["shared"].unlock()
+
+    async def start(self):
+        """Otwiera gniazdo nasłuchujące (port 0 oznacza wolny port wybrany przez system)."""
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def _handle_connection(self, reader, writer):
+        """Obsługuje połączenie HTTP/1.1 (z utrzymywaniem połączenia)."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                request = request_line.decode("latin-1").split()
+                if len(request) != 3:
+                    await self._respond(writer, 400, {"error": "Niepoprawny wiersz żądania HTTP."}, False)
+                    break
+                method, target, version = request
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                length = headers.get("content-length", "0")
+                if not length.isdigit():
+                    await self._respond(writer, 400, {"error": "Niepoprawny nagłówek Content-Length."}, False)
+                    break
+                length = int(length)
+                if length > self.MAX_BODY:
+                    status, payload = 413, {"error": "Zbyt duże żądanie."}
+                    body = b""
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = await self.dispatch(method, target, body)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive or length > self.MAX_BODY:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, payload, keep_alive):
+        """Wysyła odpowiedź HTTP z danymi JSON."""
+        data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data
+        )
+        await writer.drain()
+
+    async def dispatch(self, method, target, body):
+        """Kieruje żądanie do odpowiedniej operacji; zwraca (kod HTTP, dane JSON)."""
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.strip("/").split("/") if part]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            data = json.loads(body.decode("utf-8")) if body else {}
+            if parts == ["estimates"] and method == "GET":
+                return 200, self.list_estimates()
+            if len(parts) >= 2 and parts[0] == "estimates":
+                path = self._estimate_path(parts[1])
+                rest = parts[2:]
+                if not rest and method == "GET":
+                    return 200, await self.summary(path)
+                if rest == ["items"] and method == "GET":
+                    return 200, await self.query(path, query)
+                if rest == ["items"] and method == "POST":
+                    return 201, await self.add_item(path, data)
+                if len(rest) == 2 and rest[0] == "items" and method in ("PATCH", "PUT"):
+                    return 200, await self.edit_item(path, rest[1], data)
+                if len(rest) == 2 and rest[0] == "items" and method == "DELETE":
+                    return 200, await self.delete_item(path, rest[1])
+                if rest == ["save"] and method == "POST":
+                    return 200, await self.save(path, data)
+            return 404, {"error": f"Nieznana operacja: {method} {url.path}"}
+        except (FileNotFoundError, IndexError) as e:
+            return 404, {"error": str(e)}
+        except EstimateConflict as e:
+            return 409, {"error": str(e)}
+        except KeyError as e:
+            return 400, {"error": str(e.args[0]) if e.args else str(e)}
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": str(e)}
+
+    def _estimate_path(self, name):
+        """Zamienia nazwę kosztorysu z adresu na ścieżkę pliku w katalogu serwera."""
+        if not name.endswith(".xlsx"):
+            name += ".xlsx"
+        if re.search(r'[<>:"/\\|?*\n\r\t\0]', name) or ".." in name or len(name) > 255:
+            raise ValueError(f"Niepoprawna nazwa kosztorysu: {name}")
+        return os.path.join(self.root_dir, name)
+
+    def _lock(self, path):
+        if path not in self.locks:
+            self.locks[path] = asyncio.Lock()
+        return self.locks[path]
+
+    def list_estimates(self):
+        """Zwraca listę kosztorysów .xlsx w katalogu serwera (bez kopii zapasowych)."""
+        files = [f for f in glob.glob(os.path.join(self.root_dir, "*.xlsx"))
+                 if os.path.isfile(f) and not os.path.basename(f).startswith("backup_")]
+        files = sorted(files, key=os.path.getmtime, reverse=True)
+        return {"estimates": [
+            {"name": os.path.basename(f),
+             "modified": datetime.fromtimestamp(os.path.getmtime(f)).isoformat(timespec="seconds"),
+             "cached": f in self.cache.entries}
+            for f in files
+        ]}
+
+    async def _entry(self, path):
+        """Zwraca wpis kosztorysu z pamięci podręcznej, wczytując plik w puli wątków, gdy to konieczne."""
+        entry = self.cache.get(path)
+        if entry is not None and (entry["modified"] or not os.path.exists(path)
+                                  or os.path.getmtime(path) == entry["mtime"]):
+            return entry
+        async with self._lock(path):
+            return await self._entry_locked(path)
+
+    @staticmethod
+    def _records(df, numbers):
+        """Zamienia wiersze na listę słowników JSON z numerem pozycji ("Nr", jak w menu); NaN -> null."""
+        columns = {col: [None if isinstance(v, float) and v != v else v for v in df[col].tolist()]
+                   for col in COLUMNS}
+        return [dict({"Nr": int(nr)}, **{col: columns[col][i] for col in COLUMNS})
+                for i, nr in enumerate(numbers)]
+
+    async def summary(self, path):
+        """Zwraca podstawowe informacje o kosztorysie: liczbę pozycji i łączny koszt."""
+        entry = await self._entry(path)
+        df = entry["df"]
+        return {
+            "name": os.path.basename(path),
+            "rows": len(df),
+            "total": float(df["Koszt całkowity (PLN)"].sum()),
+            "categories": sorted(str(c) for c in df["Kategoria"].dropna().unique()),
+            "modified": entry["modified"],
+            # Osoba, która miała plik otwarty w menu, gdy serwer zakładał blokadę przy pierwszej zmianie
+            "locked_by": entry["shared"].lock_owner if entry["shared"] is not None else None,
+        }
+
+    async def query(self, path, params):
+        """Filtruje, sortuje i stronicuje pozycje kosztorysu.
+
+        Parametry: kategoria, pozycja (fragment nazwy), min_koszt, max_koszt, sort (nazwa kolumny),
+        desc (1/0), offset, limit. Filtry działają na tablicach numpy, a do JSON trafia tylko strona wyników.
+        """
+        df = (await self._entry(path))["df"]
+        costs = df["Koszt całkowity (PLN)"].to_numpy(dtype=float)
+        mask = np.ones(len(df), dtype=bool)
+        if "kategoria" in params:
+            mask &= (df["Kategoria"] == params["kategoria"]).to_numpy()
+        if "pozycja" in params:
+            mask &= df["Pozycja"].astype(str).str.contains(params["pozycja"], case=False, regex=False).to_numpy()
+        if "min_koszt" in params:
+            mask &= costs >= float(params["min_koszt"])
+        if "max_koszt" in params:
+            mask &= costs <= float(params["max_koszt"])
+        positions = np.flatnonzero(mask)
+        if "sort" in params:
+            if params["sort"] not in COLUMNS:
+                raise ValueError(f"Nieznana kolumna sortowania: {params['sort']}")
+            # Puste komórki (NaN w kolumnach tekstowych) trafiają na koniec w obu kierunkach
+            values = df[params["sort"]].iloc[positions].reset_index(drop=True)
+            order = values.sort_values(ascending=params.get("desc") not in ("1", "true", "tak"),
+                                       kind="stable", na_position="last").index.to_numpy()
+            positions = positions[order]
+        offset = max(int(params.get("offset", 0)), 0)
+        limit = min(max(int(params.get("limit", self.DEFAULT_LIMIT)), 0), 10_000)
+        page_positions = positions[offset:offset + limit]
+        return {
+            "matched": len(positions),
+            "total": float(costs[positions].sum()),
+            "offset": offset,
+            "items": self._records(df.iloc[page_positions], page_positions + 1),
+        }
+
+    def _validated_fields(self, data, current=None):
+        """Sprawdza pola pozycji z żądania (te same ograniczenia co w menu) i zwraca słownik wartości."""
+        unknown = set(data) - set(self.EDITABLE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Nieznane pola: {', '.join(sorted(unknown))}")
+        fields = dict(current or {})
+        for col, value in data.items():
+            if col in NUMERIC_COLUMNS:
+                value = float(value)
+                if value < 0:
+                    raise ValueError(f"Wartość '{col}' nie może być ujemna.")
+                if value > 1_000_000:
+                    raise ValueError(f"Wartość '{col}' jest za duża (maks. 1 000 000).")
+            else:
+                value = "" if value is None else str(value)
+                max_length = 50 if col == "Jednostka" else 1000
+                if len(value) > max_length:
+                    raise ValueError(f"Pole '{col}' jest za długie (maks. {max_length} znaków).")
+            fields[col] = value
+        if not str(fields.get("Pozycja", "")).strip():
+            raise ValueError("Nazwa pozycji nie może być pusta.")
+        fields.setdefault("Ilość", 1.0)
+        fields.setdefault("Cena jednostkowa (PLN)", 0.0)
+        fields["Koszt całkowity (PLN)"] = fields["Ilość"] * fields["Cena jednostkowa (PLN)"]
+        return fields
+
+    @staticmethod
+    def _mark_modified(entry):
+        """Oznacza wpis jako zmieniony i zakłada blokadę pliku, aby ostrzec osoby otwierające go w menu."""
+        entry["modified"] = True
+        if entry["shared"] is not None and not entry["shared"].owns_lock:
+            entry["shared"].lock()
+
+    @staticmethod
+    def _row_label(df, nr):
+        """Zamienia numer pozycji (od 1, jak w menu) na etykietę wiersza; brak pozycji to IndexError (404)."""
+        position = int(nr) - 1
+        if not 0 <= position < len(df):
+            raise IndexError(f"Nieprawidłowy numer pozycji: {nr}. Wybierz od 1 do {len(df)}.")
+        return df.index[position]
+
+    async def add_item(self, path, data):
+        """Dodaje pozycję na końcu kosztorysu."""
+        async with self._lock(path):
+            entry = await self._entry_locked(path)
+            fields = self._validated_fields(data)
+            df = entry["df"]
+            label = int(df.index.max()) + 1 if len(df) else 0
+            new_row = pd.DataFrame({col: [fields.get(col, "")] for col in COLUMNS}, index=[label])
+            if CURRENCY_COLUMN in df.columns and FOREIGN_PRICE_COLUMN in df.columns:
+                # Pozycje dodawane przez API są w PLN
+                new_row[CURRENCY_COLUMN] = BASE_CURRENCY
+                new_row[FOREIGN_PRICE_COLUMN] = fields["Cena jednostkowa (PLN)"]
+            entry["df"] = pd.concat([df, new_row])
+            self._mark_modified(entry)
+            return {"Nr": len(entry["df"]), "item": {col: fields.get(col, "") for col in COLUMNS}}
+
+    async def edit_item(self, path, nr, data):
+        """Zmienia wskazane pola pozycji i przelicza jej koszt całkowity."""
+        async with self._lock(path):
+            entry = await self._entry_locked(path)
+            df = entry["df"]
+            label = self._row_label(df, nr)
+            current = {col: df.at[label, col] for col in self.EDITABLE_COLUMNS}
+            fields = self._validated_fields(data, current)
+            foreign = None
+            if "Cena jednostkowa (PLN)" in data:
+                foreign = _foreign_prices_for(df, [label], [fields["Cena jednostkowa (PLN)"]])
+            for col in COLUMNS:
+                df.at[label, col] = fields[col]
+            if foreign is not None:
+                df.at[label, FOREIGN_PRICE_COLUMN] = foreign[0]
+            self._mark_modified(entry)
+            return {"Nr": int(nr), "item": {col: fields[col] for col in COLUMNS}}
+
+    async def delete_item(self, path, nr):
+        """Usuwa pozycję o podanym numerze."""
+        async with self._lock(path):
+            entry = await self._entry_locked(path)
+            label = self._row_label(entry["df"], nr)
+            removed = entry["df"].at[label, "Pozycja"]
+            entry["df"] = entry["df"].drop(index=label)
+            self._mark_modified(entry)
+            return {"deleted": removed, "rows": len(entry["df"])}
+
+    async def _entry_locked(self, path):
+        """Jak `_entry`, ale do użycia pod blokadą pliku (wczytuje bez ponownego blokowania)."""
+        entry = self.cache.get(path)
+        if entry is None or (not entry["modified"] and os.path.getmtime(path) != entry["mtime"]):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Plik {os.path.basename(path)} nie istnieje.")
+            mtime = os.path.getmtime(path)
+            loop = asyncio.get_running_loop()
+            df = await loop.run_in_executor(None, read_cost_estimate, path)
+            shared = await loop.run_in_executor(None, SharedFile, path, df)
+            entry = self.cache.put(path, df, mtime, shared)
+        return entry
+
+    async def _merge_external(self, path, entry):
+        """Wczytuje plik zmieniony z zewnątrz i scala jego zmiany z kosztorysem w pamięci (jak w menu)."""
+        shared = entry["shared"]
+        loop = asyncio.get_running_loop()
+        external = await loop.run_in_executor(None, read_cost_estimate, path)
+        df = entry["df"]
+        next_id = int(df.index.max()) + 1 if len(df) else 0
+        merged, added, removed, conflicts = await loop.run_in_executor(
+            None, merge_external_changes, df, shared.base_hashes, external, next_id)
+        entry["df"] = merged
+        return {"added": len(added), "removed": len(removed),
+                "conflicts": [{"Nr": int(nr), "Pozycja": name}
+                              for nr, name in zip(conflicts["Nr"], conflicts["Pozycja"])]}
+
+    async def save(self, path, data=None):
+        """Zapisuje kosztorys do pliku .xlsx z formatowaniem i kopią zapasową (w puli wątków).
+
+        Jeśli plik zmienił się od wczytania, zgłaszany jest konflikt (409), chyba że żądanie
+        zawiera "merge": true (scalenie zmian z pliku przed zapisem) lub "overwrite": true.
+        """
+        data = data or {}
+        async with self._lock(path):
+            entry = await self._entry_locked(path)
+            shared = entry["shared"]
+            merged = None
+            if shared is not None and shared.changed_since_sync():
+                if data.get("merge"):
+                    merged = await self._merge_external(path, entry)
+                elif not data.get("overwrite"):
+                    raise EstimateConflict(
+                        f"Plik {os.path.basename(path)} został zmieniony poza serwerem od wczytania. "
+                        "Wyślij \"merge\": true, aby scalić zmiany, lub \"overwrite\": true, aby nadpisać plik.")
+            df_to_save = with_summary_row(entry["df"])
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            backup_path = os.path.join(self.root_dir, f"backup_{timestamp}_{os.path.basename(path)}")
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, write_styled_excel, df_to_save, path)
+            await loop.run_in_executor(None, write_styled_excel, df_to_save, backup_path)
+            self.history.record_save(entry["df"], path, backup_path)
+            entry["mtime"] = os.path.getmtime(path)
+            entry["modified"] = False
+            if shared is not None:
+                await loop.run_in_executor(None, shared.remember, entry["df"])
+                shared.unlock()
+            result = {"saved": os.path.basename(path), "backup": os.path.basename(backup_path),
+                      "rows": len(entry["df"])}
+            if merged is not None:
+                result["merged"] = merged
+            return result
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Wycennik - Zarządzanie kosztorysem")
     parser.add_argument("path", type=str, nargs='?', default=None, help="Ścieżka do pliku .xlsx lub katalogu")
+    parser.add_argument("--diff", nargs=2, metavar=("STARY", "NOWY"), default=None,
+                        help="Porównuje dwa pliki kosztorysu i wyświetla różnice")
+    parser.add_argument("--diff-xlsx", metavar="PLIK", default=None,
+                        help="Zapisuje raport różnic (--diff) do pliku .xlsx")
+    parser.add_argument("--export", metavar="PLIK", default=None,
+                        help="Eksportuje kosztorys podany jako 'path' do pliku .csv, .jsonl, .parquet lub .xlsx")
+    parser.add_argument("--store", metavar="PLIK_DB", default=None,
+                        help="Przechowuje kosztorysy w magazynie SQLite (zapis tylko zmienionych wierszy)")
+    parser.add_argument("--profile", nargs="?", const="", default=None, metavar="PLIK_JSONL",
+                        help="Mierzy czas faz operacji i zapisuje ślad JSON Lines (także zmienna WYCENNIK_PROFILE)")
+    parser.add_argument("--profile-capture", choices=Profiler.CAPTURE_MODES, default=None,
+                        help="Dodatkowo profiluje każdą operację przez cProfile lub tracemalloc")
+    parser.add_argument("--serve", type=int, metavar="PORT", default=None,
+                        help="Uruchamia lokalny serwer HTTP/JSON dla kosztorysów z folderu 'path' (lub bieżącego)")
+    parser.add_argument("--host", default="127.0.0.1", help="Adres nasłuchiwania serwera (domyślnie 127.0.0.1)")
+    parser.add_argument("--cache-size", type=int, default=8,
+                        help="Liczba kosztorysów trzymanych w pamięci przez serwer (domyślnie 8)")
+    parser.add_argument("--validate", nargs="+", metavar="PLIK", default=None,
+                        help="Sprawdza poprawność plików kosztorysów (lub wszystkich .xlsx w folderach) bez menu")
+    parser.add_argument("--validate-xlsx", metavar="PLIK", default=None,
+                        help="Zapisuje zbiorczy raport sprawdzania (--validate) do pliku .xlsx")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Liczba procesów dla --validate, --migrate i --history-backfill (domyślnie liczba rdzeni)")
+    parser.add_argument("--memory-budget", type=int, metavar="MB", default=WORKSPACE_MEMORY_BUDGET_MB,
+                        help="Pamięć na kosztorysy otwarte w tle; starsze są zrzucane na dysk "
+                             f"(domyślnie {WORKSPACE_MEMORY_BUDGET_MB} MB)")
+    parser.add_argument("--migrate", action="store_true",
+                        help="Przenosi kosztorysy z folderu 'path' (lub bieżącego, z podfolderami) do bieżącego układu")
+    parser.add_argument("--column-map", metavar="PLIK_JSON", default=None,
+                        help="Dodatkowe nazwy kolumn dla --migrate: obiekt JSON {\"stara nazwa\": \"kolumna\"}")
+    parser.add_argument("--record", metavar="PLIK_JSONL", default=None,
+                        help="Nagrywa odpowiedzi sesji (z czasem każdego kroku) do pliku skryptu")
+    parser.add_argument("--replay", metavar="PLIK_JSONL", default=None,
+                        help="Odtwarza nagraną sesję bez terminala i wypisuje czas każdego kroku")
+    parser.add_argument("--replay-report", metavar="PLIK_JSONL", default=None,
+                        help="Zapisuje czasy kroków odtworzenia (--replay) do pliku w formacie skryptu")
+    parser.add_argument("--history-backfill", action="store_true",
+                        help="Uzupełnia historię kosztów folderu 'path' (lub bieżącego) z kopii zapasowych")
     args = parser.parse_args()
-    manager = CostEstimateManager(initial_path=args.path)
-    manager.run()
+    profile_path = args.profile if args.profile is not None else os.environ.get("WYCENNIK_PROFILE")
+    if profile_path is not None and profile_path.lower() not in ("0", "false", "nie"):
+        if not profile_path or profile_path.lower() in ("1", "true", "tak"):
+            profile_path = f"wycennik_profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        capture = args.profile_capture or os.environ.get("WYCENNIK_PROFILE_CAPTURE") or None
+        if capture is not None and capture not in Profiler.CAPTURE_MODES:
+            parser.error(f"nieprawidłowa wartość WYCENNIK_PROFILE_CAPTURE: '{capture}' "
+                         f"(dostępne: {', '.join(Profiler.CAPTURE_MODES)})")
+        PROFILER.configure(profile_path, capture)
+    if args.serve is not None:
+        root_dir = args.path or os.getcwd()
+        if not os.path.isdir(root_dir):
+            parser.exit(1, f"Folder {root_dir} nie istnieje.\n")
+        EstimateServer(root_dir, host=args.host, port=args.serve, cache_size=args.cache_size).run()
+        parser.exit(0)
+    if args.export:
+        if not args.path:
+            parser.error("--export wymaga ścieżki kosztorysu źródłowego")
+        try:
+            if os.path.splitext(args.path)[1].lower() in EXPORT_FORMATS:
+                df = import_cost_estimate(args.path)
+            else:
+                df = read_cost_estimate(args.path)
+            if args.export.lower().endswith(".xlsx"):
+                write_styled_excel(with_summary_row(df), args.export)
+            else:
+                export_cost_estimate(df, args.export)
+        except Exception as e:
+            parser.exit(1, f"{e}\n")
+        print(f"Wyeksportowano {len(df)} pozycji do: {args.export}")
+        parser.exit(0)
+    if args.migrate:
+        root_dir = args.path or os.getcwd()
+        if not os.path.isdir(root_dir):
+            parser.exit(1, f"Folder {root_dir} nie istnieje.\n")
+        column_map = None
+        if args.column_map:
+            try:
+                with open(args.column_map, encoding="utf-8") as f:
+                    column_map = json.load(f)
+            except (OSError, ValueError) as e:
+                parser.exit(1, f"Nie można wczytać mapy kolumn {args.column_map}: {e}\n")
+        records = migrate_folder(root_dir, workers=args.workers, column_map=column_map)
+        failed = sum(record["status"] != "ok" for record in records)
+        print(f"Przeniesiono plików: {len(records) - failed}" + (f", błędy: {failed}" if failed else ""))
+        parser.exit(1 if failed else 0)
+    if args.history_backfill:
+        root_dir = args.path or os.getcwd()
+        if not os.path.isdir(root_dir):
+            parser.exit(1, f"Folder {root_dir} nie istnieje.\n")
+        added, failed = EstimateHistory(root_dir).backfill(workers=args.workers)
+        print(f"Dopisano wpisów historii: {added}" + (f", pominięto nieczytelnych plików: {failed}" if failed else ""))
+        parser.exit(0)
+    if args.validate:
+        results = validate_files(args.validate, workers=args.workers)
+        reports = []
+        failed = False
+        for path, report, error in results:
+            if error is not None:
+                print(f"{path}: {error}")
+                failed = True
+                continue
+            errors = int((report["Poziom"] == VALIDATION_ERROR).sum())
+            failed = failed or errors > 0
+            print(f"{path}: błędy {errors}, ostrzeżenia {len(report) - errors}")
+            if len(results) == 1:
+                print_validation_report(report)
+            if not report.empty:
+                report.insert(0, "Plik", path)
+                reports.append(report)
+        if args.validate_xlsx:
+            combined = pd.concat(reports, ignore_index=True) if reports else pd.DataFrame(
+                columns=["Plik"] + VALIDATION_REPORT_COLUMNS)
+            write_styled_excel(combined, args.validate_xlsx, total_row=False)
+            print(f"Raport sprawdzania zapisany do: {args.validate_xlsx}")
+        parser.exit(1 if failed else 0)
+    if args.diff:
+        try:
+            diff = diff_cost_estimates(read_cost_estimate(args.diff[0]), read_cost_estimate(args.diff[1]))
+        except Exception as e:
+            parser.exit(1, f"{e}\n")
+        print(f"\n=== Różnice: {os.path.basename(args.diff[0])} -> {os.path.basename(args.diff[1])} ===")
+        print_diff_report(diff)
+        if args.diff_xlsx:
+            write_diff_excel(diff, args.diff_xlsx)
+            print(f"Raport różnic zapisany do: {args.diff_xlsx}")
+        parser.exit(0)
+    if args.record and args.replay:
+        parser.error("--record i --replay nie mogą być użyte razem")
+    if args.replay_report and not args.replay:
+        parser.error("--replay-report wymaga --replay")
+    session = None
+    if args.replay:
+        try:
+            session = SessionReplay(args.replay, args.replay_report)
+        except Exception as e:
+            parser.exit(1, f"{e}\n")
+    elif args.record:
+        session = SessionRecorder(args.record)
+    finished = True
+    try:
+        # Menedżer zadaje pytania już przy starcie (wybór pliku), więc nagranie może skończyć się także tutaj
+        manager = CostEstimateManager(initial_path=args.path, store_path=args.store,
+                                      memory_budget_mb=args.memory_budget, session=session)
+        manager.run()
+    except ReplayFinished as e:
+        print(f"\n{e}")
+        finished = False
+    finally:
+        if session is not None:
+            session.finish()
+    if isinstance(session, SessionReplay):
+        session.print_report()
+        parser.exit(0 if finished else 1)
+    elif session is not None:
+        print(f"Sesja nagrana do: {session.path} (kroków: {len(session.steps)})")